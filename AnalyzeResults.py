@@ -0,0 +1,141 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+# (name in the summary, function of the row arrays giving each trial's group value)
+GROUPINGS = [
+    ('overall', lambda rows: numpy.full(len(rows['percentage']), 'all')),
+    ('percentage', lambda rows: rows['percentage'].astype(str)),
+    ('trial_type', lambda rows: rows['trial_type']),
+    ('salient', lambda rows: numpy.where(rows['trial_type'] == 'Experimental',
+                                         numpy.where(rows['is_salient'], 'salient', 'regular'), 'practice')),
+]
+SUMMARY_FIELDS = ['group', 'value', 'sessions', 'trials', 'correct', 'zoomed', 'accuracy', 'zoom_rate']
+
+
+def read_rows(path):
+    """Column arrays of one results file."""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = {name: [] for name in ('trial_type', 'percentage', 'is_salient', 'is_correct', 'zoom_used')}
+        for row in reader:
+            if any(not row.get(name) for name in columns):
+                continue  # A row cut short, e.g. by a crash mid-write
+            for name, values in columns.items():
+                values.append(row[name])
+    return {
+        'trial_type': numpy.array(columns['trial_type']),
+        'percentage': numpy.array(columns['percentage'], dtype=int),
+        'is_salient': numpy.array(columns['is_salient']) == 'True',
+        'is_correct': numpy.array(columns['is_correct']) == 'True',
+        'zoom_used': numpy.array(columns['zoom_used']) == 'True',
+    }
+
+
+def summarize_file(path):
+    """
+    Per-file totals: {group: {value: [trials, correct, zoomed]}}.
+    Runs in a worker process; returns (path, totals, error).
+    """
+    try:
+        rows = read_rows(path)
+    except (OSError, KeyError, ValueError) as e:
+        return path, None, str(e)
+    totals = {}
+    for group, key in GROUPINGS:
+        values, index = numpy.unique(key(rows), return_inverse=True)
+        trials = numpy.bincount(index, minlength=len(values))
+        correct = numpy.bincount(index, weights=rows['is_correct'], minlength=len(values))
+        zoomed = numpy.bincount(index, weights=rows['zoom_used'], minlength=len(values))
+        totals[group] = {str(v): [int(t), int(c), int(z)] for v, t, c, z in zip(values, trials, correct, zoomed)}
+    return path, totals, None
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def merge(per_file):
+    """Add the per-file totals into {(group, value): [sessions, trials, correct, zoomed]}."""
+    merged = {}
+    for totals in per_file:
+        for group, values in totals.items():
+            for value, counts in values.items():
+                entry = merged.setdefault((group, value), [0, 0, 0, 0])
+                entry[0] += 1
+                for i, count in enumerate(counts):
+                    entry[i + 1] += count
+    return merged
+
+
+def sort_key(item):
+    (group, value), _ = item
+    order = [name for name, _ in GROUPINGS].index(group)
+    return (order, int(value) if value.isdigit() else 0, value)
+
+
+def write_summary(path, merged):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_FIELDS)
+        for (group, value), (sessions, trials, correct, zoomed) in sorted(merged.items(), key=sort_key):
+            writer.writerow([group, value, sessions, trials, correct, zoomed,
+                             f"{correct / trials:.4f}", f"{zoomed / trials:.4f}"])
+
+
+def analyze(directory, output, cache_path, workers=None):
+    start = time.perf_counter()
+    files = sorted(glob.glob(os.path.join(directory, "pcb_survey_results_*.csv")))
+    # A backup only exists if writing the main file failed, and then holds every row of the session
+    backups = {f[:-len("_backup.csv")] + ".csv" for f in files if f.endswith("_backup.csv")}
+    files = [f for f in files if f not in backups]
+    cache = load_cache(cache_path)
+
+    fresh = {}
+    changed = []
+    for path in files:
+        stat = os.stat(path)
+        entry = cache.get(path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            fresh[path] = entry
+        else:
+            changed.append((path, stat))
+
+    if changed:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = [path for path, _ in changed]
+            results = pool.map(summarize_file, paths, chunksize=max(1, len(paths) // 64))
+            for (path, stat), (_, totals, error) in zip(changed, results):
+                if error:
+                    print(f"Skipping {path}: {error}")
+                    continue
+                fresh[path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'totals': totals}
+
+    # Files that disappeared drop out of the cache here
+    with open(cache_path, 'w') as f:
+        json.dump(fresh, f)
+    write_summary(output, merge(entry['totals'] for entry in fresh.values()))
+    print(f"{len(files)} session files, {len(changed)} (re)processed, "
+          f"summary written to {output} in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize every pcb_survey_results_*.csv in a directory.")
+    parser.add_argument('directory', nargs='?', default=".")
+    parser.add_argument('--output', default="results_summary.csv")
+    parser.add_argument('--cache', help="per-file totals from earlier runs (default: in the directory)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    analyze(args.directory, args.output,
+            args.cache or os.path.join(args.directory, ".results_summary_cache.json"), args.workers)
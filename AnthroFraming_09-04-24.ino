@@ -1,4 +1,5 @@
 #include "MeMegaPi.h"
+#include "MotionControl.h"
 
 // Pins for Bluetooth communication
 #define TX_PIN 14
@@ -14,335 +15,453 @@ MeMegaPiDCMotor motor2(PORT2B); // Arm motor
 MeMegaPiDCMotor motor3(PORT3B); // Right motor
 MeMegaPiDCMotor motor4(PORT4B);
 
-// Motor speeds
-uint8_t motorSpeed = 60;
-uint8_t motorSpeedB = 42;
-uint8_t motorSpeed1 = 61;
-uint8_t motorSpeed1B = 44;
+// Default scan durations in ms; framed commands may override them
+const unsigned long FORWARD_SCAN_TIME = 1400;
+const unsigned long BACKWARD_SCAN_TIME = 1350;
 
-// Boost parameters
-uint8_t boostSpeed = 100;	// Higher initial speed
-uint8_t boostDuration = 50; // Duration of boost in milliseconds
-
-// Correction factor for line following
-const float CORRECTION_FACTOR = 1.5; // Increases speed by 50% when correcting
-
-// Chip counter for curve turns
-int chipCount = 0;
+/**
+ * FRAMED PROTOCOL (see RobotLink.py)
+ * Host:  #seq:cmd[:arg,arg]*CRC      e.g. #7:1:1400,1350*3F2A
+ * Robot: !seq:ACK*CRC when a command is accepted, then !seq:DONE*CRC when it
+ *        has finished, or !seq:NACK:reason*CRC (crc, format, unknown, baud).
+ * CRC is CRC-16/CCITT-FALSE of the text between the first character and '*',
+ * as four hex digits. Bare '1'-'4' bytes still work for older GUIs.
+ * Other commands: P (ping), B:rate (change baud), T:1 / T:0 (telemetry),
+ * S (status) and A (abort), which are answered while the robot moves:
+ *   S: !seq:STATUS:step:command:ms in step:chipCount*CRC, e.g. !9:STATUS:settle:1:120:4*...
+ *      (command is '-' when idle), see MotionController::stepName()
+ *   A: ACK, then the running motion's NACK:aborted, then DONE. Also drops a queued command.
+ * A motion command that arrives while another runs is queued (one at most) and
+ * ACKed; a further one gets NACK:busy. A curve turn that never finds the line
+ * ends its command with NACK:timeout.
+ */
+#define PROTOCOL_VERSION 3 // 3 added S and A
+#define MAX_BAUD 115200
+char frame[48];
+int lastSeq = -1;	   // Sequence number of the last framed command, to ignore retransmissions
+bool lastDone = false; // Whether that command has finished
+const char *lastReply = "DONE"; // How it finished, repeated for a retransmission
+long baudRate = 9600;
+long previousBaud = 9600;
+unsigned long baudConfirmDeadline = 0; // Revert to previousBaud if no frame arrives by then
+
+// Telemetry, see sendTelemetry()
+#define TELEMETRY_INTERVAL 20 // ms, about 50 samples per second
+bool telemetryOn = false;
+unsigned long lastTelemetry = 0;
+int16_t leftCommand = 0; // Last speeds given to driveMotors()
+int16_t rightCommand = 0;
 
 void setup()
 {
 	pinMode(LED_PIN, OUTPUT);
 	pinMode(LEFT_SENSOR_PIN, INPUT);
 	pinMode(RIGHT_SENSOR_PIN, INPUT);
-	Serial3.begin(9600);
+	Serial3.begin(baudRate);
+	Serial3.setTimeout(100);
 	Serial3.println("Ready to receive commands.");
 }
 
+// Every wheel command goes through here so telemetry can report it
+void driveMotors(int16_t leftSpeed, int16_t rightSpeed)
+{
+	motor1.run(leftSpeed);
+	motor3.run(rightSpeed);
+	leftCommand = leftSpeed;
+	rightCommand = rightSpeed;
+}
+
 void stopMotors()
 {
 	motor1.stop();
 	motor3.stop();
+	leftCommand = 0;
+	rightCommand = 0;
 }
 
-void quickCenter()
+int8_t clampSpeed(int16_t speed)
 {
-	int leftSensor = digitalRead(LEFT_SENSOR_PIN);
-	int rightSensor = digitalRead(RIGHT_SENSOR_PIN);
+	return speed > 127 ? 127 : (speed < -127 ? -127 : speed);
+}
+
+/**
+ * TELEMETRY
+ * While enabled (framed command T:1), every sensor-reading loop sends a 7-byte
+ * binary sample at most every TELEMETRY_INTERVAL ms:
+ * 0xA5, millis() low byte, millis() high byte, sensor bits (left = 1, right = 2),
+ * left motor command, right motor command (signed, clamped to +-127), and the
+ * low byte of the sum of bytes 1 to 5. 0xA5 never occurs in text lines.
+ */
+void sendTelemetry()
+{
+	if (!telemetryOn || millis() - lastTelemetry < TELEMETRY_INTERVAL)
+	{
+		return;
+	}
+	lastTelemetry = millis();
+	uint8_t sample[7];
+	sample[0] = 0xA5;
+	sample[1] = lastTelemetry & 0xFF;
+	sample[2] = (lastTelemetry >> 8) & 0xFF;
+	sample[3] = digitalRead(LEFT_SENSOR_PIN) | (digitalRead(RIGHT_SENSOR_PIN) << 1);
+	sample[4] = (uint8_t)clampSpeed(leftCommand);
+	sample[5] = (uint8_t)clampSpeed(rightCommand);
+	sample[6] = sample[1] + sample[2] + sample[3] + sample[4] + sample[5];
+	Serial3.write(sample, sizeof(sample));
+}
 
-	if (leftSensor == 1 || rightSensor == 1)
+// The MegaPi side of the motion state machine (see MotionControl.h)
+class MegaPiHardware : public MotionHardware
+{
+public:
+	unsigned long now() { return millis(); }
+	uint8_t readSensors()
+	{
+		return (digitalRead(LEFT_SENSOR_PIN) ? LEFT_SENSOR : 0) | (digitalRead(RIGHT_SENSOR_PIN) ? RIGHT_SENSOR : 0);
+	}
+	void drive(int16_t leftSpeed, int16_t rightSpeed) { driveMotors(leftSpeed, rightSpeed); }
+	void stop() { stopMotors(); }
+	void runArm(int16_t speed)
 	{
-		if (leftSensor == 1)
+		if (speed == 0)
 		{
-			motor1.run(motorSpeed1);
-			motor3.run(motorSpeed);
-			delay(50);
+			motor2.stop();
 		}
-		if (rightSensor == 1)
+		else
 		{
-			motor1.run(-motorSpeed1);
-			motor3.run(-motorSpeed);
-			delay(50);
+			motor2.run(speed);
 		}
-		stopMotors();
 	}
-}
+	void report(const char *line) { Serial3.println(line); }
+};
 
-void delayWithChecks(int ms)
+MegaPiHardware hardware;
+MotionController motion(hardware);
+
+uint16_t crc16(const char *data, int length)
 {
-	long startTime = millis();
-	while (millis() - startTime < ms)
+	uint16_t crc = 0xFFFF;
+	for (int i = 0; i < length; i++)
 	{
-		quickCenter();
-		delay(50);
+		crc ^= (uint16_t)(uint8_t)data[i] << 8;
+		for (int bit = 0; bit < 8; bit++)
+		{
+			crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+		}
 	}
+	return crc;
 }
 
-void startMotorsWithBoost(int16_t leftSpeed, int16_t rightSpeed)
+void sendFrame(int seq, const char *body)
 {
-	motor1.run(leftSpeed > 0 ? boostSpeed : -boostSpeed);
-	motor3.run(rightSpeed > 0 ? boostSpeed : -boostSpeed);
-	delay(boostDuration);
-	motor1.run(leftSpeed);
-	motor3.run(rightSpeed);
+	char text[48];
+	char crc[5];
+	int length = snprintf(text, sizeof(text), "%d:%s", seq, body);
+	snprintf(crc, sizeof(crc), "%04X", crc16(text, length));
+	Serial3.print('!');
+	Serial3.print(text);
+	Serial3.print('*');
+	Serial3.println(crc);
 }
 
-void lowerArm()
+// The running motion command and at most one queued behind it
+MotionCommand active = {-1, 0, 0, 0};
+MotionCommand queued = {-1, 0, 0, 0}; // command 0: nothing queued
+
+void startCommand(MotionCommand next)
 {
-	stopMotors();
-	motor2.run(-motorSpeed);
-	delay(1000);
-	motor2.stop();
-	delayWithChecks(500);
+	active = next;
+	digitalWrite(LED_PIN, HIGH);
+	motion.start(next.command, next.forwardTime, next.backwardTime);
 }
 
-void raiseArm()
+// Bare bytes are answered with the line RobotLink.py matches; abort and timeout have printed theirs
+void replyBare(char command, MotionResult result)
 {
-	stopMotors();
-	motor2.run(motorSpeed);
-	delay(1300);
-	motor2.stop();
-	delayWithChecks(500);
+	if (result != RESULT_DONE)
+	{
+		return;
+	}
+	switch (command)
+	{
+	case '1':
+		Serial3.println("Normal Motor sequence complete.");
+		break;
+	case '2':
+		Serial3.println("Zoomed Motor sequence complete.");
+		break;
+	case '3':
+		Serial3.println("Next chip command complete.");
+		break;
+	case '4':
+		Serial3.println("Advance and scan complete.");
+		break;
+	}
 }
 
-void scanChip()
+void replyFramed(int seq, MotionResult result)
 {
-	// Forward scan
-	unsigned long startTime = millis();
-	const unsigned long FORWARD_SCAN_TIME = 1400;
-	bool firstMove = true;
-
-	while (millis() - startTime < FORWARD_SCAN_TIME)
+	const char *reply = result == RESULT_DONE ? "DONE" : (result == RESULT_TIMEOUT ? "NACK:timeout" : "NACK:aborted");
+	sendFrame(seq, reply);
+	if (seq == lastSeq)
 	{
-		int leftSensor = digitalRead(LEFT_SENSOR_PIN);
-		int rightSensor = digitalRead(RIGHT_SENSOR_PIN);
-
-		if (leftSensor == 0 && rightSensor == 0)
-		{
-			if (firstMove)
-			{
-				startMotorsWithBoost(motorSpeed1B, -motorSpeedB);
-				firstMove = false;
-			}
-			else
-			{
-				motor1.run(motorSpeed1B);
-				motor3.run(-motorSpeedB);
-			}
-		}
-		else if (leftSensor == 1 && rightSensor == 0)
-		{
-			motor1.run(motorSpeed1B * CORRECTION_FACTOR);
-			motor3.run(-motorSpeedB);
-		}
-		else if (leftSensor == 0 && rightSensor == 1)
-		{
-			motor1.run(motorSpeed1B);
-			motor3.run(-motorSpeedB * CORRECTION_FACTOR);
-		}
-		else
-		{
-			motor1.run(motorSpeed1B);
-			motor3.run(-motorSpeedB);
-		}
-		delay(10);
+		lastDone = true;
+		lastReply = reply;
 	}
+}
 
-	stopMotors();
-	delayWithChecks(500);
+void reply(MotionCommand finished, MotionResult result)
+{
+	if (finished.seq < 0)
+	{
+		replyBare(finished.command, result);
+	}
+	else
+	{
+		replyFramed(finished.seq, result);
+	}
+}
 
-	// Backward scan
-	startTime = millis();
-	const unsigned long BACKWARD_SCAN_TIME = 1350;
-	firstMove = true;
+// Reply to a command that has ended and start the queued one
+void finishCommand()
+{
+	MotionResult result = motion.takeResult();
+	if (result == RESULT_NONE)
+	{
+		return;
+	}
+	digitalWrite(LED_PIN, LOW);
+	reply(active, result);
+	active.command = 0;
+	if (queued.command != 0)
+	{
+		MotionCommand next = queued;
+		queued.command = 0;
+		startCommand(next);
+	}
+}
 
-	while (millis() - startTime < BACKWARD_SCAN_TIME)
+// Start a motion command, or queue it behind the running one; false if the queue is full
+bool acceptCommand(MotionCommand next)
+{
+	if (!motion.busy())
+	{
+		startCommand(next);
+		return true;
+	}
+	if (queued.command != 0)
 	{
-		int leftSensor = digitalRead(LEFT_SENSOR_PIN);
-		int rightSensor = digitalRead(RIGHT_SENSOR_PIN);
+		return false;
+	}
+	queued = next;
+	return true;
+}
 
-		if (leftSensor == 0 && rightSensor == 0)
-		{
-			if (firstMove)
-			{
-				startMotorsWithBoost(-motorSpeed1B, motorSpeedB);
-				firstMove = false;
-			}
-			else
-			{
-				motor1.run(-motorSpeed1B);
-				motor3.run(motorSpeedB);
-			}
-		}
-		else if (leftSensor == 1 && rightSensor == 0)
-		{
-			motor1.run(-motorSpeed1B * CORRECTION_FACTOR);
-			motor3.run(motorSpeedB);
-		}
-		else if (leftSensor == 0 && rightSensor == 1)
-		{
-			motor1.run(-motorSpeed1B);
-			motor3.run(motorSpeedB * CORRECTION_FACTOR);
-		}
-		else
-		{
-			motor1.run(-motorSpeed1B);
-			motor3.run(motorSpeedB);
-		}
-		delay(10);
+void abortMotion()
+{
+	if (queued.command != 0)
+	{
+		reply(queued, RESULT_ABORTED);
+		queued.command = 0;
 	}
+	motion.abort();
+	finishCommand();
+}
 
-	stopMotors();
-	delayWithChecks(500);
+void sendStatus(int seq)
+{
+	char body[40];
+	char command = motion.activeCommand();
+	snprintf(body, sizeof(body), "STATUS:%s:%c:%lu:%d", motion.stepName(), command ? command : '-',
+			 motion.stepElapsed(), motion.chipCount);
+	sendFrame(seq, body);
 }
 
-/**
- * CURVE FUNCTION
- * This controls the behavior of the turning / taxi to a new row
- * A curve begins when the chipCount reaches one of the assigned values { See section: CHIPS PER ROW }
- * Section B. Describes when the curve knows to stop when encountering a horizontal line
- */
-void curveTurn()
+void changeBaud(int seq, long rate)
 {
-	const int TURN_SPEED = 100; // High speed for both motors
-	Serial3.println("Starting curve turn sequence");
+	if (rate != 9600 && rate != 19200 && rate != 38400 && rate != 57600 && rate != 115200)
+	{
+		sendFrame(seq, "NACK:baud");
+		return;
+	}
+	sendFrame(seq, "ACK");
+	sendFrame(seq, "DONE");
+	lastDone = true;
+	Serial3.flush(); // Let the replies go out at the old speed
+	previousBaud = baudRate;
+	baudRate = rate;
+	Serial3.begin(baudRate);
+	baudConfirmDeadline = millis() + 2000;
+}
 
-	while (true)
+// Handles the frame after its leading '#'
+void handleFrame()
+{
+	int length = Serial3.readBytesUntil('\n', frame, sizeof(frame) - 1);
+	frame[length] = '\0';
+	char *star = strrchr(frame, '*');
+	if (star == NULL)
+	{
+		return; // Not a frame
+	}
+	*star = '\0';
+	int seq = atoi(frame);
+	if (crc16(frame, star - frame) != (uint16_t)strtoul(star + 1, NULL, 16))
 	{
-		int leftSensor = digitalRead(LEFT_SENSOR_PIN);
-		int rightSensor = digitalRead(RIGHT_SENSOR_PIN);
+		sendFrame(seq, "NACK:crc");
+		return;
+	}
+	baudConfirmDeadline = 0; // A good frame confirms the current speed
 
-		// B. STOPS WHEN BOTH SENSORS HIT A LINE AT THE SAME TIME
-		if (leftSensor == 1 && rightSensor == 1)
-		{
-			Serial3.println("End of curve detected");
-			motor1.stop();
-			motor3.stop();
-			break;
-		}
+	char *field = strchr(frame, ':');
+	if (field == NULL || field[1] == '\0')
+	{
+		sendFrame(seq, "NACK:format");
+		return;
+	}
+	char command = field[1];
+	long args[2] = {0, 0};
+	int argCount = 0;
+	char *arg = strchr(field + 1, ':');
+	while (arg != NULL && argCount < 2)
+	{
+		args[argCount++] = atol(arg + 1);
+		arg = strchr(arg + 1, ',');
+	}
 
-		// Curve following behavior
-		if (leftSensor == 1 && rightSensor == 0)
-		{
-			// Left sensor on line - sharp right turn
-			motor1.run(TURN_SPEED); // Left wheel forward
-			motor3.run(TURN_SPEED); // Right wheel reverse
-		}
-		else if (leftSensor == 0 && rightSensor == 1)
-		{
-			// Right sensor on line - sharp left turn
-			motor1.run(-TURN_SPEED); // Left wheel reverse
-			motor3.run(-TURN_SPEED); // Right wheel forward
-		}
-		else if (leftSensor == 0 && rightSensor == 0)
+	if (seq == lastSeq)
+	{
+		// The host did not see our reply and sent the command again
+		sendFrame(seq, "ACK");
+		if (lastDone)
 		{
-			// Both off line - go straight
-			motor1.run(TURN_SPEED);
-			motor3.run(-TURN_SPEED);
+			sendFrame(seq, lastReply);
 		}
+		return;
+	}
 
-		delay(10);
+	if (command == 'S') // Status; leaves lastSeq alone so the running command's retransmissions still match
+	{
+		sendStatus(seq);
+		return;
 	}
+	if (command == 'A') // Abort
+	{
+		sendFrame(seq, "ACK");
+		abortMotion();
+		sendFrame(seq, "DONE");
+		return;
+	}
+	if (command == 'P') // Ping
+	{
+		lastSeq = seq;
+		sendFrame(seq, "ACK");
+		sendFrame(seq, "DONE");
+		lastDone = true;
+		lastReply = "DONE";
+		return;
+	}
+	if (command == 'T') // Telemetry on (1) or off (0)
+	{
+		lastSeq = seq;
+		telemetryOn = args[0] != 0;
+		sendFrame(seq, "ACK");
+		sendFrame(seq, "DONE");
+		lastDone = true;
+		lastReply = "DONE";
+		return;
+	}
+	if (command == 'B')
+	{
+		lastSeq = seq;
+		lastDone = false;
+		lastReply = "DONE";
+		changeBaud(seq, args[0]);
+		return;
+	}
+	if (command < '1' || command > '4')
+	{
+		sendFrame(seq, "NACK:unknown");
+		return;
+	}
+
+	MotionCommand next = {seq, command, (unsigned long)(args[0] > 0 ? args[0] : FORWARD_SCAN_TIME),
+						  (unsigned long)(args[1] > 0 ? args[1] : BACKWARD_SCAN_TIME)};
+	if (motion.busy() && queued.command != 0)
+	{
+		sendFrame(seq, "NACK:busy");
+		return;
+	}
+	lastSeq = seq;
+	lastDone = false;
+	sendFrame(seq, "ACK");
+	acceptCommand(next); // DONE follows from finishCommand() once the motion ends
 }
 
-void nextChip()
+// Answers "HELLO" after its leading 'H'; anything else is an unknown command
+void handleHello()
 {
-	chipCount++;
-	Serial3.print("Chip count: ");
-	Serial3.println(chipCount);
-
-	/**
-	 * CHIPS PER ROW
-	 * 10 is the number of chips before the first curve
-	 * then 20 is the next row, assuming 10 chips before each turn.
-	 *
-	 * Change these values to match the number of chips from the start
-	 * for each turn.
-	 *
-	 * To add turns add " || chipCount == X " for as many turns as you need.
-	 */
-	if (chipCount == 10 || chipCount == 20)
+	int length = Serial3.readBytesUntil('\n', frame, sizeof(frame) - 1);
+	frame[length] = '\0';
+	if (strncmp(frame, "ELLO", 4) != 0)
 	{
-		Serial3.println("Executing curve turn");
-		curveTurn();
+		Serial3.println("Unknown command");
 		return;
 	}
+	lastSeq = -1; // A new host starts its sequence numbers again
+	telemetryOn = false;
+	char body[32];
+	snprintf(body, sizeof(body), "HELLO:%d:%ld", PROTOCOL_VERSION, (long)MAX_BAUD);
+	sendFrame(0, body);
+}
 
-	unsigned long startTime = millis();
-	const unsigned long NEXT_CHIP_TIME = 800;
-	bool firstMove = true;
-	bool bothSensorsTriggered = false;
+void loop()
+{
+	if (baudConfirmDeadline != 0 && (long)(millis() - baudConfirmDeadline) > 0)
+	{
+		// Nothing arrived at the new speed: go back so the host can reach us
+		baudRate = previousBaud;
+		Serial3.begin(baudRate);
+		baudConfirmDeadline = 0;
+	}
 
-	while (millis() - startTime < NEXT_CHIP_TIME)
+	motion.update();
+	finishCommand();
+	if (motion.busy())
 	{
-		int leftSensor = digitalRead(LEFT_SENSOR_PIN);
-		int rightSensor = digitalRead(RIGHT_SENSOR_PIN);
+		sendTelemetry();
+	}
 
-		if (leftSensor == 0 && rightSensor == 0)
+	if (Serial3.available() > 0)
+	{
+		char command = Serial3.peek();
+		if (command >= '1' && command <= '4' && motion.busy() && queued.command != 0)
 		{
-			if (firstMove)
-			{
-				startMotorsWithBoost(motorSpeed1, -motorSpeed);
-				firstMove = false;
-			}
-			else
-			{
-				motor1.run(motorSpeed1);
-				motor3.run(-motorSpeed);
-			}
+			return; // Leave it in the buffer until the queue has room, as older firmware did
 		}
-		else if (leftSensor == 1 && rightSensor == 0)
+		Serial3.read();
+
+		if (command == '#')
 		{
-			motor1.run(motorSpeed1 * CORRECTION_FACTOR);
-			motor3.run(-motorSpeed);
+			handleFrame();
+			return;
 		}
-		else if (leftSensor == 0 && rightSensor == 1)
+		if (command == 'H')
 		{
-			motor1.run(motorSpeed1);
-			motor3.run(-motorSpeed * CORRECTION_FACTOR);
+			handleHello();
+			return;
+		}
+		if (command == '\r' || command == '\n')
+		{
+			return;
 		}
 
-		delay(10);
-	}
-
-	stopMotors();
-	delayWithChecks(500);
-}
-
-void loop()
-{
-	if (Serial3.available() > 0)
-	{
-		char command = Serial3.read();
-
-		switch (command)
+		MotionCommand next = {-1, command, FORWARD_SCAN_TIME, BACKWARD_SCAN_TIME};
+		if (command < '1' || command > '4')
 		{
-		case '1':
-			digitalWrite(LED_PIN, HIGH);
-			scanChip();
-			digitalWrite(LED_PIN, LOW);
-			Serial3.println("Normal Motor sequence complete.");
-			break;
-
-		case '2':
-			digitalWrite(LED_PIN, HIGH);
-			lowerArm();
-			scanChip();
-			raiseArm();
-			digitalWrite(LED_PIN, LOW);
-			Serial3.println("Zoomed Motor sequence complete.");
-			break;
-
-		case '3':
-			digitalWrite(LED_PIN, HIGH);
-			nextChip();
-			digitalWrite(LED_PIN, LOW);
-			Serial3.println("Next chip command complete.");
-			break;
-
-		default:
 			Serial3.println("Unknown command");
-			break;
+			return;
 		}
+		acceptCommand(next);
 	}
 }
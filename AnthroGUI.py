@@ -1,40 +1,123 @@
 import time
-import numpy
+import os
+import json
+import queue
+import importlib
 import tkinter as tk
-from tkinter import ttk
-from PIL import Image, ImageTk
-import serial
-import csv
+from tkinter import ttk, messagebox
 from datetime import datetime
 import atexit
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from ResultsJournal import ResultsJournal
+from SessionStore import SessionStore
+from SessionRecorder import SessionRecorder
+from ImageCache import ImageCache
+from Questionnaire import QuestionnaireView, load_questionnaires
+from Tracing import tracer
+
+# Not needed for the consent screen. They are imported on a worker thread while
+# it is read (see load_deferred) and from inside the methods that use them.
+DEFERRED_MODULES = ['numpy', 'PIL.Image', 'PIL.ImageTk', 'serial', 'Stimuli', 'Telemetry', 'RobotLink']
+
+
+def load_deferred(framing):
+    """Import the heavy modules and read the texts of the later screens (runs on a worker)."""
+    for name in DEFERRED_MODULES:
+        importlib.import_module(name)
+    texts = {}
+    with open("INSTRUCTIONS.txt") as f: texts['instructions'] = f.read()
+    with open("STORY.txt", "r", encoding="utf-8") as f: texts['story'] = f.read()
+    if framing == "Anthro":
+        with open("FRAMING_anthro.txt", "r", encoding="utf-8") as f: texts['framing'] = f.read()
+    else: # debug defaults to technical
+        with open("FRAMING_tech.txt", "r", encoding="utf-8") as f: texts['framing'] = f.read()
+    return texts, load_questionnaires("QUESTIONNAIRES.json")
+
 
 class SurveyApp(tk.Tk):
-    def __init__(self):
+    def __init__(self, port=None, emulate_robot=False, time_scale=1.0, session_id=None, executor=None,
+                 fast_baud=None, telemetry=False, store=None, bank=None, seed=None, recorder=None,
+                 board_size=None, defects='uniform'):
         super().__init__()
         self.title("PCB Robot Interface")
         self.geometry("800x900")
         self.framing = "Anthro"
         self.data = { 'framing': self.framing }
+        self.recorder = recorder  # Records robot traffic and participant actions (see SessionRecorder.py)
+        if bank and seed is not None:
+            raise ValueError("A stimulus bank has its own seed")
+        if seed is None and not bank:
+            seed = int.from_bytes(os.urandom(8), 'little')  # Stored, so the session's boards can be rebuilt
         
         self.bluetooth_port = 'COM3'  # Replace with your Bluetooth port
         self.baud_rate = 9600
-        self.ser = None  # Serial object will be stored here
-        #self.connect_bluetooth()
+        self.fast_baud = fast_baud  # Speed to negotiate with framed firmware, e.g. 115200
+        self.scan_times = (1400, 1350)  # Forward and backward scan in ms, sent to framed firmware
+        # Sensor and motor samples from the robot, saved per trial (framed firmware only)
+        self.record_telemetry = telemetry
+        self.telemetry = None
+        self.telemetry_mark = 0  # telemetry.count when the current trial's robot moves began
+        if port:
+            self.bluetooth_port = port
+        self.emulate_robot = emulate_robot
+        self.time_scale = time_scale
+        self.emulator = None
+        self.executor = executor  # Worker pool shared with other stations (see StationController.py)
+        self.link = None  # Serial connection, managed on a background thread
+        self.pending_command = None  # Command whose completion line we are waiting for
+        self.command_count = 0  # Numbers the robot round-trips in traces
+        self.fused_advance = True  # Cleared if the firmware predates the '4' command
+        self.waiting_after = None
+        self.waiting_paused = False
+        self.link_status = tk.Label(self, font=("Arial", 10))
+        self.link_status.place(relx=1.0, rely=1.0, anchor='se')
+        if board_size and bank:
+            raise ValueError("A stimulus bank has its own board size")
+        # (width, height) of large boards, which are stored as tiled pyramids (see ImagePyramid.py)
+        self.board_size = tuple(board_size) if board_size else None
+        self.defects = defects  # Shape of the focus area damage (see Stimuli.defect_costs)
+        self.transition_times = []  # (screen, milliseconds until drawn), see begin_transition
+        self.current_screen = None
+        self.screen_changes = 0
+        self.build_screens()
 
         # Create unique session ID
-        self.session_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Trial parameters
-        self.practice_trials = [
-            (25, False),   
-            (35, False),   
-            (45, False),   
-            (50, False),   
-            (55, False)    
-        ]
-        
-        # Generate experimental trials
-        self.main_trials = self.generate_experimental_trials()
+        self.session_id = session_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        # Sessions, trials and questionnaire answers also go to a SQLite database,
+        # which may be shared by several stations
+        self.own_store = store is None
+        self.store = store or SessionStore()
+        # A bank's seed is stored by load_bank(). Seeds may be over 2**63, so they are stored as text.
+        self.store.start_session(self.session_id, framing=self.framing,
+                                 seed=None if seed is None else str(seed), stimulus_bank=bank)
+        self.record_event('session', session_id=self.session_id, seed=seed, bank=bank, framing=self.framing,
+                          defects=defects)
+
+        # Image parameters
+        self.image_width = 200
+        self.image_height = 400
+        self.focus_size = 20
+        self.bg_damage_rate = 0.001
+        self.seed = seed  # A seed makes the trial plan and boards repeatable
+        self.rng = None
+        self.display_size = (200, 400)
+        self.zoom_display_size = (300, 300)
+        if self.board_size:
+            self.image_width, self.image_height = self.board_size
+            self.focus_size = max(20, min(self.board_size) // 10)
+            fit = min(400 / self.image_width, 400 / self.image_height)
+            self.display_size = (round(self.image_width * fit), round(self.image_height * fit))
+            self.pyramid_dir = f"pyramids_{self.session_id}"
+
+        # Trial parameters, planned in finish_startup()
+        self.bank_path = bank
+        self.bank = None
+        self.practice_trials = []
+        self.main_trials = []
+        self.data['seed'] = seed
+        self.data['stimulus_bank'] = bank
         
         # Trial tracking
         self.is_practice = True
@@ -42,96 +125,218 @@ class SurveyApp(tk.Tk):
         self.current_index = 0
         self.zoom_used = False
         self.results = []
+
+        # Stimuli for upcoming trials are prepared while the robot moves.
+        # Each job gets its own generator (see Stimuli.trial_rng), so the pool may be shared.
+        self.prefetch_pool = executor or ThreadPoolExecutor(max_workers=1)
+        self.prepared = {}  # (is_practice, trial index) -> Future of prepare_trial()
+        self.image_cache = ImageCache(max_bytes=64 * 1024 * 1024)
         
-        # Image parameters
-        self.image_width = 200
-        self.image_height = 400
-        self.focus_size = 20
-        self.bg_damage_rate = 0.001
-        
-        # Set up auto-save
+        # Set up auto-save: one row is appended per trial by a background writer
+        self.journal = ResultsJournal(f"pcb_survey_results_{self.session_id}.csv",
+                                      f"pcb_survey_results_{self.session_id}_backup.csv",
+                                      executor=executor)
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        atexit.register(self.save_results)
+        atexit.register(self.journal.close)
         
-        # Load prompts
+        # Load prompts. Only the consent form is needed for the first screen; the
+        # rest of the startup runs once it is drawn (see finish_startup)
         with open("CONSENT.txt", "r", encoding="utf-8") as f: self.consent = f.read()
-        with open("INSTRUCTIONS.txt") as f: self.instructions = f.read()
-        with open("STORY.txt", "r", encoding="utf-8") as f: self.story = f.read()
-        if self.framing == "Anthro":
-            with open("FRAMING_anthro.txt", "r", encoding="utf-8") as f: self.framing_text = f.read()
-        else: # debug defaults to technical
-            with open("FRAMING_tech.txt", "r", encoding="utf-8") as f: self.framing_text = f.read()
+        self.questionnaires = {}
+        self.started = False
+        self.deferred = self.prefetch_pool.submit(load_deferred, self.framing)
         
         self.show_consent()
+        self.after(20, self.poll_startup)
         # self.show_PROPENSITY_questions()
         # self.show_consent()
         # self.show_test()
         # self.show_feedback()
 
-    
+
+    def poll_startup(self):
+        if self.started:
+            return
+        if not self.deferred.done():
+            self.after(20, self.poll_startup)
+            return
+        self.finish_startup()
+
+    def finish_startup(self):
+        """
+        Plan the trials and connect to the robot once load_deferred() is done.
+        Called after the consent screen is drawn, or earlier if the participant
+        continues before that; does nothing the second time.
+        """
+        if self.started:
+            return
+        with tracer.span("finish_startup"):
+            texts, self.questionnaires = self.deferred.result()
+            self.started = True
+            self.instructions = texts['instructions']
+            self.story = texts['story']
+            self.framing_text = texts['framing']
+
+            from numpy.random import default_rng
+            import Stimuli
+            self.rng = default_rng(self.seed)
+            if self.bank_path:
+                # Pre-rendered trials from BuildStimulusBank.py
+                self.load_bank(self.bank_path)
+            else:
+                self.practice_trials = list(Stimuli.PRACTICE_TRIALS)
+                self.main_trials = self.generate_experimental_trials()
+            self.current_trials = self.practice_trials
+
+            if self.record_telemetry:
+                from Telemetry import TelemetryBuffer
+                self.telemetry = TelemetryBuffer()
+            if self.emulate_robot:
+                # Run against a local stand-in for the robot instead of the real hardware
+                from RobotEmulator import RobotEmulator
+                self.emulator = RobotEmulator(self.time_scale)
+                self.emulator.start()
+                self.bluetooth_port = self.emulator.port
+                print(f"Using robot emulator on {self.bluetooth_port} at {self.time_scale}x speed")
+            self.store.update_session(self.session_id, port=self.bluetooth_port)
+            self.connect_bluetooth()
+
     def connect_bluetooth(self):
-        """Keep retrying to connect to Bluetooth until successful."""
-        while self.ser is None:
+        """Connect to the robot in the background so the GUI never blocks on it."""
+        from RobotLink import RobotLink
+        self.record_event('connect', port=self.bluetooth_port)
+        self.link = RobotLink(self.bluetooth_port, self.baud_rate, executor=self.executor,
+                              fast_baud=self.fast_baud, telemetry=self.telemetry, recorder=self.recorder)
+        self.link.start()
+        self.show_link_state(self.link.state)
+        self.poll_robot()
+
+    def send_command(self, command, timeout, next_step, args=()):
+        """
+        Send a command and move on as soon as the robot reports it is done.
+        `timeout` (seconds) is the old fixed wait, now only used as a fallback
+        in case the completion never arrives. `args` reach framed firmware only.
+        """
+        self.show_waiting_screen(timeout, next_step)
+        self.record_event('send', command=command.decode(), args=list(args))
+        self.pending_command = command
+        self.command_count += 1
+        self.command_span = (f"robot {command.decode()}", self.command_count)
+        tracer.begin(*self.command_span)
+        if self.link:
+            if self.link.send(command, args):
+                print(f"Sent {command.decode()!r} command")
+            else:
+                print(f"Robot not connected, {command.decode()!r} will be sent on reconnect")
+            if self.link.state != 'connected':
+                self.pause_waiting()
+
+    def poll_robot(self):
+        """Handle events from the robot link on the Tk thread."""
+        while True:
             try:
-                self.ser = serial.Serial(self.bluetooth_port, self.baud_rate, timeout=1)
-                print(f"Connected to {self.bluetooth_port}")
-            except serial.SerialException:
-                print(f"Failed to connect to {self.bluetooth_port}. Retrying...")
-                time.sleep(2)  # Wait and retry
+                kind, value = self.link.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'state':
+                self.show_link_state(value)
+            elif kind == 'line':
+                print(f"Robot: {value}")
+                tracer.instant("robot line", line=value)
+                if self.pending_command == b'4' and value == "Unknown command":
+                    self.fall_back_to_separate_advance()
+            elif kind == 'nack':
+                command, reason = value
+                if reason in ('aborted', 'timeout'):
+                    print(f"Robot stopped {command.decode()!r} part way: {reason}")
+                    tracer.instant("robot stopped", command=command.decode(), reason=reason)
+                else:
+                    print(f"Robot refused {command.decode()!r}: {reason}")
+                if command == self.pending_command == b'4' and reason == 'unknown':
+                    self.fall_back_to_separate_advance()
+            elif kind == 'status':
+                print(f"Robot status: {value}")
+            elif kind == 'done' and value == self.pending_command:
+                if self.waiting_after is not None:
+                    self.after_cancel(self.waiting_after)
+                self.waiting_step(acknowledged=True)
+        self.after(50, self.poll_robot)
+
+    def record_event(self, kind, **fields):
+        """Add an event to the session recording, if there is one."""
+        if self.recorder is not None:
+            self.recorder.record(kind, **fields)
+
+    def record_ui(self, action, **fields):
+        """Record a participant action on the current screen and trial, for SessionReplay.py."""
+        self.record_event('ui', action=action, screen=self.current_screen,
+                          trial=[self.is_practice, self.current_index], **fields)
+
+    def recorded(self, command):
+        """Wrap a button command so each click is recorded."""
+        def invoke():
+            self.record_ui(command.__name__)
+            command()
+        return invoke
+
+    def show_link_state(self, state):
+        colors = {'connected': 'green', 'connecting': 'orange', 'disconnected': 'red'}
+        self.link_status.config(text=f"Robot: {state}", fg=colors[state])
+        self.link_status.lift()
+        if self.pending_command is None:
+            return
+        if state == 'connected' and self.waiting_paused:
+            # Restart the fallback timer now that the robot can hear us again
+            self.waiting_paused = False
+            self.waiting_label.config(text="Processing...")
+            self.waiting_after = self.after(self.waiting_delay * 1000, self.waiting_step)
+        elif state != 'connected':
+            self.pause_waiting()
+
+    def pause_waiting(self):
+        """Hold the waiting screen while the link is down instead of timing out."""
+        if self.waiting_after is not None:
+            self.after_cancel(self.waiting_after)
+            self.waiting_after = None
+        self.waiting_paused = True
+        self.waiting_label.config(text="Reconnecting to robot...")
 
     def normal_scan(self):
         """Send '1' to the robot to start a normal scan."""
-        if self.ser:
-            try:
-                self.ser.write(b'1')  # Send '1' to initiate normal scan
-                print("Sent '1' command for normal scan")
-            except serial.SerialException:
-                print("Error: Failed to send command")
-        self.show_waiting_screen(6, self.show_trial)  # After waiting, show the trial
+        self.prefetch(self.current_index)
+        self.send_command(b'1', 6, self.show_trial, self.scan_times)  # After the scan, show the trial
 
     def zoom_scan(self):
         """Send '2' to the robot to start a zoom scan."""
-        if self.ser:
-            try:
-                self.ser.write(b'2')  # Send '2' to initiate zoom scan
-                print("Sent '2' command for zoom scan")
-            except serial.SerialException:
-                print("Error: Failed to send command")
-        self.show_waiting_screen(10, self.show_zoom_image)  # After waiting, show zoomed image
+        self.send_command(b'2', 10, self.show_zoom_image, self.scan_times)  # After the scan, show zoomed image
 
     def next_chip(self):
         """Send '3' to the robot to move to the next chip."""
-        if self.ser:
-            try:
-                self.ser.write(b'3')  # Send '3' to move to next chip
-                print("Sent '3' command for next chip")
-            except serial.SerialException:
-                print("Error: Failed to send command")
-        self.show_waiting_screen(3, self.normal_scan)  # After waiting, start normal scan for next trial
+        self.prefetch(self.current_index)
+        self.send_command(b'3', 3, self.normal_scan)  # After moving, start normal scan for next trial
+
+    def advance_and_scan(self):
+        """Send '4' to move to the next chip and scan it in one round-trip."""
+        if not self.fused_advance:
+            self.next_chip()
+            return
+        self.prefetch(self.current_index)
+        self.send_command(b'4', 9, self.show_trial, self.scan_times)  # After the scan, show the trial
+
+    def fall_back_to_separate_advance(self):
+        """The robot rejected '4' (older firmware): redo the advance as '3' then '1'."""
+        print("Robot does not support the '4' command; using '3' then '1'")
+        self.fused_advance = False
+        if self.waiting_after is not None:
+            self.after_cancel(self.waiting_after)
+            self.waiting_after = None
+        tracer.end(*self.command_span, acknowledged=False)
+        self.pending_command = None
+        self.next_chip()
 
     def generate_experimental_trials(self):
-        # Fixed erroneous trials with their target positions
-        error_trials = [
-            (25, True, numpy.random.randint(6, 9)),      # Around 1/4 mark
-            (35, True, numpy.random.randint(14, 17)),    # Around 2/4 mark
-            (45, True, numpy.random.randint(22, 25)),    # Around 3/4 mark
-            (55, True, numpy.random.randint(30, 33))     # Around 4/4 mark
-        ]
-        
-        # Generate all possible regular trial values
-        possible_values = list(range(20, 61))
-        for error_val, _, _ in error_trials:
-            possible_values.remove(error_val)
-        
-        # Select 32 unique values for regular trials
-        regular_trials = [(val, False) for val in numpy.random.choice(possible_values, size=32, replace=False)]
-        
-        # Insert erroneous trials at their positions
-        final_trials = regular_trials.copy()
-        for val, is_error, pos in error_trials:
-            final_trials.insert(pos, (val, is_error))
-            
-        return final_trials
+        import Stimuli
+        return Stimuli.experimental_trials(self.rng)
 
     def is_salient(self, percent, is_salient_trial):
         """
@@ -144,90 +349,174 @@ class SurveyApp(tk.Tk):
         return recommend_keep
 
     def save_results(self):
-        if not self.results:
-            return
-        print(self.data)
-            
-        filename = f"pcb_survey_results_{self.session_id}.csv"
-        try:
-            with open(filename, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    'trial_number', 'trial_type', 'percentage', 
-                    'is_salient', 'response', 'is_correct', 'zoom_used',
-                    'session_id', 'timestamp'
-                ])
-                writer.writeheader()
-                for row in self.results:
-                    row['session_id'] = self.session_id
-                    row['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    writer.writerow(row)
-        except Exception as e:
-            print(f"Error saving results: {e}")
-            # Try backup save
-            backup_file = f"pcb_survey_results_{self.session_id}_backup.csv"
-            try:
-                with open(backup_file, 'w', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=[
-                        'trial_number', 'trial_type', 'percentage', 
-                        'is_salient', 'response', 'is_correct', 'zoom_used',
-                        'session_id', 'timestamp'
-                    ])
-                    writer.writeheader()
-                    for row in self.results:
-                        row['session_id'] = self.session_id
-                        row['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        writer.writerow(row)
-            except Exception as backup_error:
-                print(f"Error saving backup: {backup_error}")
+        """Block until every recorded trial has been written to disk."""
+        with tracer.span("save_results", rows=len(self.results)):
+            self.journal.flush()
+            self.store.flush()
 
     def generate_damage_pattern(self, damage_percent):
-        image = numpy.full((self.image_height, self.image_width, 3), 
-                         [0, 112, 255], dtype=numpy.uint8)
-        
-        # Background damage
-        total_pixels = self.image_width * self.image_height
-        bg_damage_count = int(total_pixels * self.bg_damage_rate)
-        if bg_damage_count > 0:
-            bg_positions = numpy.random.choice(total_pixels, bg_damage_count, replace=False)
-            bg_y = bg_positions // self.image_width
-            bg_x = bg_positions % self.image_width
-            image[bg_y, bg_x] = [255, 140, 0]
-        
-        # Focus area damage
-        max_y = self.image_height - self.focus_size
-        max_x = self.image_width - self.focus_size
-        focus_y = numpy.random.randint(0, max_y + 1)
-        focus_x = numpy.random.randint(0, max_x + 1)
-        self.focus_pos = (focus_y, focus_x)
-        
-        focus_pixels = self.focus_size * self.focus_size
-        damage_pixels = int(focus_pixels * damage_percent)
-        if damage_pixels > 0:
-            focus_positions = numpy.random.choice(focus_pixels, damage_pixels, replace=False)
-            local_y = focus_positions // self.focus_size
-            local_x = focus_positions % self.focus_size
-            for y, x in zip(local_y, local_x):
-                image[focus_y+y, focus_x+x] = [255, 140, 0]
-        
+        import Stimuli
+        with tracer.span("generate_damage_pattern", damage=damage_percent):
+            images, focus_positions = Stimuli.generate_damage_patterns(
+                [damage_percent], self.image_width, self.image_height,
+                self.focus_size, self.bg_damage_rate, self.rng, self.defects)
+        self.focus_pos = tuple(int(v) for v in focus_positions[0])
+        return images[0]
+
+    def add_border(self, image, focus_pos=None):
+        import Stimuli
+        return Stimuli.add_border(image, self.focus_pos if focus_pos is None else focus_pos, self.focus_size)
+
+    def render_view(self, pattern, focus_pos, view):
+        """Resized PIL image of a board's 'bordered' full view or its 'zoom' crop."""
+        from PIL import Image
+        if self.board_size:
+            return self.render_overview(pattern, focus_pos)
+        if view == 'bordered':
+            bordered = self.add_border(pattern, focus_pos)
+            return Image.fromarray(bordered).resize(self.display_size, Image.NEAREST)
+        y, x = focus_pos
+        zoom = pattern[y:y+self.focus_size, x:x+self.focus_size]
+        return Image.fromarray(zoom).resize(self.zoom_display_size, Image.NEAREST)
+
+    def render_overview(self, pyramid, focus_pos):
+        """The 'bordered' view of a large board, from the smallest pyramid level that covers it."""
+        from PIL import Image, ImageDraw
+        import Stimuli
+        pixels, _ = pyramid.overview(*self.display_size)
+        image = Image.fromarray(pixels).resize(self.display_size, Image.BOX)
+        scale = self.display_size[0] / pyramid.width
+        y, x = focus_pos
+        ImageDraw.Draw(image).rectangle(
+            [x * scale - 1, y * scale - 1, (x + pyramid.focus_size) * scale + 1, (y + pyramid.focus_size) * scale + 1],
+            outline=tuple(int(v) for v in Stimuli.GREEN), width=2)
         return image
 
-    def add_border(self, image):
-        y, x = self.focus_pos
-        bordered = image.copy()
-        
-        # Add green border
-        if y > 0:
-            bordered[y-1:y+1, x:x+self.focus_size] = [0, 255, 0]
-        if y + self.focus_size < self.image_height:
-            bordered[y+self.focus_size-1:y+self.focus_size+1, x:x+self.focus_size] = [0, 255, 0]
-        if x > 0:
-            bordered[y:y+self.focus_size, x-1:x+1] = [0, 255, 0]
-        if x + self.focus_size < self.image_width:
-            bordered[y:y+self.focus_size, x+self.focus_size-1:x+self.focus_size+1] = [0, 255, 0]
-        
-        return bordered
+    def load_bank(self, path):
+        """Open a stimulus bank: its index is read now, images are paged in per trial."""
+        import numpy
+        with open(path) as f:
+            index = json.load(f)
+        self.bank = numpy.load(os.path.join(os.path.dirname(path), index['images']), mmap_mode='r')
+        self.bank_focus = index['focus_positions']
+        self.practice_trials = [tuple(trial) for trial in index['practice']]
+        self.main_trials = [tuple(trial) for trial in index['main']]
+        self.image_width = index['image_width']
+        self.image_height = index['image_height']
+        self.focus_size = index['focus_size']
+        self.seed = index['seed']  # The seed that planned the bank's trials and drew its boards
+        self.data['seed'] = self.seed
+        self.store.update_session(self.session_id, seed=str(self.seed))
+        print(f"Using stimulus bank {path} (seed {self.seed})")
+
+    def bank_index(self, trial):
+        """Position of `trial` = (is_practice, index) in the session, and so in a stimulus bank."""
+        is_practice, index = trial
+        return index if is_practice else len(self.practice_trials) + index
+
+    def prepare_trial(self, percent, rng, bank_index=None):
+        """
+        Generate a trial's board (or read it from the stimulus bank) and its
+        resized display images. Runs on the prefetch worker, so it must not touch Tk.
+        """
+        import numpy
+        import Stimuli
+        if self.board_size:
+            import tempfile
+            from ImagePyramid import ImagePyramid, build_pyramid
+            os.makedirs(self.pyramid_dir, exist_ok=True)
+            with tracer.span("build_pyramid", damage=percent / 100):
+                pyramid = ImagePyramid(build_pyramid(
+                    tempfile.mkdtemp(dir=self.pyramid_dir), percent / 100, self.image_width,
+                    self.image_height, self.focus_size, self.bg_damage_rate, rng, style=self.defects))
+            with tracer.span("render_views"):
+                bordered = self.render_view(pyramid, pyramid.focus_pos, 'bordered')
+            # The zoom screen reads the pyramid's tiles itself (see PyramidViewer.py)
+            return {'pattern': pyramid, 'focus_pos': pyramid.focus_pos, 'bordered': bordered, 'zoom': None}
+        if bank_index is not None:
+            with tracer.span("read_bank", index=bank_index):
+                pattern = numpy.array(self.bank[bank_index])  # Pages in just this board
+            focus_pos = tuple(self.bank_focus[bank_index])
+        else:
+            with tracer.span("generate_damage_pattern", damage=percent / 100):
+                images, focus_positions = Stimuli.generate_damage_patterns(
+                    [percent / 100], self.image_width, self.image_height,
+                    self.focus_size, self.bg_damage_rate, rng, self.defects)
+            pattern = images[0]
+            focus_pos = tuple(int(v) for v in focus_positions[0])
+        with tracer.span("render_views"):
+            bordered = self.render_view(pattern, focus_pos, 'bordered')
+            zoom = self.render_view(pattern, focus_pos, 'zoom')
+        return {'pattern': pattern, 'focus_pos': focus_pos, 'bordered': bordered, 'zoom': zoom}
+
+    def cache_key(self, trial, view):
+        """Image cache key for `view` ('full', 'bordered' or 'zoom') of `trial` = (is_practice, index)."""
+        sizes = {'full': (self.image_width, self.image_height),
+                 'bordered': self.display_size,
+                 'zoom': self.zoom_display_size}
+        return (self.session_id, trial, view, sizes[view])
+
+    def prefetch(self, index):
+        """Start preparing trial `index` of the current block in the background."""
+        trial = (self.is_practice, index)
+        if (index >= len(self.current_trials) or trial in self.prepared
+                or self.cache_key(trial, 'full') in self.image_cache):
+            return
+        import Stimuli
+        percent, _ = self.current_trials[index]
+        position = self.bank_index(trial)
+        bank_index = position if self.bank is not None else None
+        # The same stream BuildStimulusBank.py draws this board from
+        rng = Stimuli.trial_rng(self.seed, position)
+        future = self.prefetch_pool.submit(self.prepare_trial, percent, rng, bank_index)
+        self.prepared[trial] = future
+
+        def attach_when_ready():
+            if self.prepared.get(trial) is not future:
+                return  # Already attached by load_trial
+            if not future.done():
+                self.after(20, attach_when_ready)
+                return
+            self.attach_prepared(trial, future.result())
+
+        self.after(20, attach_when_ready)
+
+    def attach_prepared(self, trial, prepared):
+        """Cache a prepared stimulus, building its PhotoImages (Tk thread only)."""
+        from PIL import ImageTk
+        self.prepared.pop(trial, None)
+        # A pyramid keeps its pixels on disk, so it takes no room in the cache
+        self.image_cache.put(self.cache_key(trial, 'full'),
+                             (prepared['pattern'], prepared['focus_pos']), getattr(prepared['pattern'], 'nbytes', 0))
+        for view in ('bordered', 'zoom'):
+            if prepared[view] is not None:
+                self.image_cache.put(self.cache_key(trial, view),
+                                     ImageTk.PhotoImage(prepared[view], master=self))
+
+    def load_trial(self, index):
+        """Return (pattern, focus_pos) for trial `index`, waiting for its prefetch if needed."""
+        trial = (self.is_practice, index)
+        cached = self.image_cache.get(self.cache_key(trial, 'full'))
+        if cached is not None:
+            return cached
+        self.prefetch(index)
+        prepared = self.prepared[trial].result()
+        self.attach_prepared(trial, prepared)
+        return prepared['pattern'], prepared['focus_pos']
+
+    def trial_photo(self, view):
+        """PhotoImage of the current trial's 'bordered' or 'zoom' view, rendered only on a cache miss."""
+        key = self.cache_key((self.is_practice, self.current_index), view)
+        photo = self.image_cache.get(key)
+        if photo is None:
+            from PIL import ImageTk
+            image = self.render_view(self.current_damage_pattern, self.focus_pos, view)
+            photo = ImageTk.PhotoImage(image, master=self)
+            self.image_cache.put(key, photo)
+        return photo
 
     def show_consent(self):
+        self.begin_transition('consent')
         self.clear_screen()
         consent_frame = tk.Frame(self)
         consent_frame.pack()
@@ -252,242 +541,71 @@ class SurveyApp(tk.Tk):
 
         def on_agree():
             if not self.signature_entry.get():
-                tk.messagebox.showerror("Error", "Please type your name as signature")
+                messagebox.showerror("Error", "Please type your name as signature", parent=self)
                 return
             else:
                 self.data['signature'] = self.signature_entry.get()
                 self.data['datetime'] = now
+                self.store.update_session(self.session_id, signature=self.data['signature'], consent_time=now)
+                self.record_ui('consent', signature=self.data['signature'])
+            self.finish_startup()  # Usually done already, while the form was read
             self.show_LAB_questions()
 
         tk.Button(self, text="CONTINUE",
                  command=on_agree,
                  font=("Arial", 20), width=15).pack(pady=20)
 
-    def show_LAB_questions(self):
-        self.clear_screen()
-        tk.Label(self, text="Please rate your experience level with the following activities:\n(1 = No Experience, 7 = Expert Level Experience)",
-                 font=("Arial", 18)).pack(pady=30)
-        tk.Label(self, text="1. Reading and interpreting circuit board layouts", font=("Arial", 14)).pack(pady=10)
-        scale1 = tk.Scale(self, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14), tickinterval=1, showvalue=False)
-        scale1.pack()
-        tk.Label(self, text="2. Soldering electronic components", font=("Arial", 14)).pack(pady=10)
-        scale2 = tk.Scale(self, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14), tickinterval=1, showvalue=False)
-        scale2.pack()
-        tk.Label(self, text="3. Designing printed circuit boards (PCBs)", font=("Arial", 14)).pack(pady=10)
-        scale3 = tk.Scale(self, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14), tickinterval=1, showvalue=False)
-        scale3.pack()
-        tk.Label(self, text="4. Designing printed circuit boards (PCBs)", font=("Arial", 14)).pack(pady=10)
-        scale4 = tk.Scale(self, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14), tickinterval=1, showvalue=False)
-        scale4.pack()
-        tk.Label(self, text="5. Designing printed circuit boards (PCBs)", font=("Arial", 14)).pack(pady=10)
-        scale5 = tk.Scale(self, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14), tickinterval=1, showvalue=False)
-        scale5.pack()
-
-        def next_thing():
-            self.data['LAB_1'] = scale1.get()
-            self.data['LAB_2'] = scale2.get()
-            self.data['LAB_3'] = scale3.get()
-            self.data['LAB_4'] = scale4.get()
-            self.data['LAB_5'] = scale5.get()
-            self.show_PROPENSITY_questions()
-
-        ############## not working
-        # def check_all_responded():
-        #     responses = self.data.keys()
-        #     for i in range(1,5):
-        #         if f'LAB_{i}' not in responses:
-        #             return # prevent the page from turning (do nothing)
-        #     self.show_IDAQ_questions() # all must be accounted for, continue
-
-        # tk.Button(self, text="SUBMIT",
-        #          command=next_thing,
-        #          font=("Arial", 20), width=15).pack(anchor='s')
-        # on continue, scale.get()
-    def show_PROPENSITY_questions(self):
-        self.clear_screen()
-        tk.Label(self, text="Please select the extent to which you agree with the following statements:",
-                 font=("Arial", 18)).pack(pady=30)
-
-        ### Blood magic the toll of which my soul will never forget
-        outer_frame=tk.Frame(self, relief="groove",bd=1)
-        outer_frame.pack(fill="both",expand=True)
-        canvas=tk.Canvas(outer_frame)
-        inner_frame=tk.Frame(canvas)
-        myscrollbar=tk.Scrollbar(outer_frame,orient="vertical",command=canvas.yview)
-        canvas.configure(yscrollcommand=myscrollbar.set)
-        myscrollbar.pack(side="right",fill="y")
-        canvas.pack(side="left",fill="both",expand=True)
-        canvas.create_window((0,0),window=inner_frame,anchor='nw')
-        inner_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        inner_frame.bind_all( # the magic spell so scrollwheel actually scrolls
-            "<MouseWheel>", 
-            lambda event: canvas.yview_scroll(int(-1*(event.delta/120)), "units"))
-        ###
-
-        def create_buttons(frame, question_key):
-            selected_button = tk.IntVar(value=-1)
-
-            def select(value):
-                selected_button.set(value)
-                self.data[question_key] = value
-
-            answer_text = ["Strongly disagree", "Somewhat disagree", "Neither agree nor disagree", "Somewhat agree", "Strongly agree"]
-            for i in range(len(answer_text)):
-                button_text = answer_text[i]
-                button = tk.Radiobutton(frame, text=button_text, variable=selected_button, value=i,
-                                        command=lambda v=i: select(v), font=("Arial", 12))
-                button.pack(anchor='w',padx=150)
-                # tk.Label(frame, text=button_text).pack()
-
-                # tk.Radiobutton(frame, text=button_text, variable=selected_button, value=i,
-                #                command=lambda v=i: select(v)).pack(side=tk.LEFT)
-
-        tk.Label(inner_frame, text="I usually trust machines until there is a reason not to.", font=("Arial", 16)).pack(pady=5, padx=100, anchor='w')
-        create_buttons(inner_frame, 'PROP_1')
-        tk.Label(inner_frame, text="In general, I would rely on a machine to assist me.", font=("Arial", 16)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, 'PROP_2')
-        tk.Label(inner_frame, text="My tendency to trust machines is high.", font=("Arial", 16)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, 'PROP_3')
-        tk.Label(inner_frame, text="It is easy for me to trust machines to do their job.", font=("Arial", 16)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, 'PROP_4')
-        tk.Label(inner_frame, text="I am likely to trust a machine event when I have little knowledge about it.", font=("Arial", 16)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, 'PROP_5')
-
-        def check_all_responded():
-            responses = self.data.keys()
-            for i in range(1,5):
-                if f'PROP_{i}' not in responses:
-                    return # prevent the page from turning (do nothing)
-            self.show_IDAQ_questions() # all must be accounted for, continue
-
-        tk.Button(inner_frame, text="SUBMIT",
-                  command=check_all_responded,
-                  font=("Arial", 20), width=15).pack(pady=20,padx=200, anchor='w')
-    def show_IDAQ_questions(self):
+    def show_questionnaire(self, name):
+        """Show instrument `name` from QUESTIONNAIRES.json; answers are written into self.data."""
+        self.begin_transition(name)
         self.clear_screen()
+        spec = self.questionnaires[name]
+        next_screen = getattr(self, spec['next'])
 
-        ### Blood magic the toll of which my soul will never forget
-        outer_frame=tk.Frame(self, relief="groove",bd=1)
-        outer_frame.pack(fill="both",expand=True)
-        canvas=tk.Canvas(outer_frame)
-        inner_frame=tk.Frame(canvas)
-        myscrollbar=tk.Scrollbar(outer_frame,orient="vertical",command=canvas.yview)
-        canvas.configure(yscrollcommand=myscrollbar.set)
-        myscrollbar.pack(side="right",fill="y")
-        canvas.pack(side="left",fill="both",expand=True)
-        canvas.create_window((0,0),window=inner_frame,anchor='nw')
-        inner_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        inner_frame.bind_all( # the magic spell so scrollwheel actually scrolls
-            "<MouseWheel>", 
-            lambda event: canvas.yview_scroll(int(-1*(event.delta/120)), "units"))
-        ###
-
-        def create_sliders(frame, question_key):#=f"IDAQ_{self.slider_count}"):
-            selected_button = tk.IntVar(value=5)
-
-            def select(value):
-                selected_button.set(value)
-                self.data[question_key] = value
-
-            scale = tk.Scale(frame, from_=0, to=10, orient=tk.HORIZONTAL, length=500, font=("Arial", 14),
-                                tickinterval=1, showvalue=False, variable=selected_button, command=lambda v: select(v))
-            scale.pack()
-
-        tk.Label(inner_frame, text="""Next, we will ask you to rate the extent to which you believe various stimuli
-                 (e.g. technological or mechanical items, wild and domestic animals, and natural things) possess certain capacities. \\
-                 On a 0-10 scale (where 0 = “Not at All” and 10 = “Very much”), please rate the extent to which the stimulus \\
-                 possesses the capacity given. Please circle a number to indicate your response.
-                 We will ask you about the extent to which the stimulus has a mind of its own, has free will, has intentions, has \\
-                 consciousness, can experience emotions, is good-looking, is durable, is lethargic, is active, and is useful. \\
-                 """, font=("Arial", 16)).pack(pady=5, anchor='w')
-        tk.Label(inner_frame, text="""
-            By “has a mind of its own” we mean able to do what it wants.
-            By “has free will” we mean able to choose and control its own actions.
-            By “has intentions” we mean has preferences and plans.
-            By “can experience emotion” we mean it has feelings.
-            By “has consciousness” we mean able to be aware of itself and its thoughts and feelings.
-            By “good-looking” we mean attractive.
-            By “lethargic” we mean moving slowly.
-            By “active” we mean moving frequently and quickly.
-            By “useful” we mean able to be used for something.
-                """, font=("Arial", 16)).pack(pady=0, padx=100, anchor='w')
-
-        questions = [
-            "To what extent is the desert lethargic?",
-            "To what extent is the average computer active?",
-            "To what extent does technology - devices and machines for manufacturing, entertainment, and productive processes (e.g., cars, computers, television sets) - have intentions?",
-            "To what extent does the average fish have free will?",
-            "To what extent is the average cloud good-looking?",
-            "To what extent are pets useful?",
-            "To what extent does the average mountain have free will?",
-            "To what extent is the average amphibian lethargic?",
-            "To what extent does a telivision set experience emotions?",
-            "To what extent is the average robot good-looking?",
-            "To what extent does the average robot have consciousness?",
-            "To what extent do cows have intention?",
-            "To what extent does a car have free will?",
-            "To what extent does the ocean have consciousness?",
-            "To what extent is the average camera lethargic?",
-            "To what extent is a river useful?",
-            "To what extent does the average computer have a mind of its own?",
-            "To what extent is a tree active?",
-            "To what extent is the average kitchen applicance useful?",
-            "To what extent does a cheetah experience emotions?",
-            "To what extent does the environment experience emotions?",
-            "To what extent does the average insect have a mind of its own?",
-            "To what extent does a tree have a mind of its own?",
-            "To what extent is technology - devices and machines for manufacturing, entertainment, and productive processes (e.g., cars, computers, television sets) - durable?",
-            "To what extent is the average cat active?",
-            "To what extent does the wind have intention?",
-            "To what extent is the forest durable?",
-            "To what extent is a tortoise durable?",
-            "To what extent does the average reptile have consciousness?",
-            "To what extent is the average dog good-looking?",
-        ]
-
-        for i, question in enumerate(questions):
-            tk.Label(inner_frame, text=question, font=("Arial", 14), wraplength=700).pack(pady=10)
-            create_sliders(inner_frame, f'IDAQ_{i+1}')
-
-        def check_all_responded():
-            self.show_story()
-            responses = self.data.keys()
-            for i in range(1,30):
-                if f'IDAQ_{i}' not in responses:
-                    return # prevent the page from turning (do nothing)
-            self.show_story() # all must be accounted for, continue
-
-        tk.Button(inner_frame, text="Submit", 
-                  command=check_all_responded,
-                  font=("Arial", 20), width=15).pack(pady=30)
+        def on_submit():
+            # One batch per questionnaire screen
+            self.record_ui('submit')
+            prefix = view.key + "_"
+            self.store.add_responses(self.session_id, name,
+                                     {k: v for k, v in self.data.items() if k.startswith(prefix)})
+            next_screen()
+
+        view = QuestionnaireView(self, name, spec, self.data, on_submit=on_submit,
+                                 on_select=lambda item, value: self.record_ui('select', item=item, value=value))
+        view.pack(fill="both", expand=True)
+
+    def show_LAB_questions(self):
+        self.show_questionnaire('LAB')
 
+    def show_PROPENSITY_questions(self):
+        self.show_questionnaire('PROPENSITY')
+
+    def show_IDAQ_questions(self):
+        self.show_questionnaire('IDAQ')
 
     def show_story(self):
+        self.begin_transition('story')
         self.clear_screen()
         cent_frame =tk.Frame(self)#, relief="groove", borderwidth=2)
         cent_frame.pack()
         tk.Label(cent_frame, text=self.story,font=("Arial", 18), wraplength=800, justify="left").pack(pady=50)
 
         tk.Button(cent_frame, text="Continue", 
-                  command=self.show_framing,
+                  command=self.recorded(self.show_framing),
                   font=("Arial", 20), width=15).pack(pady=30)
     def show_framing(self):
+        self.begin_transition('framing')
         self.clear_screen()
         cent_frame =tk.Frame(self)#, relief="groove", borderwidth=2)
         cent_frame.pack()
         tk.Label(cent_frame, text=self.framing_text,font=("Arial", 18), wraplength=800, justify="left").pack(pady=50)
 
         tk.Button(cent_frame, text="Continue", 
-                  command=self.show_instructions,
+                  command=self.recorded(self.show_instructions),
                   font=("Arial", 20), width=15).pack(pady=30)
     
     def show_instructions(self):
+        self.begin_transition('instructions')
         print(self.data)
         self.clear_screen()
         # tk.Label(self, text="Welcome to the Robot Controller", 
@@ -504,138 +622,188 @@ class SurveyApp(tk.Tk):
         tk.Label(self, text=msg,font=("Arial", 16), wraplength=700).pack(pady=20)
         
         tk.Button(self, text="Continue",
-                 command=self.normal_scan,
+                 command=self.recorded(self.normal_scan),
                  font=("Arial", 20), width=15).pack(pady=30)
 
-    def show_waiting_screen(self, delay, next_step):
-        self.clear_screen()
-        loading_label = tk.Label(self, text="Processing...", font=("Arial", 24))
-        loading_label.pack(pady=100)
+    def build_screens(self):
+        """
+        Build the waiting, trial and zoom screens once. They are stacked in
+        `self.screen_host` and switched with show_screen(), which only raises
+        a frame; their labels and images are updated in place.
+        """
+        self.screen_host = tk.Frame(self)
+        self.screen_host.grid_rowconfigure(0, weight=1)
+        self.screen_host.grid_columnconfigure(0, weight=1)
+        self.screens = {}
+        for name in ('waiting', 'trial', 'zoom'):
+            frame = tk.Frame(self.screen_host)
+            frame.grid(row=0, column=0, sticky='nsew')
+            self.screens[name] = frame
+
+        # Waiting screen
+        waiting = self.screens['waiting']
+        self.waiting_label = tk.Label(waiting, text="Processing...", font=("Arial", 24))
+        self.waiting_label.pack(pady=100)
+        self.progress_bar = ttk.Progressbar(waiting, length=200, mode='indeterminate', maximum=20)
+        self.progress_bar.pack(pady=20)
+
+        # Trial screen
+        trial = self.screens['trial']
+        self.trial_progress_label = tk.Label(trial, font=("Arial", 16))
+        self.trial_progress_label.pack(pady=10)
+        self.image_label = tk.Label(trial)
+        self.image_label.pack(pady=20)
+        self.recommendation_label = tk.Label(trial, font=("Arial", 18))
+        self.recommendation_label.pack(pady=10)
+
+        bottom_frame = tk.Frame(trial)
+        bottom_frame.pack(fill='x', padx=20, pady=10)
+
+        # Zoom controls
+        view_controls = tk.Frame(bottom_frame)
+        view_controls.pack(fill='x', pady=(0, 10))
 
-        progress_bar = ttk.Progressbar(self, length=200, mode='indeterminate', maximum=20)
-        progress_bar.pack(pady=20)
-        progress_bar.start()
+        zoom_btn = tk.Button(view_controls, text="Show Zoom", 
+                            command=self.initiate_zoom_scan,
+                            font=("Arial", 12))
+        zoom_btn.pack(side='left', expand=True, padx=5)
+        self.build_response_buttons(bottom_frame)
+
+        # Zoom screen
+        zoom = self.screens['zoom']
+        if self.board_size:
+            from PyramidViewer import PyramidViewer
+            self.zoom_viewer = PyramidViewer(zoom)
+            self.zoom_viewer.pack(pady=10)
+        else:
+            self.zoom_image_label = tk.Label(zoom)
+            self.zoom_image_label.pack(pady=20)
+        self.zoom_recommendation_label = tk.Label(zoom, font=("Arial", 18))
+        self.zoom_recommendation_label.pack(pady=10)
 
-        def after_wait():
+        bottom_frame = tk.Frame(zoom)
+        bottom_frame.pack(fill='x', padx=20, pady=10)
+        self.build_response_buttons(bottom_frame)
+
+    def build_response_buttons(self, parent):
+        response_controls = tk.Frame(parent)
+        response_controls.pack(fill='x', pady=(10, 0))
+
+        reject_btn = tk.Button(response_controls, text="Discard",
+                            command=self.reject_with_next,
+                            font=("Arial", 18), width=10, height=2)
+        reject_btn.pack(side='left', expand=True, padx=10)
+
+        accept_btn = tk.Button(response_controls, text="Keep",
+                            command=self.accept_with_next,
+                            font=("Arial", 18), width=10, height=2)
+        accept_btn.pack(side='right', expand=True, padx=10)
+
+    def show_screen(self, name):
+        """Switch to one of the persistent screens without rebuilding it."""
+        self.clear_screen()
+        self.screen_host.pack(fill='both', expand=True)
+        self.screens[name].tkraise()
+        self.link_status.lift()
+        if name == 'waiting':
+            self.progress_bar.start()
+
+    def begin_transition(self, name):
+        """Time how long the switch to screen `name` takes to finish drawing."""
+        start = time.perf_counter()
+        self.current_screen = name
+        self.screen_changes += 1
+        self.record_event('screen', name=name)
+
+        def drawn():
+            end = time.perf_counter()
+            self.transition_times.append((name, (end - start) * 1000))
+            tracer.complete(f"show {name}", start, end)
+
+        self.after_idle(drawn)
+
+    def show_waiting_screen(self, delay, next_step):
+        self.begin_transition('waiting')
+        self.waiting_label.config(text="Processing...")
+        self.show_screen('waiting')
+
+        def after_wait(acknowledged=False):
+            tracer.end(*self.command_span, acknowledged=acknowledged)
+            self.waiting_after = None
+            self.waiting_paused = False
+            self.pending_command = None
             self.clear_screen()
             next_step()
 
-        self.after(delay * 1000, after_wait)  # Simulate delay in milliseconds
+        # Fallback in case the robot never reports completion (see poll_robot)
+        self.waiting_step = after_wait
+        self.waiting_delay = delay
+        self.waiting_after = self.after(delay * 1000, after_wait)
 
     def show_trial(self):
-        self.clear_screen()
         self.zoom_used = False
 
         # Check if there are more trials
         if self.current_index >= len(self.current_trials):
+            self.clear_screen()
             if self.is_practice:
                 self.show_transition()
             else:
                 self.show_end()
             return
 
+        self.begin_transition('trial')
+
         # Show trial progress
         trial_type = "Practice " if self.is_practice else ""
-        tk.Label(self, 
-                text=f"{trial_type}Trial {self.current_index + 1} of {len(self.current_trials)}", 
-                font=("Arial", 16)).pack(pady=10)
+        self.trial_progress_label.config(
+            text=f"{trial_type}Trial {self.current_index + 1} of {len(self.current_trials)}")
 
-        # Generate and display image
+        # Display the image prepared while the robot was moving
         current_trial = self.current_trials[self.current_index]
         percent, is_salient = current_trial
-        self.current_damage_pattern = self.generate_damage_pattern(percent/100)
-        bordered_image = self.add_border(self.current_damage_pattern)
-
-        display_size = (200, 400)
-        full_photo = ImageTk.PhotoImage(
-            Image.fromarray(bordered_image).resize(display_size, Image.NEAREST))
+        self.current_damage_pattern, self.focus_pos = self.load_trial(self.current_index)
+        full_photo = self.trial_photo('bordered')
+        self.prefetch(self.current_index + 1)
 
-        self.image_label = tk.Label(self)
         self.image_label.full_view = full_photo
         self.image_label.config(image=full_photo)
-        self.image_label.pack(pady=20)
 
         # Show recommendation using `is_salient`
         recommend_keep = self.is_salient(percent, is_salient)
-        tk.Label(self, 
-                text=f"Robot Recommendation: {'Keep' if recommend_keep else 'Discard'}", 
-                font=("Arial", 18)).pack(pady=10)
-
-        # Control buttons
-        bottom_frame = tk.Frame(self)
-        bottom_frame.pack(fill='x', padx=20, pady=10)
-
-        # Zoom controls
-        view_controls = tk.Frame(bottom_frame)
-        view_controls.pack(fill='x', pady=(0, 10))
-
-        zoom_btn = tk.Button(view_controls, text="Show Zoom", 
-                            command=self.initiate_zoom_scan,
-                            font=("Arial", 12))
-        zoom_btn.pack(side='left', expand=True, padx=5)
-
-        # Response buttons
-        response_controls = tk.Frame(bottom_frame)
-        response_controls.pack(fill='x', pady=(10, 0))
-
-        reject_btn = tk.Button(response_controls, text="Discard",
-                            command=self.reject_with_next,
-                            font=("Arial", 18), width=10, height=2)
-        reject_btn.pack(side='left', expand=True, padx=10)
-
-        accept_btn = tk.Button(response_controls, text="Keep",
-                            command=self.accept_with_next,
-                            font=("Arial", 18), width=10, height=2)
-        accept_btn.pack(side='right', expand=True, padx=10)
+        self.recommendation_label.config(
+            text=f"Robot Recommendation: {'Keep' if recommend_keep else 'Discard'}")
+        self.show_screen('trial')
 
     def initiate_zoom_scan(self):
+        self.record_ui('initiate_zoom_scan')
         self.zoom_scan()  # Send '2' to robot and show waiting screen
 
     def show_zoom_image(self):
+        self.begin_transition('zoom')
         self.zoom_used = True
-        y, x = self.focus_pos
-        zoom = self.current_damage_pattern[y:y+self.focus_size, x:x+self.focus_size]
-        zoom_photo = ImageTk.PhotoImage(
-            Image.fromarray(zoom).resize((300, 300), Image.NEAREST))
-        
-        # Recreate the image label since it was destroyed
-        self.clear_screen()  # Clear the waiting screen
-        self.image_label = tk.Label(self)
-        self.image_label.zoom_view = zoom_photo
-        self.image_label.config(image=zoom_photo)
-        self.image_label.pack(pady=20)
+        if self.board_size:
+            self.zoom_viewer.show(self.current_damage_pattern)
+        else:
+            zoom_photo = self.trial_photo('zoom')  # Prepared along with the trial
+            self.zoom_image_label.zoom_view = zoom_photo
+            self.zoom_image_label.config(image=zoom_photo)
 
         # Show recommendation
         current_trial = self.current_trials[self.current_index]
         percent, is_salient = current_trial
         recommend_keep = self.is_salient(percent, is_salient)
-        tk.Label(self, 
-                text=f"Robot Recommendation: {'Keep' if recommend_keep else 'Discard'}", 
-                font=("Arial", 18)).pack(pady=10)
-
-        # Control buttons
-        bottom_frame = tk.Frame(self)
-        bottom_frame.pack(fill='x', padx=20, pady=10)
-
-        # Response buttons
-        response_controls = tk.Frame(bottom_frame)
-        response_controls.pack(fill='x', pady=(10, 0))
-
-        reject_btn = tk.Button(response_controls, text="Discard",
-                            command=self.reject_with_next,
-                            font=("Arial", 18), width=10, height=2)
-        reject_btn.pack(side='left', expand=True, padx=10)
-
-        accept_btn = tk.Button(response_controls, text="Keep",
-                            command=self.accept_with_next,
-                            font=("Arial", 18), width=10, height=2)
-        accept_btn.pack(side='right', expand=True, padx=10)
+        self.zoom_recommendation_label.config(
+            text=f"Robot Recommendation: {'Keep' if recommend_keep else 'Discard'}")
+        self.show_screen('zoom')
 
     def accept_with_next(self):
+        self.record_ui('accept_with_next')
         self.record_response("Accept")
         # Removed self.next_chip()
 
     def reject_with_next(self):
+        self.record_ui('reject_with_next')
         self.record_response("Reject")
         # Removed self.next_chip()
 
@@ -658,11 +826,16 @@ class SurveyApp(tk.Tk):
             'is_salient': is_salient,
             'response': response,
             'is_correct': is_correct,
-            'zoom_used': self.zoom_used
+            'zoom_used': self.zoom_used,
+            'session_id': self.session_id,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
 
         self.results.append(trial_data)
-        self.save_results()
+        self.discard_pyramid()
+        self.journal.append(trial_data)
+        self.store.add_trial(trial_data)
+        self.save_telemetry(trial_data)
 
         # Move to the next trial
         self.current_index += 1
@@ -672,14 +845,36 @@ class SurveyApp(tk.Tk):
             else:
                 self.show_feedback()
         else:
-            self.next_chip()  # Move to next chip, after waiting normal scan will start
+            self.advance_and_scan()  # Move to the next chip and scan it, then show the trial
+
+    def discard_pyramid(self):
+        """Delete the answered trial's tiles; a large board can take hundreds of MB on disk."""
+        if not self.board_size:
+            return
+        import shutil
+        pyramid = self.current_damage_pattern
+        self.zoom_viewer.clear()
+        pyramid.close()
+        self.prefetch_pool.submit(shutil.rmtree, os.path.dirname(pyramid.path), True)
+
+    def save_telemetry(self, trial_data):
+        """Save the telemetry recorded since the previous response, i.e. this trial's robot moves."""
+        if self.telemetry is None:
+            return
+        from Telemetry import save_samples
+        samples = self.telemetry.since(self.telemetry_mark)
+        self.telemetry_mark = self.telemetry.count
+        path = (f"telemetry_{self.session_id}/"
+                f"{trial_data['trial_type'].lower()}_{trial_data['trial_number']:02d}.npy")
+        self.prefetch_pool.submit(save_samples, path, samples)
 
     def show_transition(self):
+        self.begin_transition('transition')
         self.clear_screen()
         tk.Label(self, text="Practice complete! Ready to begin main trials?",
                 font=("Arial", 18)).pack(pady=50)
         tk.Button(self, text="Start Main Trials",
-                 command=self.start_main_trials,
+                 command=self.recorded(self.start_main_trials),
                  font=("Arial", 18), width=15).pack(pady=20)
 
     def start_main_trials(self):
@@ -689,6 +884,7 @@ class SurveyApp(tk.Tk):
         self.normal_scan()
    
     def show_end(self):
+        self.begin_transition('end')
         self.clear_screen()
         tk.Label(self, text="Thank you for participating!",
                 font=("Arial", 18)).pack(pady=50)
@@ -702,134 +898,41 @@ class SurveyApp(tk.Tk):
                  font=("Arial", 16)).pack(pady=30)
 
     def show_transition_postquestionnaire(self):
+        self.begin_transition('postquestionnaire')
         self.clear_screen()
         tk.Label(self, text="You have completed the task. Now you will be asked questions about your experience.",
                 font=("Arial", 18)).pack(pady=50)
         tk.Button(self, text="Continue",
-                 command=self.show_TOROS_questions,
+                 command=self.recorded(self.show_TOROS_questions),
                  font=("Arial", 18), width=15).pack(pady=20)
     
     def show_TOROS_questions(self):
-        self.clear_screen()
+        self.show_questionnaire('TOROS')
 
-        outer_frame = tk.Frame(self, relief="groove", bd=1)
-        outer_frame.pack(fill="both", expand=True)
-        canvas = tk.Canvas(outer_frame)
-        inner_frame = tk.Frame(canvas)
-        myscrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=canvas.yview)
-        canvas.configure(yscrollcommand=myscrollbar.set)
-        myscrollbar.pack(side="right", fill="y")
-        canvas.pack(side="left", fill="both", expand=True)
-        canvas.create_window((0, 0), window=inner_frame, anchor='n')
-        inner_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        inner_frame.bind_all(
-            "<MouseWheel>", lambda event: canvas.yview_scroll(int(-1 * (event.delta / 120)), "units"))
-
-        def create_sliders(frame, question_key):
-            selected_button = tk.IntVar(value=4)
-
-            def select(value):
-                selected_button.set(value)
-                self.data[question_key] = value
-
-            scale = tk.Scale(frame, from_=1, to=7, orient=tk.HORIZONTAL, length=500, font=("Arial", 14),
-                             tickinterval=1, showvalue=False, variable=selected_button, command=lambda v: select(v))
-            scale.pack(pady=5)
-
-        tk.Label(inner_frame, text="Next, rate how well you agree with the following statements:\n(1 = Strongly disagree, 7 = Strongly agree)",
-                 font=("Arial", 16), justify='center').pack(pady=20, padx=50)
-
-        questions = [
-            "The robot's overall functioning is a mystery to me.",
-            "It is hard to make sense of the robot's general functioning.",
-            "It is difficult to get a clear picture of the robot's overall operations.",
-            "I am confused about the robot's general objectives.",
-            "I am unsure what the robot does.",
-            "I cannot comprehend the robot's inner processes.",
-            "I cannot explain the robot's behavior.",
-            "It is impossible to know what the robot does.",
-            "It is clear to me what the robot does.",
-            "I have a clear understanding of how the robot operates in general."
-        ]
-
-        for i, question in enumerate(questions, start=1):
-            tk.Label(inner_frame, text=question, font=("Arial", 14)).pack(pady=10, padx=100, anchor='center')
-            create_sliders(inner_frame, f"TOROS_{i}")
-
-        def check_all_responded():
-            responses = self.data.keys()
-            for i in range(1, 30):
-                if f'TOROS_{i}' not in responses:
-                    return
-            self.show_story()
-
-        tk.Button(inner_frame, text="Submit",
-                  command=self.show_MULTID_questions,
-                  font=("Arial", 20), width=15).pack(pady=30)
-        
     def show_MULTID_questions(self):
-        self.clear_screen()
+        self.show_questionnaire('MULTID')
 
-        ### Blood magic the toll of which my soul will never forget
-        outer_frame=tk.Frame(self, relief="groove",bd=1)
-        outer_frame.pack(fill="both",expand=True)
-        canvas=tk.Canvas(outer_frame)
-        inner_frame=tk.Frame(canvas)
-        myscrollbar=tk.Scrollbar(outer_frame,orient="vertical",command=canvas.yview)
-        canvas.configure(yscrollcommand=myscrollbar.set)
-        myscrollbar.pack(side="right",fill="y")
-        canvas.pack(side="left",fill="both",expand=True)
-        canvas.create_window((0,0),window=inner_frame,anchor='nw')
-        inner_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        inner_frame.bind_all( # the magic spell so scrollwheel actually scrolls
-            "<MouseWheel>", 
-            lambda event: canvas.yview_scroll(int(-1*(event.delta/120)), "units"))
-        ###
-
-        def create_buttons(frame, question_key):
-            selected_button = tk.IntVar(value=0)
-
-            def select(value):
-                selected_button.set(value)
-                self.data[question_key] = value
-
-            answer_text = ["Disagree", "Somewhat disagree", "Somewhat agree", "Agree"]
-            for i in range(len(answer_text)):
-                button_text = answer_text[i]
-                button = tk.Radiobutton(frame, text=button_text, variable=selected_button, value=i,
-                                        command=lambda v=i: select(v), font=("Arial", 12))
-                button.pack(anchor='w',padx=150)
-
-        tk.Label(inner_frame, text="""Finally, rate how well you agree with the following statements:
-                 """, font=("Arial", 16), justify='center').pack(pady=20, padx=50)
-        
-        tk.Label(inner_frame, text="The way the system works is clear to me.", font=("Arial", 14)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, "MULTID_1")
-        tk.Label(inner_frame, text="I am well informed how the system works.", font=("Arial", 14)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, "MULTID_2")
-        tk.Label(inner_frame, text="I understand how the system works.", font=("Arial", 14)).pack(pady=10, padx=100, anchor='w')
-        create_buttons(inner_frame, "MULTID_3")
-        
-        tk.Button(inner_frame, text="Submit", 
-                  command=self.show_feedback,
-                  font=("Arial", 20), width=15).pack(pady=30)
-        
     def show_feedback(self):
+        self.begin_transition('feedback')
         self.clear_screen()
         tk.Label(self, text="(Optional) Please provide feedback below:", font=("Arial", 16)).pack(pady=20)
         self.feedback_text = tk.Text(self, font=("Arial", 14), width=50, height=30, wrap="word")
         self.feedback_text.pack(pady=10)
 
         tk.Button(self, text="Submit", 
-                  command=self.show_end,
+                  command=self.submit_feedback,
                   font=("Arial", 20), width=15).pack(pady=30)
       
+    def submit_feedback(self):
+        self.record_ui('submit_feedback', feedback=self.feedback_text.get("1.0", "end-1c"))
+        self.show_end()
+
     def show_end(self):
+        self.begin_transition('end')
         self.data["feedback"] = self.feedback_text.get("1.0", "end-1c")
         print(self.data)
+        self.store.update_session(self.session_id, feedback=self.data["feedback"],
+                                  finished=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
         self.save_results()
 
         self.clear_screen()
@@ -846,14 +949,79 @@ class SurveyApp(tk.Tk):
         tk.Label(self, text="You are finished with the experiment. Please alert the researcher.", font=("Arial", 18)).pack(pady=300)
 
     def on_closing(self):
-        self.save_results()
+        self.journal.close()
+        if self.own_store:
+            self.store.close()
+        if self.prefetch_pool is not self.executor:
+            self.prefetch_pool.shutdown(wait=False)
+        print(f"Image cache: {self.image_cache.stats()}")
+        if self.board_size:
+            import shutil
+            shutil.rmtree(self.pyramid_dir, ignore_errors=True)
+        if tracer.enabled and tracer.path:
+            tracer.export()
+        self.report_transitions()
+        if self.link:
+            if self.pending_command is not None:
+                self.link.abort()  # Don't leave the robot driving with nobody watching
+            self.link.close()
+        if self.emulator:
+            self.emulator.close()
+        if self.recorder is not None:
+            self.recorder.close()
         self.destroy()
 
+    def report_transitions(self):
+        """Print the mean time each screen took to appear."""
+        by_screen = {}
+        for name, ms in self.transition_times:
+            by_screen.setdefault(name, []).append(ms)
+        for name, times in by_screen.items():
+            print(f"{name}: {len(times)} transitions, mean {sum(times) / len(times):.1f} ms")
+
     def clear_screen(self):
-        """Clear all widgets from the screen"""
+        """Clear all widgets from the screen; the persistent screens are only hidden"""
+        self.progress_bar.stop()
+        self.screen_host.pack_forget()
         for widget in self.winfo_children():
-            widget.destroy()
+            if widget is not self.link_status and widget is not self.screen_host:
+                widget.destroy()
 
 if __name__ == "__main__":
-    app = SurveyApp()
+    parser = argparse.ArgumentParser(description="PCB robot study GUI")
+    parser.add_argument('--port', help="serial port of the robot (default: COM3)")
+    parser.add_argument('--emulate-robot', action='store_true',
+                        help="run against RobotEmulator instead of the real robot")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="speed-up factor for the emulated robot")
+    parser.add_argument('--baud', type=int,
+                        help="serial speed to negotiate with framed firmware (e.g. 115200)")
+    parser.add_argument('--telemetry', action='store_true',
+                        help="record sensor and motor samples from the robot for each trial")
+    parser.add_argument('--board-size', type=int, nargs=2, metavar=('WIDTH', 'HEIGHT'),
+                        help="generate large boards (e.g. 8000 5000) as tiled pyramids with a multi-level zoom view")
+    parser.add_argument('--defects', choices=['uniform', 'clustered', 'scratch', 'bridge', 'mixed'],
+                        help="shape of the damage in the focus area (default: uniform)")
+    parser.add_argument('--bank', metavar='INDEX',
+                        help="show pre-rendered trials from a stimulus bank index (see BuildStimulusBank.py)")
+    parser.add_argument('--seed', type=int,
+                        help="seed for the trial plan and boards, so a session can be repeated exactly")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="record a Chrome trace-event timeline of the session to FILE")
+    parser.add_argument('--record', metavar='FILE',
+                        help="record robot traffic and participant actions to FILE (see SessionReplay.py)")
+    args = parser.parse_args()
+    if args.board_size and args.bank:
+        parser.error("--board-size cannot be used with --bank")
+    if args.defects and args.bank:
+        parser.error("--defects cannot be used with --bank; build the bank with --defects instead")
+    if args.seed is not None and args.bank:
+        parser.error("--seed cannot be used with --bank; the bank was built from its own seed")
+    if args.trace:
+        tracer.enable(args.trace)
+    recorder = SessionRecorder(args.record) if args.record else None
+
+    app = SurveyApp(port=args.port, emulate_robot=args.emulate_robot, time_scale=args.time_scale,
+                    fast_baud=args.baud, telemetry=args.telemetry, bank=args.bank, seed=args.seed,
+                    recorder=recorder, board_size=args.board_size, defects=args.defects or 'uniform')
     app.mainloop()
\ No newline at end of file
@@ -0,0 +1,211 @@
+import argparse
+import csv
+import importlib.util
+import json
+import os
+import platform
+import tempfile
+import time
+import tkinter as tk
+
+import numpy
+from PIL import Image, ImageTk
+
+import Stimuli
+from ImagePyramid import ImagePyramid, build_pyramid
+from ResultsJournal import ResultsJournal, FIELDNAMES
+
+IMAGE_SIZES = [(200, 400), (800, 1600), (2000, 4000)]  # (width, height)
+FOCUS_SIZES = [20, 50, 100]
+RESULT_ROWS = [41, 1000, 100000]
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """Best time per call in seconds, timeit style."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def load_bluetooth_example():
+    # The file name has a hyphen, so it cannot be imported normally
+    spec = importlib.util.spec_from_file_location("bluetooth_example", "Bluetooth-Example.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def trial_row(i):
+    return {'trial_number': i + 1, 'trial_type': 'Experimental', 'percentage': 20 + i % 41,
+            'is_salient': False, 'response': 'Accept', 'is_correct': True, 'zoom_used': False,
+            'session_id': 'bench', 'timestamp': '2024-09-04 12:00:00'}
+
+
+def bench_stimuli(results):
+    rng = numpy.random.default_rng(0)
+    for width, height in IMAGE_SIZES:
+        for focus_size in FOCUS_SIZES:
+            results[f"generate_damage_pattern/{width}x{height}/focus{focus_size}"] = measure(
+                lambda: Stimuli.generate_damage_patterns([0.4], width, height, focus_size, rng=rng))
+    percents = [p / 100 for p in range(20, 61)]
+    results["generate_damage_patterns/batch41/200x400/focus20"] = measure(
+        lambda: Stimuli.generate_damage_patterns(percents, rng=rng))
+    batch = rng.uniform(0.2, 0.6, size=1000)
+    for style in Stimuli.DEFECT_STYLES + ('mixed',):
+        results[f"generate_defect_batch/batch1000/{style}"] = measure(
+            lambda: Stimuli.generate_defect_batch(batch, rng=rng, style=style), repeat=3)
+
+    for width, height in IMAGE_SIZES:
+        for focus_size in FOCUS_SIZES:
+            images, focus = Stimuli.generate_damage_patterns([0.4], width, height, focus_size, rng=rng)
+            results[f"add_border/{width}x{height}/focus{focus_size}"] = measure(
+                lambda: Stimuli.add_border(images[0], focus[0], focus_size))
+
+
+def bench_display(results):
+    images, focus = Stimuli.generate_damage_patterns([0.4])
+    bordered = Stimuli.add_border(images[0], focus[0], 20)
+    results["fromarray_resize/200x400"] = measure(
+        lambda: Image.fromarray(bordered).resize((200, 400), Image.NEAREST))
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        print("No display: skipping the ImageTk.PhotoImage conversion")
+        return
+    resized = Image.fromarray(bordered).resize((200, 400), Image.NEAREST)
+    results["photoimage/200x400"] = measure(lambda: ImageTk.PhotoImage(resized, master=root))
+    results["fromarray_resize_photoimage/200x400"] = measure(
+        lambda: ImageTk.PhotoImage(Image.fromarray(bordered).resize((200, 400), Image.NEAREST), master=root))
+    root.destroy()
+
+
+def bench_pyramid(results):
+    rng = numpy.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = os.path.join(tmp, "board")
+        results["build_pyramid/8000x5000/focus800"] = measure(
+            lambda: build_pyramid(directory, 0.4, 8000, 5000, 800, rng=rng), repeat=1)
+        pyramid = ImagePyramid(os.path.join(directory, "pyramid.json"))
+        results["pyramid_tile/fromarray"] = measure(lambda: Image.fromarray(pyramid.tile(0, 3, 4)))
+        results["pyramid_tile/magnified16x"] = measure(
+            lambda: Image.fromarray(pyramid.tile(0, 3, 4)[:16, :16]).resize((256, 256), Image.NEAREST))
+        try:
+            root = tk.Tk()
+            root.withdraw()
+        except tk.TclError:
+            print("No display: skipping the pyramid zoom step")
+            pyramid.close()
+            return
+
+        def zoom_step():
+            # What PyramidViewer converts on a cache miss: the 3x4 tiles of a 600x500 view
+            for row in range(3):
+                for col in range(4):
+                    ImageTk.PhotoImage(Image.fromarray(pyramid.tile(1, row, col)), master=root)
+
+        results["pyramid_zoom_step/600x500"] = measure(zoom_step)
+        root.destroy()
+        pyramid.close()
+
+
+def bench_trials(results):
+    rng = numpy.random.default_rng(0)
+    results["generate_experimental_trials"] = measure(lambda: Stimuli.experimental_trials(rng))
+
+    example = load_bluetooth_example()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # gen_static writes big_<n>.png into the working directory
+        try:
+            for percent in (5, 30):
+                results[f"gen_static/{percent}"] = measure(lambda: example.SurveyApp.gen_static(None, percent / 100))
+        finally:
+            os.chdir(cwd)
+
+
+def bench_results(results):
+    """
+    Cost of saving one more trial in a session that already has RESULT_ROWS
+    rows. These are per-trial costs; a whole session pays them once per trial.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in RESULT_ROWS:
+            data = [trial_row(i) for i in range(rows)]
+            row = trial_row(rows)
+            path = os.path.join(tmp, f"journal_{rows}.csv")
+            journal = ResultsJournal(path, path + ".backup")
+            for earlier in data:
+                journal.append(earlier)
+            journal.flush(timeout=None)
+
+            # What the Tk thread pays now: the row is queued for the journal's writer thread
+            results[f"save_results/per_trial/journal_append/{rows}"] = measure(lambda: journal.append(row))
+            journal.flush(timeout=None)
+
+            def durable():
+                journal.append(row)
+                journal.flush(timeout=None)
+
+            # Until the row is on disk, including an fsync
+            results[f"save_results/per_trial/journal_flush/{rows}"] = measure(durable, repeat=3)
+            journal.close(timeout=None)
+
+            def rewrite():
+                with open(os.path.join(tmp, "rewrite.csv"), 'w', newline='') as f:
+                    writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+                    writer.writeheader()
+                    writer.writerows(data)
+                    writer.writerow(row)
+
+            # What the old save_results() paid on the Tk thread after each trial: every row rewritten
+            results[f"save_results/per_trial/full_rewrite/{rows}"] = measure(rewrite, repeat=3)
+
+
+def report(results, baseline=None):
+    for name, seconds in results.items():
+        line = f"{name:55s} {seconds * 1000:12.4f} ms"
+        if baseline and name in baseline:
+            line += f"   {baseline[name] / seconds:6.2f}x vs baseline"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the stimulus and persistence hot paths.")
+    parser.add_argument('--save', metavar='FILE', help="write the results as a baseline JSON file")
+    parser.add_argument('--compare', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--only', choices=['stimuli', 'display', 'pyramid', 'trials', 'results'],
+                        help="run one group of benchmarks")
+    args = parser.parse_args()
+
+    groups = {'stimuli': bench_stimuli, 'display': bench_display, 'pyramid': bench_pyramid,
+              'trials': bench_trials, 'results': bench_results}
+    results = {}
+    for name, bench in groups.items():
+        if args.only in (None, name):
+            bench(results)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'numpy': numpy.__version__,
+                       'machine': platform.platform(), 'results': results}, f, indent=4)
+        print(f"Saved baseline to {args.save}")
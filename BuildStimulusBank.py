@@ -0,0 +1,78 @@
+import argparse
+import json
+import os
+import time
+
+import numpy
+from numpy.lib.format import open_memmap
+
+import Stimuli
+
+
+def build_bank(prefix, seed, image_width=200, image_height=400, focus_size=20,
+               bg_damage_rate=0.001, defects='uniform'):
+    """
+    Plan a session from `seed` and render every board into `<prefix>.npy`,
+    with the plan, focus positions and exact damage fractions in `<prefix>.json`.
+    `defects` is the shape of the focus area damage (see Stimuli.defect_costs).
+    Returns the index path.
+
+    Boards are written one at a time through a memory map, so a bank larger
+    than memory can be built. Each board is drawn from Stimuli.trial_rng(seed,
+    position), so the bank has the boards `AnthroGUI.py --seed` generates.
+    """
+    rng = numpy.random.default_rng(seed)
+    practice = list(Stimuli.PRACTICE_TRIALS)
+    main = Stimuli.experimental_trials(rng)
+    trials = practice + main
+
+    images_path = prefix + ".npy"
+    images = open_memmap(images_path, mode='w+', dtype=numpy.uint8,
+                         shape=(len(trials), image_height, image_width, 3))
+    focus_positions = []
+    fractions = []
+    for position, (percent, _) in enumerate(trials):
+        boards, focus, damaged = Stimuli.generate_defect_batch(
+            [percent / 100], image_width, image_height, focus_size, bg_damage_rate,
+            Stimuli.trial_rng(seed, position), defects)
+        images[position] = boards[0]
+        focus_positions.append([int(v) for v in focus[0]])
+        fractions.append(float(damaged[0]))
+    images.flush()
+    del images
+
+    index = {
+        'seed': seed,
+        'images': os.path.basename(images_path),
+        'image_width': image_width,
+        'image_height': image_height,
+        'focus_size': focus_size,
+        'bg_damage_rate': bg_damage_rate,
+        'defects': defects,
+        'practice': practice,
+        'main': main,
+        'focus_positions': focus_positions,  # (y, x) per board, practice boards first
+        'damage_fractions': fractions,  # Exact share of each focus area damaged
+    }
+    index_path = prefix + ".json"
+    with open(index_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    return index_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-render the boards of a seeded session plan.")
+    parser.add_argument('--seed', type=int, required=True)
+    parser.add_argument('--output', metavar='PREFIX',
+                        help="path without extension (default: stimulus_bank_<seed>)")
+    parser.add_argument('--image-size', type=int, nargs=2, default=(200, 400), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--focus-size', type=int, default=20)
+    parser.add_argument('--defects', default='uniform', choices=Stimuli.DEFECT_STYLES + ('mixed',),
+                        help="shape of the damage in the focus area")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index_path = build_bank(args.output or f"stimulus_bank_{args.seed}", args.seed,
+                            args.image_size[0], args.image_size[1], args.focus_size,
+                            defects=args.defects)
+    print(f"Wrote {index_path} in {time.perf_counter() - start:.2f} s")
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import Stimuli
+
+STATISTICS = ['damage', 'background', 'clustering']
+QUANTILES = [5, 50, 95]
+
+
+def board_stats(task):
+    """
+    Generate `n` boards at `percent` and measure each one.
+    Runs in a worker process; returns (percent, {statistic: array of n values}):
+
+    * damage: share of the focus square that is damaged, background damage included
+    * background: share of the pixels outside the focus square that are damaged
+    * clustering: adjacent damaged pairs in the focus square over the number
+      expected if the same pixels were scattered at random (1 = random, above 1 = clumped)
+    """
+    percent, n, seed, config = task
+    rng = numpy.random.default_rng(seed)
+    width, height, focus_size = config['image_width'], config['image_height'], config['focus_size']
+    boards, ys, xs, focus_positions, _ = Stimuli.damage_coordinates(
+        numpy.full(n, percent / 100), width, height, focus_size, config['bg_damage_rate'], rng,
+        config['defects'])
+
+    # Damaged pixels relative to their board's focus square
+    fy = ys - focus_positions[boards, 0]
+    fx = xs - focus_positions[boards, 1]
+    inside = (fy >= 0) & (fy < focus_size) & (fx >= 0) & (fx < focus_size)
+    mask = numpy.zeros((n, focus_size, focus_size), dtype=bool)
+    mask[boards[inside], fy[inside], fx[inside]] = True  # Background picks may land on focus damage
+    focus_pixels = focus_size * focus_size
+    damaged = mask.sum(axis=(1, 2))
+    # Background picks are distinct and focus damage is all inside, so these are distinct pixels
+    outside = numpy.bincount(boards[~inside], minlength=n)
+
+    joins = ((mask[:, 1:, :] & mask[:, :-1, :]).sum(axis=(1, 2))
+             + (mask[:, :, 1:] & mask[:, :, :-1]).sum(axis=(1, 2)))
+    pairs = 2 * focus_size * (focus_size - 1)
+    expected = pairs * damaged * (damaged - 1) / (focus_pixels * (focus_pixels - 1))
+    clustering = numpy.full(n, numpy.nan)
+    numpy.divide(joins, expected, out=clustering, where=expected > 0)
+
+    return percent, {
+        'damage': damaged / focus_pixels,
+        'background': outside / (width * height - focus_pixels),
+        'clustering': clustering,
+    }
+
+
+def d_prime(a, b):
+    """Separation of two samples in pooled standard deviations."""
+    spread = numpy.sqrt((a.var() + b.var()) / 2)
+    if spread == 0:
+        return numpy.inf if a.mean() != b.mean() else 0.0
+    return abs(b.mean() - a.mean()) / spread
+
+
+def calibrate(percents, boards, config, seed, workers=None, chunk=500):
+    """
+    Measure `boards` boards at each of `percents`, generated in chunks on a
+    process pool. Every chunk gets its own stream spawned from `seed` (a
+    SeedSequence), so the result does not depend on the number of workers.
+    Returns {percent: {statistic: array}}.
+    """
+    tasks = []
+    for percent in percents:
+        for start in range(0, boards, chunk):
+            tasks.append([percent, min(chunk, boards - start), None, config])
+    for task, child in zip(tasks, seed.spawn(len(tasks))):
+        task[2] = child
+
+    parts = {percent: {name: [] for name in STATISTICS} for percent in percents}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for percent, stats in pool.map(board_stats, tasks):
+            for name in STATISTICS:
+                parts[percent][name].append(stats[name])
+    return {percent: {name: numpy.concatenate(values) for name, values in stats.items()}
+            for percent, stats in parts.items()}
+
+
+def summary_rows(results):
+    """One row per percentage: distribution of each statistic, boards on the wrong side of the threshold, d'."""
+    rows = []
+    previous = None
+    for percent in sorted(results):
+        stats = results[percent]
+        row = {'percentage': percent, 'boards': len(stats['damage'])}
+        for name in STATISTICS:
+            values = stats[name][~numpy.isnan(stats[name])]
+            row[f"{name}_mean"] = values.mean() if len(values) else numpy.nan
+            row[f"{name}_sd"] = values.std() if len(values) else numpy.nan
+            for q in QUANTILES:
+                row[f"{name}_p{q}"] = numpy.percentile(values, q) if len(values) else numpy.nan
+        reject = stats['damage'] * 100 >= Stimuli.REJECT_PERCENT
+        row['wrong_side'] = numpy.mean(reject != (percent >= Stimuli.REJECT_PERCENT))
+        row['d_prime_previous'] = (d_prime(results[previous]['damage'], stats['damage'])
+                                   if previous is not None else numpy.nan)
+        rows.append(row)
+        previous = percent
+    return rows
+
+
+def write_summary(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: f"{value:.6g}" if isinstance(value, float) else value
+                             for key, value in row.items()})
+
+
+def print_summary(rows):
+    print(f"{'%':>3} {'focus damage mean (p5-p95)':>28} {'background':>11} {'clustering':>11} "
+          f"{'wrong side':>10} {'d_prev':>7}")
+    for row in rows:
+        print(f"{row['percentage']:3d} {row['damage_mean']:10.4f} ({row['damage_p5']:.4f}-{row['damage_p95']:.4f})"
+              f" {row['background_mean']:11.5f} {row['clustering_p50']:11.2f} {row['wrong_side']:10.4f}"
+              f" {row['d_prime_previous']:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the boards Stimuli.py generates at each damage percentage.")
+    parser.add_argument('--percents', type=int, nargs=2, default=(20, 60), metavar=('LOW', 'HIGH'),
+                        help="damage percentages to test, inclusive")
+    parser.add_argument('--boards', type=int, default=2000, help="boards per percentage")
+    parser.add_argument('--image-size', type=int, nargs=2, default=(200, 400), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--focus-size', type=int, default=20)
+    parser.add_argument('--bg-damage-rate', type=float, default=0.001)
+    parser.add_argument('--defects', default='uniform', choices=Stimuli.DEFECT_STYLES + ('mixed',))
+    parser.add_argument('--compare', type=int, nargs=2, default=(35, 45), metavar=('A', 'B'),
+                        help="two percentages whose separation is reported")
+    parser.add_argument('--seed', type=int, help="default: random, printed so the run can be repeated")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--output', default="stimulus_calibration.csv")
+    args = parser.parse_args()
+
+    config = {'image_width': args.image_size[0], 'image_height': args.image_size[1],
+              'focus_size': args.focus_size, 'bg_damage_rate': args.bg_damage_rate, 'defects': args.defects}
+    seed = numpy.random.SeedSequence(args.seed)
+    percents = list(range(args.percents[0], args.percents[1] + 1))
+
+    start = time.perf_counter()
+    results = calibrate(percents, args.boards, config, seed, args.workers)
+    rows = summary_rows(results)
+    write_summary(args.output, rows)
+    print_summary(rows)
+
+    a, b = args.compare
+    if a in results and b in results:
+        print(f"\n{a}% vs {b}%: d' = {d_prime(results[a]['damage'], results[b]['damage']):.2f}, "
+              f"distributions overlap in {numpy.mean(results[a]['damage'] >= results[b]['damage'].min()):.2%} "
+              f"of the {a}% boards")
+    print(f"\n{len(percents) * args.boards} boards (seed {seed.entropy}) measured in "
+          f"{time.perf_counter() - start:.2f} s, summary written to {args.output}")
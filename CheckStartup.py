@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Run in a fresh interpreter: opens a SurveyApp and reports when the consent
+# screen was drawn and when finish_startup() had run, counted from script start
+WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import json, os, sys
+import AnthroGUI
+from SessionStore import SessionStore
+
+store = SessionStore(os.path.join(sys.argv[1], "startup.db"))
+app = AnthroGUI.SurveyApp(session_id="startup_check", store=store)
+times = {}
+
+def poll():
+    now = (time.perf_counter() - start) * 1000
+    if app.transition_times and 'consent' not in times:
+        times['consent'] = now
+    if app.started and 'ready' not in times:
+        times['ready'] = now
+    if len(times) == 2:
+        app.on_closing()
+        store.close()
+        print("STARTUP " + json.dumps(times))
+    else:
+        app.after(5, poll)
+
+app.after(0, poll)
+app.mainloop()
+"""
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter with -X importtime.
+    Returns {module name: (self us, cumulative us)} and the top-level import order.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, check=True)
+    times = {}
+    direct = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        times[name] = (int(own), int(cumulative))
+        if depth == 1:  # Imported directly by `module`
+            direct.append(name)
+    return times, direct
+
+
+def check_imports(runs, budget_ms):
+    import AnthroGUI
+    totals = []
+    for _ in range(runs):
+        times, direct = import_times("AnthroGUI")
+        totals.append(times["AnthroGUI"][1] / 1000)
+    total = statistics.median(totals)
+    print(f"import AnthroGUI: median {total:.1f} ms over {runs} runs (budget {budget_ms:.0f} ms)")
+    print("Slowest direct imports (last run):")
+    for name in sorted(direct, key=lambda n: -times[n][1])[:5]:
+        print(f"  {name:24s} {times[name][1] / 1000:7.1f} ms")
+
+    problems = []
+    leaked = [name for name in AnthroGUI.DEFERRED_MODULES if name in times]
+    if leaked:
+        problems.append(f"imported before the first screen: {', '.join(leaked)}")
+    if total > budget_ms:
+        problems.append(f"import AnthroGUI is over the {budget_ms:.0f} ms budget")
+    return problems
+
+
+def check_window(budget_ms):
+    """Time from script start to the consent screen; needs a display."""
+    with tempfile.TemporaryDirectory() as directory:
+        result = subprocess.run([sys.executable, "-c", WINDOW_SCRIPT, directory],
+                                capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("STARTUP "):
+            times = json.loads(line[len("STARTUP "):])
+            break
+    else:
+        return [f"window check failed:\n{result.stderr.strip()}"]
+    if os.path.exists("pcb_survey_results_startup_check.csv"):
+        os.remove("pcb_survey_results_startup_check.csv")
+    print(f"Consent screen drawn after {times['consent']:.0f} ms, "
+          f"startup finished after {times['ready']:.0f} ms (budget {budget_ms:.0f} ms to the consent screen)")
+    if times['consent'] > budget_ms:
+        return ["consent screen is over budget"]
+    return []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the GUI still starts quickly.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=100,
+                        help="limit for the median time of 'import AnthroGUI'")
+    parser.add_argument('--window', action='store_true',
+                        help="also open the GUI and time the consent screen (needs a display)")
+    parser.add_argument('--window-budget-ms', type=float, default=500)
+    args = parser.parse_args()
+
+    problems = check_imports(args.runs, args.budget_ms)
+    if args.window:
+        problems += check_window(args.window_budget_ms)
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    raise SystemExit(1 if problems else 0)
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+def estimate_bytes(value):
+    """Rough memory footprint of a cached board array, PIL image or PhotoImage."""
+    if hasattr(value, 'nbytes'):  # numpy array
+        return value.nbytes
+    if hasattr(value, 'getbands'):  # PIL image
+        return value.width * value.height * len(value.getbands())
+    return value.width() * value.height() * 4  # PhotoImage, stored as RGBA by Tk
+
+
+class ImageCache:
+    """Bounded LRU cache for rendered trial images.
+
+    Keys are (session, trial, view, display size) tuples. Entries are evicted
+    least-recently-used first once their total size exceeds ``max_bytes``.
+    Only the Tk thread uses it, so there is no locking.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (value, nbytes)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, value, nbytes=None):
+        if nbytes is None:
+            nbytes = estimate_bytes(value)
+        if key in self._items:
+            self.bytes -= self._items.pop(key)[1]
+        self._items[key] = (value, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.bytes -= evicted
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'items': len(self._items), 'bytes': self.bytes}
@@ -0,0 +1,158 @@
+import json
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+import Stimuli
+
+TILE_SIZE = 256
+BAND_ROWS = 4  # Tile rows painted at a time when building level 0
+
+
+def downsample(band):
+    """Halve an (H, W, 3) uint8 image with even sides by averaging 2x2 blocks."""
+    total = band[0::2, 0::2].astype(numpy.uint16)
+    total += band[1::2, 0::2]
+    total += band[0::2, 1::2]
+    total += band[1::2, 1::2]
+    total += 2  # Round to nearest
+    total >>= 2
+    return total.astype(numpy.uint8)
+
+
+def tiles_to_band(tiles):
+    """(rows, cols, T, T, 3) tiles as one (rows*T, cols*T, 3) image."""
+    rows, cols, size = tiles.shape[:3]
+    return tiles.transpose(0, 2, 1, 3, 4).reshape(rows * size, cols * size, 3)
+
+
+def band_to_tiles(band, size):
+    """Inverse of tiles_to_band()."""
+    height, width = band.shape[:2]
+    return band.reshape(height // size, size, width // size, size, 3).transpose(0, 2, 1, 3, 4)
+
+
+def build_pyramid(directory, damage_percent, image_width, image_height, focus_size,
+                  bg_damage_rate=0.001, rng=None, tile_size=TILE_SIZE, style='uniform'):
+    """
+    Generate one board (see Stimuli.damage_coordinates) straight into a tiled
+    pyramid in `directory` and return the path of its index. Only a band of
+    tiles is in memory at a time, so the board may be larger than memory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _, ys, xs, focus_positions, fractions = Stimuli.damage_coordinates(
+        [damage_percent], image_width, image_height, focus_size, bg_damage_rate, rng, style)
+
+    sizes = [(image_width, image_height)]
+    while max(sizes[-1]) > tile_size:
+        width, height = sizes[-1]
+        sizes.append(((width + 1) // 2, (height + 1) // 2))
+
+    # Level 0, painted band by band: sort the damaged pixels by tile row once
+    rows, cols = -(-image_height // tile_size), -(-image_width // tile_size)
+    level = open_memmap(os.path.join(directory, "level_0.npy"), mode='w+', dtype=numpy.uint8,
+                        shape=(rows, cols, tile_size, tile_size, 3))
+    order = numpy.argsort(ys, kind='stable')
+    ys, xs = ys[order], xs[order]
+    for start in range(0, rows, BAND_ROWS):
+        stop = min(rows, start + BAND_ROWS)
+        first, last = numpy.searchsorted(ys, [start * tile_size, stop * tile_size])
+        band = numpy.empty(((stop - start) * tile_size, cols * tile_size, 3), dtype=numpy.uint8)
+        band[...] = Stimuli.BLUE  # Also pads the edge tiles
+        band[ys[first:last] - start * tile_size, xs[first:last]] = Stimuli.ORANGE
+        level[start:stop] = band_to_tiles(band, tile_size)
+
+    # Each further level from the one below it, one output tile row at a time
+    below = None
+    for number in range(1, len(sizes)):
+        below = level
+        rows, cols = -(-sizes[number][1] // tile_size), -(-sizes[number][0] // tile_size)
+        level = open_memmap(os.path.join(directory, f"level_{number}.npy"), mode='w+', dtype=numpy.uint8,
+                            shape=(rows, cols, tile_size, tile_size, 3))
+        for row in range(rows):
+            band = numpy.empty((2 * tile_size, 2 * cols * tile_size, 3), dtype=numpy.uint8)
+            band[...] = Stimuli.BLUE  # Where the level below has no tiles
+            source = tiles_to_band(below[2 * row:2 * row + 2])
+            band[:source.shape[0], :source.shape[1]] = source
+            level[row] = band_to_tiles(downsample(band), tile_size)[0]
+    level.flush()
+    del level, below
+
+    index = {
+        'tile_size': tile_size,
+        'sizes': sizes,  # (width, height) of each level, full resolution first
+        'damage_percent': damage_percent,
+        'damage_fraction': float(fractions[0]),  # Exact share of the focus area damaged
+        'defects': style,
+        'focus_pos': [int(v) for v in focus_positions[0]],  # (y, x) at full resolution
+        'focus_size': focus_size,
+    }
+    path = os.path.join(directory, "pyramid.json")
+    with open(path, 'w') as f:
+        json.dump(index, f)
+    return path
+
+
+class ImagePyramid:
+    """A board stored as tiles at several zoom levels (see build_pyramid).
+
+    Level 0 is full resolution and each further level halves both sides,
+    down to a single tile. A level is one .npy file of shape
+    (rows, cols, tile, tile, 3), so every tile is contiguous on disk. The
+    files are memory-mapped, and reading a tile touches only that tile's pages.
+    Tiles on the right and bottom edges are padded with the board colour.
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            index = json.load(f)
+        directory = os.path.dirname(path)
+        self.path = path
+        self.tile_size = index['tile_size']
+        self.sizes = [tuple(size) for size in index['sizes']]
+        self.focus_pos = tuple(index['focus_pos'])
+        self.focus_size = index['focus_size']
+        self.levels = [numpy.load(os.path.join(directory, f"level_{n}.npy"), mmap_mode='r')
+                       for n in range(len(self.sizes))]
+
+    @property
+    def width(self):
+        return self.sizes[0][0]
+
+    @property
+    def height(self):
+        return self.sizes[0][1]
+
+    def grid(self, level):
+        """(rows, cols) of tiles at `level`."""
+        return self.levels[level].shape[:2]
+
+    def tile(self, level, row, col):
+        return self.levels[level][row, col]
+
+    def region(self, level, x0, y0, x1, y1):
+        """Pixels [y0:y1, x0:x1] of `level`, read from the tiles that cover them."""
+        size = self.tile_size
+        width, height = self.sizes[level]
+        x1, y1 = min(x1, width), min(y1, height)
+        rows = slice(y0 // size, -(-y1 // size))
+        cols = slice(x0 // size, -(-x1 // size))
+        band = tiles_to_band(numpy.asarray(self.levels[level][rows, cols]))
+        top, left = rows.start * size, cols.start * size
+        return band[y0 - top:y1 - top, x0 - left:x1 - left]
+
+    def overview(self, max_width, max_height):
+        """
+        The whole board from the smallest level at least (max_width, max_height)
+        in size, or the largest level. Returns (image array, scale from full resolution).
+        """
+        level = len(self.sizes) - 1
+        while level > 0 and (self.sizes[level][0] < max_width or self.sizes[level][1] < max_height):
+            level -= 1
+        width, height = self.sizes[level]
+        return self.region(level, 0, 0, width, height), width / self.width
+
+    def close(self):
+        """Drop the memory maps so the files can be deleted (needed on Windows)."""
+        self.levels = []
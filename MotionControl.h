@@ -0,0 +1,505 @@
+#ifndef MOTION_CONTROL_H
+#define MOTION_CONTROL_H
+
+#include <stdint.h>
+#include <stdio.h>
+
+/**
+ * MOTION STATE MACHINE
+ * The robot's motions (scan, advance, curve turn, arm) as a cooperative,
+ * millis()-based state machine. A command is a short program of steps; loop()
+ * calls update() as often as it can, and each update() does at most one
+ * control tick and returns at once. The sketch can therefore read Serial3
+ * while the robot moves, answer a status query and stop a motion part way.
+ *
+ * Nothing here touches the board directly: the sketch implements
+ * MotionHardware with the MegaPi motors and sensors, and MotionSim.cpp with a
+ * simulated robot, so the same code can be built and tested on a PC.
+ */
+
+// Motor speeds
+const int16_t motorSpeed = 60;
+const int16_t motorSpeedB = 42;
+const int16_t motorSpeed1 = 61;
+const int16_t motorSpeed1B = 44;
+
+// Boost parameters
+const int16_t boostSpeed = 100;			 // Higher initial speed
+const unsigned long boostDuration = 50; // Duration of boost in milliseconds
+
+// Correction factor for line following
+const float CORRECTION_FACTOR = 1.5; // Increases speed by 50% when correcting
+
+const int16_t TURN_SPEED = 100; // Curve turn speed for both motors
+
+// Step durations in ms
+const unsigned long CONTROL_INTERVAL = 10; // Between sensor readings while driving
+const unsigned long CENTER_INTERVAL = 50;  // Between checks while settling
+const unsigned long CENTER_PULSE = 50;	   // Length of one centring nudge
+const unsigned long SETTLE_TIME = 500;
+const unsigned long NEXT_CHIP_TIME = 800;
+const unsigned long LOWER_ARM_TIME = 1000;
+const unsigned long RAISE_ARM_TIME = 1300;
+const unsigned long CURVE_TIMEOUT = 10000; // A curve turn normally ends within about 4 s
+
+#define LEFT_SENSOR 1
+#define RIGHT_SENSOR 2
+
+// What the state machine needs from the robot
+class MotionHardware
+{
+public:
+	virtual unsigned long now() = 0;
+	virtual uint8_t readSensors() = 0; // LEFT_SENSOR | RIGHT_SENSOR bits that see the line
+	virtual void drive(int16_t leftSpeed, int16_t rightSpeed) = 0;
+	virtual void stop() = 0;
+	virtual void runArm(int16_t speed) = 0; // 0 stops the arm
+	virtual void report(const char *line) = 0; // A status line for the host
+};
+
+enum MotionStep
+{
+	STEP_IDLE,
+	STEP_SCAN_FORWARD,
+	STEP_SCAN_BACKWARD,
+	STEP_SETTLE,
+	STEP_LOWER_ARM,
+	STEP_RAISE_ARM,
+	STEP_ADVANCE,
+	STEP_CURVE
+};
+
+// How the last command ended
+enum MotionResult
+{
+	RESULT_NONE, // Still running, or already collected
+	RESULT_DONE,
+	RESULT_ABORTED,
+	RESULT_TIMEOUT
+};
+
+// A motion command as the sketch received it; seq is the frame's sequence number, or -1 for a bare byte
+struct MotionCommand
+{
+	int seq;
+	char command; // 0 for none
+	unsigned long forwardTime;
+	unsigned long backwardTime;
+};
+
+#define MAX_STEPS 10
+
+class MotionController
+{
+public:
+	int chipCount; // Chip counter for curve turns
+
+	MotionController(MotionHardware &hardware) : hw(hardware)
+	{
+		chipCount = 0;
+		stepCount = 0;
+		current = 0;
+		command = 0;
+		result = RESULT_NONE;
+		step = STEP_IDLE;
+	}
+
+	bool busy() const
+	{
+		return step != STEP_IDLE;
+	}
+
+	// The command being run, or 0
+	char activeCommand() const
+	{
+		return busy() ? command : 0;
+	}
+
+	const char *stepName() const
+	{
+		switch (step)
+		{
+		case STEP_SCAN_FORWARD:
+			return "scan_forward";
+		case STEP_SCAN_BACKWARD:
+			return "scan_backward";
+		case STEP_SETTLE:
+			return "settle";
+		case STEP_LOWER_ARM:
+			return "lower_arm";
+		case STEP_RAISE_ARM:
+			return "raise_arm";
+		case STEP_ADVANCE:
+			return "advance";
+		case STEP_CURVE:
+			return "curve";
+		default:
+			return "idle";
+		}
+	}
+
+	// Milliseconds since the current step began
+	unsigned long stepElapsed()
+	{
+		return busy() ? hw.now() - stepStart : 0;
+	}
+
+	/**
+	 * Start motion command '1' (scan), '2' (zoomed scan), '3' (next chip) or
+	 * '4' (next chip, then scan). Returns false for any other command or if
+	 * a command is already running.
+	 */
+	bool start(char newCommand, unsigned long forwardTime, unsigned long backwardTime)
+	{
+		if (busy() || newCommand < '1' || newCommand > '4')
+		{
+			return false;
+		}
+		command = newCommand;
+		stepCount = 0;
+		if (command == '2')
+		{
+			add(STEP_LOWER_ARM, LOWER_ARM_TIME);
+			add(STEP_SETTLE, SETTLE_TIME);
+		}
+		if (command == '3' || command == '4')
+		{
+			nextChip();
+		}
+		if (command != '3')
+		{
+			add(STEP_SCAN_FORWARD, forwardTime);
+			add(STEP_SETTLE, SETTLE_TIME);
+			add(STEP_SCAN_BACKWARD, backwardTime);
+			add(STEP_SETTLE, SETTLE_TIME);
+		}
+		if (command == '2')
+		{
+			add(STEP_RAISE_ARM, RAISE_ARM_TIME);
+			add(STEP_SETTLE, SETTLE_TIME);
+		}
+		result = RESULT_NONE;
+		current = 0;
+		enter(hw.now());
+		return true;
+	}
+
+	// Advance the running command by at most one tick; call from loop()
+	void update()
+	{
+		if (!busy())
+		{
+			return;
+		}
+		unsigned long now = hw.now();
+		if (now - lastTick < tickInterval())
+		{
+			return;
+		}
+		lastTick = now;
+		unsigned long elapsed = now - stepStart;
+
+		switch (step)
+		{
+		case STEP_SCAN_FORWARD:
+		case STEP_SCAN_BACKWARD:
+		case STEP_ADVANCE:
+			if (elapsed >= steps[current].duration)
+			{
+				hw.stop();
+				finishStep(now);
+			}
+			else if (reached(now, boostUntil))
+			{
+				followLine(now);
+			}
+			break;
+
+		case STEP_SETTLE:
+			settle(now, elapsed);
+			break;
+
+		case STEP_LOWER_ARM:
+		case STEP_RAISE_ARM:
+			if (elapsed >= steps[current].duration)
+			{
+				hw.runArm(0);
+				finishStep(now);
+			}
+			break;
+
+		case STEP_CURVE:
+			curve(now, elapsed);
+			break;
+
+		default:
+			break;
+		}
+	}
+
+	// Stop the motors and arm at once and drop the rest of the command
+	void abort()
+	{
+		if (busy())
+		{
+			hw.report("Motion aborted");
+			end(RESULT_ABORTED);
+		}
+	}
+
+	// How the last command ended; RESULT_NONE until it has, and once collected
+	MotionResult takeResult()
+	{
+		MotionResult finished = result;
+		result = RESULT_NONE;
+		return finished;
+	}
+
+private:
+	struct Step
+	{
+		MotionStep kind;
+		unsigned long duration;
+	};
+
+	MotionHardware &hw;
+	Step steps[MAX_STEPS];
+	int stepCount;
+	int current;
+	char command;
+	MotionResult result;
+	MotionStep step;
+	unsigned long stepStart;
+	unsigned long lastTick;
+	unsigned long boostUntil;
+	bool firstMove;
+	uint8_t centering; // Sensors still to be answered with a nudge while settling
+	bool nudging;
+	unsigned long nextCheck;
+
+	// Whether `deadline` has passed, across millis() wrapping around
+	static bool reached(unsigned long now, unsigned long deadline)
+	{
+		return (long)(now - deadline) >= 0;
+	}
+
+	void add(MotionStep kind, unsigned long duration)
+	{
+		if (stepCount < MAX_STEPS)
+		{
+			steps[stepCount].kind = kind;
+			steps[stepCount].duration = duration;
+			stepCount++;
+		}
+	}
+
+	void nextChip()
+	{
+		chipCount++;
+		char line[24];
+		snprintf(line, sizeof(line), "Chip count: %d", chipCount);
+		hw.report(line);
+
+		/**
+		 * CHIPS PER ROW
+		 * 10 is the number of chips before the first curve
+		 * then 20 is the next row, assuming 10 chips before each turn.
+		 *
+		 * Change these values to match the number of chips from the start
+		 * for each turn.
+		 *
+		 * To add turns add " || chipCount == X " for as many turns as you need.
+		 */
+		if (chipCount == 10 || chipCount == 20)
+		{
+			hw.report("Executing curve turn");
+			add(STEP_CURVE, CURVE_TIMEOUT);
+			return;
+		}
+		add(STEP_ADVANCE, NEXT_CHIP_TIME);
+		add(STEP_SETTLE, SETTLE_TIME);
+	}
+
+	unsigned long tickInterval() const
+	{
+		return step == STEP_SETTLE ? 1 : CONTROL_INTERVAL;
+	}
+
+	void enter(unsigned long now)
+	{
+		step = steps[current].kind;
+		stepStart = now;
+		lastTick = now - CONTROL_INTERVAL; // First tick at once
+		boostUntil = now;
+		firstMove = true;
+		centering = 0;
+		nudging = false;
+		nextCheck = now;
+		if (step == STEP_LOWER_ARM || step == STEP_RAISE_ARM)
+		{
+			hw.stop();
+			hw.runArm(step == STEP_LOWER_ARM ? -motorSpeed : motorSpeed);
+		}
+		else if (step == STEP_CURVE)
+		{
+			hw.report("Starting curve turn sequence");
+		}
+		update();
+	}
+
+	void finishStep(unsigned long now)
+	{
+		current++;
+		if (current >= stepCount)
+		{
+			end(RESULT_DONE);
+			return;
+		}
+		enter(now);
+	}
+
+	void end(MotionResult how)
+	{
+		hw.stop();
+		hw.runArm(0);
+		step = STEP_IDLE;
+		stepCount = 0;
+		result = how;
+	}
+
+	/**
+	 * LINE FOLLOWING
+	 * Drive along the line, speeding up the wheel on the side that drifted
+	 * onto it. The first move from standstill starts with a short boost.
+	 */
+	void followLine(unsigned long now)
+	{
+		uint8_t sensors = hw.readSensors();
+		int16_t leftSpeed = step == STEP_ADVANCE ? motorSpeed1 : motorSpeed1B;
+		int16_t rightSpeed = step == STEP_ADVANCE ? -motorSpeed : -motorSpeedB;
+		if (step == STEP_SCAN_BACKWARD)
+		{
+			leftSpeed = -leftSpeed;
+			rightSpeed = -rightSpeed;
+		}
+
+		if (sensors == 0)
+		{
+			if (firstMove)
+			{
+				hw.drive(leftSpeed > 0 ? boostSpeed : -boostSpeed, rightSpeed > 0 ? boostSpeed : -boostSpeed);
+				boostUntil = now + boostDuration;
+				firstMove = false;
+				return;
+			}
+			hw.drive(leftSpeed, rightSpeed);
+		}
+		else if (sensors == LEFT_SENSOR)
+		{
+			hw.drive(leftSpeed * CORRECTION_FACTOR, rightSpeed);
+		}
+		else if (sensors == RIGHT_SENSOR)
+		{
+			hw.drive(leftSpeed, rightSpeed * CORRECTION_FACTOR);
+		}
+		else if (step != STEP_ADVANCE)
+		{
+			hw.drive(leftSpeed, rightSpeed); // Both on the line; advancing keeps its last command
+		}
+	}
+
+	/**
+	 * SETTLING
+	 * Every CENTER_INTERVAL ms, if a sensor sees the line, nudge the robot for
+	 * CENTER_PULSE ms: forward for the left sensor, then back for the right one.
+	 */
+	void settle(unsigned long now, unsigned long elapsed)
+	{
+		if (!reached(now, nextCheck))
+		{
+			return;
+		}
+		if (nudge(now))
+		{
+			return;
+		}
+		if (nudging)
+		{
+			hw.stop();
+			nudging = false;
+			nextCheck = now + CENTER_INTERVAL;
+			return;
+		}
+		if (elapsed >= steps[current].duration)
+		{
+			finishStep(now);
+			return;
+		}
+		centering = hw.readSensors();
+		nudging = nudge(now);
+		if (!nudging)
+		{
+			nextCheck = now + CENTER_INTERVAL;
+		}
+	}
+
+	// Start the next pending nudge; false if there is none
+	bool nudge(unsigned long now)
+	{
+		if (centering & LEFT_SENSOR)
+		{
+			centering &= ~LEFT_SENSOR;
+			hw.drive(motorSpeed1, motorSpeed);
+		}
+		else if (centering & RIGHT_SENSOR)
+		{
+			centering &= ~RIGHT_SENSOR;
+			hw.drive(-motorSpeed1, -motorSpeed);
+		}
+		else
+		{
+			return false;
+		}
+		nextCheck = now + CENTER_PULSE;
+		return true;
+	}
+
+	/**
+	 * CURVE TURN
+	 * This controls the behavior of the turning / taxi to a new row. It ends
+	 * when both sensors hit a line at the same time, or fails after
+	 * CURVE_TIMEOUT ms if they never do.
+	 */
+	void curve(unsigned long now, unsigned long elapsed)
+	{
+		uint8_t sensors = hw.readSensors();
+		if (sensors == (LEFT_SENSOR | RIGHT_SENSOR))
+		{
+			hw.report("End of curve detected");
+			hw.stop();
+			finishStep(now);
+			return;
+		}
+		if (elapsed >= steps[current].duration)
+		{
+			hw.report("Curve turn timed out");
+			end(RESULT_TIMEOUT);
+			return;
+		}
+
+		if (sensors == LEFT_SENSOR)
+		{
+			hw.drive(TURN_SPEED, TURN_SPEED); // Sharp right turn: left wheel forward, right wheel reverse
+		}
+		else if (sensors == RIGHT_SENSOR)
+		{
+			hw.drive(-TURN_SPEED, -TURN_SPEED); // Sharp left turn: left wheel reverse, right wheel forward
+		}
+		else
+		{
+			hw.drive(TURN_SPEED, -TURN_SPEED); // Both off line - go straight
+		}
+	}
+};
+
+#endif
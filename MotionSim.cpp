@@ -0,0 +1,222 @@
+/**
+ * HOST SIMULATION OF THE MOTION STATE MACHINE
+ * Builds MotionControl.h on a PC against a simulated robot and checks each
+ * command's timing, the curve-turn timeout, abort, and the centring nudges:
+ *
+ *   g++ -std=c++11 -Wall -o motion_sim MotionSim.cpp && ./motion_sim
+ *
+ * Exits with status 1 if a check fails. The Arduino IDE compiles every .cpp
+ * file in the sketch folder, so this file is empty when ARDUINO is defined.
+ */
+#ifndef ARDUINO
+
+#include <stdio.h>
+#include <string.h>
+
+#include "MotionControl.h"
+
+// A robot whose clock only moves when the simulation says so
+class SimulatedRobot : public MotionHardware
+{
+public:
+	unsigned long time;
+	int16_t left, right, arm;
+	int drives;	  // drive() calls
+	uint8_t sensors; // What the sensors see, set by the scenario
+	char lastLine[40];
+
+	SimulatedRobot()
+	{
+		time = 0;
+		left = right = arm = 0;
+		drives = 0;
+		sensors = 0;
+		lastLine[0] = '\0';
+	}
+
+	unsigned long now() { return time; }
+	uint8_t readSensors() { return sensors; }
+	void drive(int16_t leftSpeed, int16_t rightSpeed)
+	{
+		left = leftSpeed;
+		right = rightSpeed;
+		drives++;
+	}
+	void stop() { left = right = 0; }
+	void runArm(int16_t speed) { arm = speed; }
+	void report(const char *line)
+	{
+		printf("    [%6lu ms] %s\n", time, line);
+		strncpy(lastLine, line, sizeof(lastLine) - 1);
+		lastLine[sizeof(lastLine) - 1] = '\0';
+	}
+	bool moving() const { return left != 0 || right != 0 || arm != 0; }
+};
+
+int failures = 0;
+
+void check(bool ok, const char *what)
+{
+	printf("  %s %s\n", ok ? "ok  " : "FAIL", what);
+	if (!ok)
+	{
+		failures++;
+	}
+}
+
+// Call update() once per simulated millisecond until the command ends; returns its duration
+unsigned long runUntilIdle(SimulatedRobot &robot, MotionController &motion, unsigned long limit)
+{
+	unsigned long start = robot.time;
+	while (motion.busy() && robot.time - start < limit)
+	{
+		robot.time++;
+		motion.update();
+	}
+	return robot.time - start;
+}
+
+bool near(unsigned long value, unsigned long expected)
+{
+	return value + 30 >= expected && value <= expected + 30;
+}
+
+void testCommandTimes()
+{
+	printf("Command durations\n");
+	SimulatedRobot robot;
+	MotionController motion(robot);
+
+	motion.start('1', 1400, 1350);
+	check(strcmp(motion.stepName(), "scan_forward") == 0, "'1' starts with the forward scan");
+	check(robot.left == boostSpeed && robot.right == -boostSpeed, "first move is boosted");
+	robot.time += boostDuration;
+	motion.update();
+	check(robot.left == motorSpeed1B && robot.right == -motorSpeedB, "boost ends after boostDuration");
+	unsigned long took = runUntilIdle(robot, motion, 20000) + boostDuration;
+	check(near(took, 1400 + 500 + 1350 + 500), "'1' takes both scans plus two settles");
+	check(motion.takeResult() == RESULT_DONE && !robot.moving(), "'1' finishes with the motors stopped");
+	check(motion.takeResult() == RESULT_NONE, "the result is collected once");
+
+	motion.start('1', 200, 300);
+	check(near(runUntilIdle(robot, motion, 20000), 200 + 500 + 300 + 500), "'1' uses the scan times given");
+	motion.takeResult();
+
+	motion.start('2', 1400, 1350);
+	check(robot.arm == -motorSpeed, "'2' lowers the arm first");
+	check(near(runUntilIdle(robot, motion, 20000), 1000 + 500 + 3750 + 1300 + 500), "'2' takes arm moves and a scan");
+	motion.takeResult();
+
+	motion.start('3', 0, 0);
+	check(motion.chipCount == 1 && strcmp(robot.lastLine, "Chip count: 1") == 0, "'3' counts the chip");
+	check(near(runUntilIdle(robot, motion, 20000), 800 + 500), "'3' advances and settles");
+	motion.takeResult();
+
+	motion.start('4', 1400, 1350);
+	check(near(runUntilIdle(robot, motion, 20000), 800 + 500 + 3750), "'4' advances then scans");
+	check(motion.takeResult() == RESULT_DONE && motion.chipCount == 2, "'4' counts the chip too");
+
+	check(!motion.start('5', 0, 0), "unknown commands are refused");
+}
+
+void testCurve()
+{
+	printf("Curve turns\n");
+	SimulatedRobot robot;
+	MotionController motion(robot);
+	motion.chipCount = 9;
+
+	motion.start('3', 0, 0);
+	check(strcmp(motion.stepName(), "curve") == 0, "chip 10 takes a curve");
+	check(robot.left == TURN_SPEED && robot.right == -TURN_SPEED, "straight while both sensors are off");
+	while (robot.time < 4000)
+	{
+		robot.time++;
+		robot.sensors = robot.time > 3000 ? LEFT_SENSOR : 0;
+		motion.update();
+	}
+	check(robot.left == TURN_SPEED && robot.right == TURN_SPEED, "sharp right when the left sensor sees the line");
+	robot.sensors = LEFT_SENSOR | RIGHT_SENSOR;
+	runUntilIdle(robot, motion, 100);
+	check(motion.takeResult() == RESULT_DONE && !robot.moving(), "ends when both sensors see the line");
+	robot.sensors = 0;
+
+	motion.chipCount = 19;
+	motion.start('4', 1400, 1350);
+	unsigned long took = runUntilIdle(robot, motion, 60000);
+	check(near(took, CURVE_TIMEOUT), "a curve that never finds the line stops at CURVE_TIMEOUT");
+	check(motion.takeResult() == RESULT_TIMEOUT, "and reports a timeout");
+	check(!robot.moving() && !motion.busy(), "with the motors stopped and the scan dropped");
+	check(strcmp(robot.lastLine, "Curve turn timed out") == 0, "and tells the host");
+}
+
+void testAbort()
+{
+	printf("Abort and status\n");
+	SimulatedRobot robot;
+	MotionController motion(robot);
+
+	motion.start('2', 1400, 1350);
+	while (robot.time < 2000)
+	{
+		robot.time++;
+		motion.update();
+	}
+	check(strcmp(motion.stepName(), "scan_forward") == 0 && motion.stepElapsed() == 500,
+		  "status mid-command shows the step and time in it");
+	check(motion.activeCommand() == '2', "and the command");
+	motion.abort();
+	check(!motion.busy() && !robot.moving(), "abort stops the wheels and arm at once");
+	check(motion.takeResult() == RESULT_ABORTED, "and reports it");
+	int drives = robot.drives;
+	runUntilIdle(robot, motion, 1000);
+	robot.time += 1000;
+	motion.update();
+	check(robot.drives == drives && strcmp(motion.stepName(), "idle") == 0, "nothing more runs after abort");
+	check(motion.start('1', 100, 100), "a new command can start after abort");
+	motion.abort();
+	motion.takeResult();
+}
+
+void testSettle()
+{
+	printf("Settling\n");
+	SimulatedRobot robot;
+	MotionController motion(robot);
+
+	motion.start('1', 100, 100);
+	while (strcmp(motion.stepName(), "settle") != 0)
+	{
+		robot.time++;
+		motion.update();
+	}
+	robot.sensors = LEFT_SENSOR;
+	for (unsigned long i = 0; i < CENTER_INTERVAL && robot.left == 0; i++)
+	{
+		robot.time++;
+		motion.update();
+	}
+	check(robot.left == motorSpeed1 && robot.right == motorSpeed, "left sensor on the line: nudge forward");
+	robot.sensors = 0;
+	for (unsigned long i = 0; i <= CENTER_PULSE; i++)
+	{
+		robot.time++;
+		motion.update();
+	}
+	check(!robot.moving(), "the nudge stops after CENTER_PULSE");
+	check(strcmp(motion.stepName(), "settle") == 0, "and settling continues");
+	runUntilIdle(robot, motion, 20000);
+	check(motion.takeResult() == RESULT_DONE, "the command still finishes");
+}
+
+int main()
+{
+	testCommandTimes();
+	testCurve();
+	testAbort();
+	testSettle();
+	printf(failures ? "%d check(s) failed\n" : "All checks passed\n", failures);
+	return failures ? 1 : 0;
+}
+
+#endif
@@ -0,0 +1,210 @@
+import tkinter as tk
+
+from ImageCache import ImageCache
+
+
+class PyramidViewer(tk.Frame):
+    """Pan-and-zoom view of an ImagePyramid (see ImagePyramid.py).
+
+    The view is at a zoom step. Step z >= 0 shows pyramid level z with one
+    screen pixel per level pixel, and step z < 0 magnifies full resolution
+    by 2**-z. Every step is drawn as a grid of tile-sized images, and only
+    the tiles in or next to the viewport are read and converted. Converted
+    tiles stay in an LRU cache. After each change, the tiles the neighbouring
+    steps would show are converted in idle time, one per idle callback, so
+    stepping in or out is usually drawn straight from the cache.
+
+    Zoom with the buttons or the mouse wheel (around the pointer), and drag
+    to pan. The focus area is outlined in green.
+    """
+
+    MAX_MAGNIFICATION_STEPS = 4  # Up to 16x full resolution
+    OVERSCAN = 1  # Tiles kept beyond each edge of the viewport
+
+    def __init__(self, master, width=600, height=500, cache_bytes=32 * 1024 * 1024):
+        super().__init__(master)
+        self.pyramid = None
+        self.step = 0
+        self.tiles = {}  # (row, col) -> canvas item of the current step
+        self.cache = ImageCache(max_bytes=cache_bytes)
+        self.prefetching = None  # after_idle id of the neighbour prefetch
+
+        self.canvas = tk.Canvas(self, width=width, height=height, bg='black', highlightthickness=0)
+        self.canvas.pack()
+        controls = tk.Frame(self)
+        controls.pack(pady=5)
+        tk.Button(controls, text="Zoom Out", command=lambda: self.set_step(self.step + 1),
+                  font=("Arial", 12)).pack(side='left', padx=5)
+        self.zoom_label = tk.Label(controls, font=("Arial", 12), width=8)
+        self.zoom_label.pack(side='left')
+        tk.Button(controls, text="Zoom In", command=lambda: self.set_step(self.step - 1),
+                  font=("Arial", 12)).pack(side='left', padx=5)
+
+        self.canvas.configure(xscrollcommand=lambda *args: self.render_visible(),
+                              yscrollcommand=lambda *args: self.render_visible())
+        self.canvas.bind("<Configure>", lambda event: self.render_visible())
+        self.canvas.bind("<ButtonPress-1>", lambda event: self.canvas.scan_mark(event.x, event.y))
+        self.canvas.bind("<B1-Motion>", lambda event: self.canvas.scan_dragto(event.x, event.y, gain=1))
+        self.canvas.bind("<MouseWheel>", lambda event: self.set_step(
+            self.step + (1 if event.delta < 0 else -1), (event.x, event.y)))
+        self.canvas.bind("<Button-4>", lambda event: self.set_step(self.step - 1, (event.x, event.y)))
+        self.canvas.bind("<Button-5>", lambda event: self.set_step(self.step + 1, (event.x, event.y)))
+
+    def show(self, pyramid):
+        """Show `pyramid` at the step where its focus area about fills the view, centred on it."""
+        self.pyramid = pyramid
+        self.clear_tiles()
+        view = min(self.viewport())
+        step = 0
+        while pyramid.focus_size * 2.0 ** -step > view and step < len(pyramid.sizes) - 1:
+            step += 1
+        while pyramid.focus_size * 2.0 ** -(step - 1) <= view and step > -self.MAX_MAGNIFICATION_STEPS:
+            step -= 1
+        y, x = pyramid.focus_pos
+        half = pyramid.focus_size / 2
+        self.step = None
+        self.set_step(step, center=(x + half, y + half))
+
+    def clear(self):
+        """Forget the pyramid, e.g. before its files are deleted."""
+        self.clear_tiles()
+        self.pyramid = None
+
+    def viewport(self):
+        """Size of the canvas on screen, or as configured before it is first drawn."""
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return int(self.canvas.cget('width')), int(self.canvas.cget('height'))
+        return width, height
+
+    def scale(self, step):
+        """Screen pixels per full-resolution pixel at `step`."""
+        return 2.0 ** -step
+
+    def display_size(self, step):
+        if step >= 0:
+            return self.pyramid.sizes[step]
+        magnification = 2 ** -step
+        return self.pyramid.width * magnification, self.pyramid.height * magnification
+
+    def view_center(self, anchor=None):
+        """Full-resolution point under `anchor` (widget x, y; default the centre of the view)."""
+        if anchor is None:
+            anchor = tuple(side / 2 for side in self.viewport())
+        scale = self.scale(self.step)
+        return self.canvas.canvasx(anchor[0]) / scale, self.canvas.canvasy(anchor[1]) / scale
+
+    def set_step(self, step, anchor=None, center=None):
+        """
+        Change the zoom step, keeping the point under `anchor` (widget
+        coordinates) where it is, or putting full-resolution point `center`
+        in the middle of the view.
+        """
+        if self.pyramid is None:
+            return
+        step = max(-self.MAX_MAGNIFICATION_STEPS, min(step, len(self.pyramid.sizes) - 1))
+        if step == self.step:
+            return
+        if center is None:
+            point = self.view_center(anchor)
+        else:
+            point = center
+        if anchor is None:
+            anchor = tuple(side / 2 for side in self.viewport())
+        self.step = step
+        self.clear_tiles()
+
+        width, height = self.display_size(step)
+        scale = self.scale(step)
+        self.canvas.configure(scrollregion=(0, 0, width, height))
+        self.canvas.xview_moveto((point[0] * scale - anchor[0]) / width)
+        self.canvas.yview_moveto((point[1] * scale - anchor[1]) / height)
+
+        y, x = self.pyramid.focus_pos
+        size = self.pyramid.focus_size
+        self.canvas.create_rectangle(x * scale, y * scale, (x + size) * scale, (y + size) * scale,
+                                     outline='#00ff00', width=2, tags='focus')
+        self.zoom_label.config(text=f"{2 ** -step}x" if step <= 0 else f"1:{2 ** step}")
+        self.render_visible()
+        self.start_prefetch()
+
+    def visible_tiles(self, step, x0, y0, x1, y1, overscan=0):
+        """(row, col) of the tiles of `step` overlapping canvas area (x0, y0)-(x1, y1)."""
+        size = self.pyramid.tile_size
+        width, height = self.display_size(step)
+        rows, cols = -(-int(height) // size), -(-int(width) // size)
+        first_row = max(0, int(y0 // size) - overscan)
+        first_col = max(0, int(x0 // size) - overscan)
+        last_row = min(rows, int(y1 // size) + 1 + overscan)
+        last_col = min(cols, int(x1 // size) + 1 + overscan)
+        return [(row, col) for row in range(first_row, last_row) for col in range(first_col, last_col)]
+
+    def render_visible(self):
+        """Draw the tiles in and around the viewport and drop the ones far from it."""
+        if self.pyramid is None or self.step is None:
+            return
+        x0, y0 = self.canvas.canvasx(0), self.canvas.canvasy(0)
+        width, height = self.viewport()
+        x1, y1 = x0 + width, y0 + height
+        wanted = set(self.visible_tiles(self.step, x0, y0, x1, y1, self.OVERSCAN))
+        for key in list(self.tiles):
+            if key not in wanted:
+                self.canvas.delete(self.tiles.pop(key))
+        size = self.pyramid.tile_size
+        for row, col in sorted(wanted - set(self.tiles)):
+            photo = self.tile_photo(self.step, row, col)
+            self.tiles[(row, col)] = self.canvas.create_image(col * size, row * size, image=photo, anchor='nw')
+        self.canvas.tag_raise('focus')
+
+    def tile_photo(self, step, row, col):
+        key = (self.pyramid.path, step, row, col)
+        photo = self.cache.get(key)
+        if photo is None:
+            photo = self.build_tile(step, row, col)
+            self.cache.put(key, photo)
+        return photo
+
+    def build_tile(self, step, row, col):
+        """Read and convert one tile; magnified steps enlarge part of a full-resolution tile."""
+        from PIL import Image, ImageTk
+        size = self.pyramid.tile_size
+        if step >= 0:
+            image = Image.fromarray(self.pyramid.tile(step, row, col))
+        else:
+            magnification = 2 ** -step
+            span = size // magnification
+            tile = self.pyramid.tile(0, row // magnification, col // magnification)
+            y, x = (row % magnification) * span, (col % magnification) * span
+            image = Image.fromarray(tile[y:y + span, x:x + span]).resize((size, size), Image.NEAREST)
+        return ImageTk.PhotoImage(image, master=self)
+
+    def clear_tiles(self):
+        if self.prefetching is not None:
+            self.after_cancel(self.prefetching)
+            self.prefetching = None
+        self.canvas.delete('all')
+        self.tiles = {}
+
+    def start_prefetch(self):
+        """Convert, in idle time, the tiles the next step in and out would show."""
+        width, height = self.viewport()
+        center_x, center_y = self.view_center()
+        pending = []
+        for step in (self.step - 1, self.step + 1):
+            if -self.MAX_MAGNIFICATION_STEPS <= step < len(self.pyramid.sizes):
+                scale = self.scale(step)
+                x0, y0 = center_x * scale - width / 2, center_y * scale - height / 2
+                pending += [(step, row, col) for row, col in
+                            self.visible_tiles(step, x0, y0, x0 + width, y0 + height)]
+
+        def prefetch_one():
+            self.prefetching = None
+            while pending:
+                step, row, col = pending.pop(0)
+                if (self.pyramid.path, step, row, col) not in self.cache:
+                    self.tile_photo(step, row, col)
+                    break
+            if pending:
+                self.prefetching = self.after_idle(prefetch_one)
+
+        self.prefetching = self.after_idle(prefetch_one)
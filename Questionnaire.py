@@ -0,0 +1,148 @@
+import json
+import tkinter as tk
+
+
+def load_questionnaires(path):
+    """Read the instrument definitions (see QUESTIONNAIRES.json)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class QuestionnaireView(tk.Frame):
+    """Renders one instrument from QUESTIONNAIRES.json.
+
+    Every item has a fixed slot in a scrolling canvas, but widgets are only
+    built for the items near the viewport and are destroyed again once they
+    scroll far away. Answers are written to `data` as `<key>_<n>` the moment
+    they change, so nothing is lost when an item's widgets go away.
+    """
+
+    OVERSCAN = 2  # Items built beyond each edge of the viewport
+    LEFT = 20
+
+    def __init__(self, master, name, spec, data, on_submit, on_select=None):
+        super().__init__(master)
+        self.spec = spec
+        self.data = data
+        self.on_submit = on_submit
+        self.on_select = on_select
+        self.key = spec.get('key', name)
+        self.items = spec['items']
+        self.built = {}  # item index -> (canvas window id, frame)
+
+        self.variables = []
+        for i in range(len(self.items)):
+            value = data.get(self.item_key(i), spec.get('default', -1))
+            self.variables.append(tk.IntVar(master=self, value=value))
+
+        if 'title' in spec:
+            tk.Label(self, text=spec['title'], font=("Arial", 18)).pack(pady=30)
+
+        outer_frame = tk.Frame(self, relief="groove", bd=1)
+        outer_frame.pack(fill="both", expand=True)
+        self.canvas = tk.Canvas(outer_frame)
+        scrollbar = tk.Scrollbar(outer_frame, orient="vertical", command=self.canvas.yview)
+        scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        # Intro text is short, so it is built up front above the items
+        header = tk.Frame(self.canvas)
+        for text in spec.get('intro', []):
+            tk.Label(header, text=text, font=("Arial", 16), wraplength=700,
+                     justify='left').pack(pady=10, anchor='w')
+        self.canvas.create_window((self.LEFT, 0), window=header, anchor='nw')
+        header.update_idletasks()
+        self.top = header.winfo_reqheight()
+        self.row_height = self.measure_row_height()
+
+        bottom = self.top + len(self.items) * self.row_height
+        submit = tk.Button(self.canvas, text="Submit", command=self.submit,
+                           font=("Arial", 20), width=15)
+        self.canvas.create_window((self.LEFT + 200, bottom + 20), window=submit, anchor='nw')
+        self.height = bottom + 100
+        self.canvas.configure(scrollregion=(0, 0, 760, self.height))
+
+        def on_scroll(first, last):
+            scrollbar.set(first, last)
+            self.render_visible()
+
+        # Set last: the measurements above run idle tasks that may call it
+        self.canvas.configure(yscrollcommand=on_scroll)
+
+        self.canvas.bind("<Configure>", lambda e: self.render_visible())
+        self.canvas.bind_all(  # so the scrollwheel scrolls wherever the pointer is
+            "<MouseWheel>", lambda event: self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units"))
+        self.canvas.bind_all("<Button-4>", lambda event: self.canvas.yview_scroll(-1, "units"))
+        self.canvas.bind_all("<Button-5>", lambda event: self.canvas.yview_scroll(1, "units"))
+        self.bind("<Destroy>", self.unbind_scrolling)
+
+    def item_key(self, i):
+        return f"{self.key}_{i + 1}"
+
+    def build_item(self, i):
+        frame = tk.Frame(self.canvas)
+        text = f"{i + 1}. {self.items[i]}" if self.spec.get('numbered') else self.items[i]
+        tk.Label(frame, text=text, font=("Arial", 14), wraplength=700,
+                 justify='left').pack(pady=(10, 5), anchor='w')
+        variable = self.variables[i]
+        if self.spec['type'] == 'slider':
+            tk.Scale(frame, from_=self.spec['from'], to=self.spec['to'], orient=tk.HORIZONTAL,
+                     length=500, font=("Arial", 14), tickinterval=1, showvalue=False,
+                     variable=variable, command=lambda v, i=i: self.select(i)).pack(padx=50, anchor='w')
+        else:
+            for value, choice in enumerate(self.spec['choices']):
+                tk.Radiobutton(frame, text=choice, variable=variable, value=value,
+                               command=lambda i=i: self.select(i),
+                               font=("Arial", 12)).pack(anchor='w', padx=50)
+        return frame
+
+    def measure_row_height(self):
+        """Height of the tallest item, used as the slot size for every item."""
+        longest = max(range(len(self.items)), key=lambda i: len(self.items[i]))
+        frame = self.build_item(longest)
+        frame.update_idletasks()
+        height = frame.winfo_reqheight() + 10
+        frame.destroy()
+        return height
+
+    def render_visible(self):
+        """Build the items near the viewport and drop the ones far from it."""
+        view_top = self.canvas.canvasy(0)
+        view_bottom = view_top + self.canvas.winfo_height()
+        first = max(0, int((view_top - self.top) // self.row_height) - self.OVERSCAN)
+        last = min(len(self.items), int((view_bottom - self.top) // self.row_height) + 1 + self.OVERSCAN)
+
+        for i in list(self.built):
+            if i < first - self.OVERSCAN or i >= last + self.OVERSCAN:
+                window, frame = self.built.pop(i)
+                self.canvas.delete(window)
+                frame.destroy()
+        for i in range(first, last):
+            if i not in self.built:
+                frame = self.build_item(i)
+                window = self.canvas.create_window((self.LEFT, self.top + i * self.row_height),
+                                                   window=frame, anchor='nw')
+                self.built[i] = (window, frame)
+
+    def select(self, i):
+        value = self.variables[i].get()
+        self.data[self.item_key(i)] = value
+        if self.on_select:
+            self.on_select(self.item_key(i), value)
+
+    def submit(self):
+        if self.spec.get('record_defaults'):
+            for i, variable in enumerate(self.variables):
+                self.data[self.item_key(i)] = variable.get()
+        if self.spec.get('required'):
+            missing = [i for i in range(len(self.items)) if self.item_key(i) not in self.data]
+            if missing:
+                # Scroll to the first unanswered item instead of turning the page
+                self.canvas.yview_moveto((self.top + missing[0] * self.row_height) / self.height)
+                return
+        self.on_submit()
+
+    def unbind_scrolling(self, event):
+        if event.widget is self:
+            for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                self.canvas.unbind_all(sequence)
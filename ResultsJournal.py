@@ -0,0 +1,176 @@
+import csv
+import os
+import queue
+import threading
+
+from Tracing import tracer
+
+FIELDNAMES = [
+    'trial_number', 'trial_type', 'percentage',
+    'is_salient', 'response', 'is_correct', 'zoom_used',
+    'session_id', 'timestamp'
+]
+
+_STOP = object()
+
+
+class ResultsJournal:
+    """Append-only results file written by a background thread.
+
+    Every row is appended (and flushed) as soon as it is recorded, so the file
+    is never rewritten. ``fsync`` is batched: it runs every ``sync_every`` rows,
+    after ``sync_interval`` seconds without new rows, and on ``flush``/``close``.
+
+    If the main file cannot be written the journal falls back to the backup
+    file, copies every row recorded so far into it, and keeps appending there.
+
+    With an ``executor`` the rows are written by short jobs on that shared pool
+    instead of a dedicated thread. A job drains the queue and syncs once it is
+    empty, so ``sync_interval`` is not used.
+    """
+
+    def __init__(self, filename, backup_filename, sync_every=10, sync_interval=2.0, executor=None):
+        self.filename = filename
+        self.backup_filename = backup_filename
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.rows = []  # Every row handed to the writer, kept for the backup fallback
+        self.closed = False
+        self._file = None
+        self._writer = None
+        self._unsynced = 0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._executor = executor
+        self._draining = False  # A drain job is queued or running on the executor
+        self._lock = threading.Lock()
+        if executor is None:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def append(self, row):
+        """Queue one row for writing; returns immediately."""
+        if not self.closed:
+            self._put(dict(row))
+
+    def flush(self, timeout=5):
+        """Block until every queued row is on disk."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self._put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5):
+        if self.closed:
+            return
+        self.closed = True
+        self._put(_STOP)
+        self._stopped.wait(timeout)
+
+    def _put(self, item):
+        self._queue.put(item)
+        if self._executor is None:
+            return
+        with self._lock:
+            if self._draining:
+                return
+            self._draining = True
+        self._executor.submit(self._drain)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.sync_interval)
+            except queue.Empty:
+                self._sync()
+                continue
+            if not self._handle(item):
+                return
+
+    def _drain(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                self._sync()
+                with self._lock:
+                    # A row queued after get_nowait() is picked up by this job
+                    if self._queue.empty():
+                        self._draining = False
+                        return
+                continue
+            if not self._handle(item):
+                return
+
+    def _handle(self, item):
+        """Process one queued item; returns False once the journal is closed."""
+        if item is _STOP:
+            self._sync()
+            if self._file:
+                self._file.close()
+            self._stopped.set()
+            return False
+        if isinstance(item, threading.Event):
+            self._sync()
+            item.set()
+            return True
+        self.rows.append(item)
+        with tracer.span("journal write"):
+            self._write(item)
+        if self._unsynced >= self.sync_every:
+            self._sync()
+        return True
+
+    def _open(self, filename, rows=()):
+        f = open(filename, 'a', newline='')
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        if f.tell() == 0:
+            writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+        f.flush()
+        self._file, self._writer = f, writer
+
+    def _write(self, row):
+        try:
+            if self._file is None:
+                self._open(self.filename)
+            self._writer.writerow(row)
+            self._file.flush()
+            self._unsynced += 1
+        except OSError as e:
+            print(f"Error saving results: {e}")
+            self._fall_back()
+
+    def _fall_back(self):
+        """Move to the backup file, copying every row recorded so far."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        if self.filename == self.backup_filename:
+            return  # Already on the backup; rows stay in memory
+        self.filename = self.backup_filename
+        try:
+            # Start the backup from scratch so it holds exactly this session's rows
+            if os.path.exists(self.backup_filename):
+                os.remove(self.backup_filename)
+            self._open(self.backup_filename, self.rows)
+            self._unsynced = len(self.rows)
+            self._sync()
+        except OSError as backup_error:
+            print(f"Error saving backup: {backup_error}")
+            self._file = None
+
+    def _sync(self):
+        if self._file is None or not self._unsynced:
+            return
+        try:
+            with tracer.span("journal fsync", rows=self._unsynced):
+                os.fsync(self._file.fileno())
+            self._unsynced = 0
+        except OSError as e:
+            print(f"Error saving results: {e}")
+            self._fall_back()
@@ -0,0 +1,375 @@
+import argparse
+import os
+import threading
+import time
+import tty
+
+from RobotLink import COMPLETION_MESSAGES, crc16
+
+# Timings in milliseconds, taken from AnthroFraming_09-04-24.ino
+SETTLE_TIME = 500  # delayWithChecks(500) after every motion
+FORWARD_SCAN_TIME = 1400
+BACKWARD_SCAN_TIME = 1350
+NEXT_CHIP_TIME = 800
+LOWER_ARM_TIME = 1000
+RAISE_ARM_TIME = 1300
+# A curve turn runs until both sensors see the line; this is a typical run on the mat
+CURVE_TURN_TIME = 4000
+CURVE_TIMEOUT = 10000  # MotionControl.h gives up on the curve after this
+
+# chipCount values at which nextChip() takes a curve to the next row
+CURVE_CHIPS = (10, 20)
+
+# Wheel commands (left, right) the sketch gives while moving
+SCAN_FORWARD_MOTORS = (44, -42)    # motorSpeed1B, -motorSpeedB
+SCAN_BACKWARD_MOTORS = (-44, 42)
+NEXT_CHIP_MOTORS = (61, -60)       # motorSpeed1, -motorSpeed
+CURVE_MOTORS = (100, -100)         # TURN_SPEED
+TELEMETRY_INTERVAL = 20
+
+PROTOCOL_VERSION = 3
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200)
+
+
+class MotionStopped(Exception):
+    """A motion ended early; the argument is the NACK reason ('aborted' or 'timeout')."""
+
+
+class RobotEmulator:
+    """Stands in for the MeMegaPi on a pseudo-terminal.
+
+    The emulator holds the master side of a pty and runs the sketch's loop()
+    on a background thread; `port` is the path of the slave side, which can be
+    opened with pyserial exactly like the robot's Bluetooth port. Commands,
+    printed status lines, the chipCount curve turns and motion durations follow
+    the firmware, including the framed protocol (a pty has no real baud rate,
+    so 'B' is only acknowledged) and telemetry samples of the wheel commands.
+    `time_scale` speeds everything up (10 = ten times faster).
+
+    As in the firmware's motion state machine (MotionControl.h), motions run
+    on their own thread while commands keep being read: status and abort are
+    answered mid-motion, one motion command can queue behind the running one,
+    and a curve turn longer than CURVE_TIMEOUT (see `curve_time`) fails with
+    NACK:timeout.
+
+    Needs a POSIX system (os.openpty).
+    """
+
+    def __init__(self, time_scale=1.0, curve_time=CURVE_TURN_TIME):
+        self.time_scale = time_scale
+        self.curve_time = curve_time
+        self.chip_count = 0
+        self.led = False
+        self.last_seq = None
+        self.telemetry = False
+        self.motors = (0, 0)
+        self.sensors = 0  # Bit 0 left, bit 1 right
+        self.step = 'idle'  # See MotionController::stepName()
+        self.step_started = 0
+        self.last_reply = "DONE"
+        self.active = None  # (seq or None for a bare byte, command, args) being run
+        self.queued = None
+        self._changed = threading.Condition()
+        self._abort = threading.Event()
+        self._started = time.monotonic()
+        self.master, self._slave = os.openpty()
+        tty.setraw(self._slave)  # No echo, so the robot never reads back its own output
+        self.port = os.ttyname(self._slave)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._motion = threading.Thread(target=self._motions, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._sampler.start()
+        self._motion.start()
+
+    def millis(self):
+        return int((time.monotonic() - self._started) * 1000 * self.time_scale)
+
+    def _sample(self):
+        # sendTelemetry(); one os.write per sample, so lines are never split
+        while True:
+            self.wait(TELEMETRY_INTERVAL)
+            if not self.telemetry or not self.led:
+                continue  # The sketch only samples inside its motion loops
+            ms = self.millis()
+            left, right = (m & 0xFF for m in self.motors)
+            packet = [0xA5, ms & 0xFF, ms >> 8 & 0xFF, self.sensors, left, right]
+            packet.append(sum(packet[1:]) & 0xFF)
+            try:
+                os.write(self.master, bytes(packet))
+            except OSError:
+                return
+
+    def println(self, text):
+        os.write(self.master, (text + "\r\n").encode('ascii'))
+
+    def wait(self, ms):
+        time.sleep(ms / 1000 / self.time_scale)
+
+    def send_frame(self, seq, body):
+        text = f"{seq}:{body}"
+        self.println(f"!{text}*{crc16(text.encode('ascii')):04X}")
+
+    def motion_wait(self, ms):
+        """Wait inside a motion; raises MotionStopped if it is aborted meanwhile."""
+        if self._abort.wait(ms / 1000 / self.time_scale):
+            raise MotionStopped('aborted')
+
+    def enter(self, step):
+        self.step = step
+        self.step_started = self.millis()
+
+    def move(self, step, motors, ms):
+        self.enter(step)
+        self.motors = motors
+        try:
+            self.motion_wait(ms)
+        finally:
+            self.motors = (0, 0)
+
+    def settle(self):
+        self.enter('settle')
+        self.motion_wait(SETTLE_TIME)
+
+    def scan_chip(self, forward_time=FORWARD_SCAN_TIME, backward_time=BACKWARD_SCAN_TIME):
+        self.move('scan_forward', SCAN_FORWARD_MOTORS, forward_time)
+        self.settle()
+        self.move('scan_backward', SCAN_BACKWARD_MOTORS, backward_time)
+        self.settle()
+
+    def lower_arm(self):
+        self.enter('lower_arm')
+        self.motion_wait(LOWER_ARM_TIME)
+        self.settle()
+
+    def raise_arm(self):
+        self.enter('raise_arm')
+        self.motion_wait(RAISE_ARM_TIME)
+        self.settle()
+
+    def curve_turn(self):
+        self.println("Starting curve turn sequence")
+        if self.curve_time >= CURVE_TIMEOUT:
+            self.move('curve', CURVE_MOTORS, CURVE_TIMEOUT)
+            self.println("Curve turn timed out")
+            raise MotionStopped('timeout')
+        self.move('curve', CURVE_MOTORS, self.curve_time)
+        self.sensors = 3  # Both sensors on the line
+        self.println("End of curve detected")
+        self.wait(TELEMETRY_INTERVAL)
+        self.sensors = 0
+
+    def next_chip(self):
+        self.chip_count += 1
+        self.println(f"Chip count: {self.chip_count}")
+        if self.chip_count in CURVE_CHIPS:
+            self.println("Executing curve turn")
+            self.curve_turn()
+            return
+        self.move('advance', NEXT_CHIP_MOTORS, NEXT_CHIP_TIME)
+        self.settle()
+
+    def run_command(self, command, forward_time=FORWARD_SCAN_TIME, backward_time=BACKWARD_SCAN_TIME):
+        """
+        The steps MotionController::start() plans for a motion command.
+        Returns None when they finish, or the NACK reason if they stop early.
+        """
+        self.led = True
+        try:
+            if command == b'2':
+                self.lower_arm()
+            if command in (b'3', b'4'):
+                self.next_chip()
+            if command != b'3':
+                self.scan_chip(forward_time, backward_time)
+            if command == b'2':
+                self.raise_arm()
+            return None
+        except MotionStopped as stopped:
+            if stopped.args[0] == 'aborted':
+                self.println("Motion aborted")
+            return stopped.args[0]
+        finally:
+            self.step = 'idle'
+            self.led = False
+
+    def reply(self, job, failure):
+        """The sketch's reply(): DONE or NACK for a frame, the completion line for a bare byte."""
+        seq, command, _ = job
+        if seq is None:
+            if failure is None:
+                self.println(COMPLETION_MESSAGES[command])
+            return
+        body = "DONE" if failure is None else f"NACK:{failure}"
+        if seq == self.last_seq:
+            self.last_reply = body
+        self.send_frame(seq, body)
+
+    def accept(self, job):
+        """Start a motion command or queue it behind the running one; False if the queue is full."""
+        with self._changed:
+            if self.active is None:
+                self.active = job
+            elif self.queued is None:
+                self.queued = job
+            else:
+                return False
+            self._changed.notify_all()
+        return True
+
+    def abort(self):
+        """The sketch's abortMotion(); returns once the stopped command has replied."""
+        with self._changed:
+            if self.queued is not None:
+                self.reply(self.queued, 'aborted')
+                self.queued = None
+            job = self.active
+            if job is not None:
+                self._abort.set()
+                self._changed.wait_for(lambda: self.active is not job, timeout=5)
+
+    def status_body(self):
+        with self._changed:
+            command = self.active[1].decode() if self.active is not None and self.step != 'idle' else '-'
+        elapsed = self.millis() - self.step_started if self.step != 'idle' else 0
+        return f"STATUS:{self.step}:{command}:{elapsed}:{self.chip_count}"
+
+    def _motions(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.active is not None)
+                job = self.active
+            failure = self.run_command(job[1], *job[2])
+            with self._changed:
+                self.reply(job, failure)
+                self._abort.clear()
+                self.active, self.queued = self.queued, None
+                self._changed.notify_all()
+
+    def handle(self, command):
+        """The sketch's loop() for a bare command byte."""
+        if command not in COMPLETION_MESSAGES:
+            self.println("Unknown command")
+            return
+        # The sketch leaves the byte unread until the queue has room
+        with self._changed:
+            self._changed.wait_for(lambda: self.queued is None)
+        self.accept((None, command, (FORWARD_SCAN_TIME, BACKWARD_SCAN_TIME)))
+
+    def handle_frame(self, text):
+        """The sketch's handleFrame(), for the text between '#' and the newline."""
+        body, star, crc = text.rpartition('*')
+        if not star:
+            return
+        try:
+            seq = int(body.split(':')[0] or 0)
+        except ValueError:
+            self.send_frame(0, "NACK:format")
+            return
+        try:
+            valid = int(crc, 16) == crc16(body.encode('ascii'))
+        except ValueError:
+            valid = False
+        if not valid:
+            self.send_frame(seq, "NACK:crc")
+            return
+        fields = body.split(':')
+        try:
+            command = fields[1][0].encode('ascii')
+            args = [int(a) for a in fields[2].split(',')] if len(fields) > 2 else []
+        except (IndexError, ValueError):
+            self.send_frame(seq, "NACK:format")
+            return
+        args += [0] * (2 - len(args))
+
+        if seq == self.last_seq:
+            # Retransmission: say again how far the command got
+            self.send_frame(seq, "ACK")
+            with self._changed:
+                running = any(job is not None and job[0] == seq for job in (self.active, self.queued))
+            if not running:
+                self.send_frame(seq, self.last_reply)
+            return
+        if command == b'S':
+            self.send_frame(seq, self.status_body())
+            return
+        if command == b'A':
+            self.send_frame(seq, "ACK")
+            self.abort()
+            self.send_frame(seq, "DONE")
+            return
+        if command == b'B' and args[0] not in BAUD_RATES:
+            self.send_frame(seq, "NACK:baud")
+            return
+        if command not in (b'1', b'2', b'3', b'4', b'B', b'P', b'T'):
+            self.send_frame(seq, "NACK:unknown")
+            return
+        if command in (b'B', b'P', b'T'):
+            self.last_seq = seq
+            self.last_reply = "DONE"
+            if command == b'T':
+                self.telemetry = bool(args[0])
+            self.send_frame(seq, "ACK")
+            self.send_frame(seq, "DONE")
+            return
+        with self._changed:
+            job = (seq, command, (args[0] or FORWARD_SCAN_TIME, args[1] or BACKWARD_SCAN_TIME))
+            if not self.accept(job):
+                self.send_frame(seq, "NACK:busy")
+                return
+            self.last_seq = seq
+            self.send_frame(seq, "ACK")  # Before the motion thread can send its DONE
+
+    def read_line(self):
+        data = b''
+        while not data.endswith(b'\n'):
+            byte = os.read(self.master, 1)
+            if not byte:
+                break
+            data += byte
+        return data.decode('ascii', errors='replace').strip()
+
+    def _run(self):
+        self.println("Ready to receive commands.")
+        while True:
+            try:
+                command = os.read(self.master, 1)
+                if not command:
+                    return
+                if command == b'#':
+                    self.handle_frame(self.read_line())
+                elif command == b'H':
+                    if self.read_line() == "ELLO":
+                        self.last_seq = None
+                        self.telemetry = False
+                        self.send_frame(0, f"HELLO:{PROTOCOL_VERSION}:{BAUD_RATES[-1]}")
+                    else:
+                        self.println("Unknown command")
+                elif command not in (b'\r', b'\n'):
+                    self.handle(command)
+            except OSError:
+                return
+
+    def close(self):
+        os.close(self.master)
+        os.close(self._slave)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate the PCB robot on a pseudo-terminal.")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="speed-up factor for all motions (default: real time)")
+    parser.add_argument('--curve-time', type=int, default=CURVE_TURN_TIME, metavar='MS',
+                        help=f"how long curve turns take; {CURVE_TIMEOUT} or more makes them time out")
+    args = parser.parse_args()
+
+    emulator = RobotEmulator(args.time_scale, args.curve_time)
+    emulator.start()
+    print(f"Robot emulator listening on {emulator.port} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.close()
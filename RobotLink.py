@@ -0,0 +1,503 @@
+import binascii
+import queue
+import threading
+import time
+
+import serial
+
+from SessionRecorder import encode_message
+from Telemetry import split_stream
+from Tracing import tracer
+
+# Lines the firmware prints on Serial3 once a command has finished
+# (see loop() in AnthroFraming_09-04-24.ino)
+COMPLETION_MESSAGES = {
+    b'1': "Normal Motor sequence complete.",
+    b'2': "Zoomed Motor sequence complete.",
+    b'3': "Next chip command complete.",
+    b'4': "Advance and scan complete.",
+}
+
+# Sent on connect. Firmware with the framed protocol answers with a HELLO frame;
+# older firmware prints "Unknown command" once per byte and does nothing else.
+HELLO = b"HELLO\n"
+ACK_TIMEOUT = 1.0  # Seconds to wait for an ACK before sending a frame again
+MAX_TRIES = 3
+WRITE_TIMEOUT = 0.5  # Seconds a write may stall (e.g. a full Bluetooth buffer) before the link counts as dropped
+QUERY_VERSION = 3  # First protocol version that answers status and abort while moving
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE, as computed by crc16() in the sketch."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(seq, command, args=()):
+    """Frame a command for the robot: #seq:command[:arg,arg]*CRC"""
+    body = f"{seq}:{command.decode()}"
+    if args:
+        body += ":" + ",".join(str(int(a)) for a in args)
+    body = body.encode('ascii')
+    return b"#" + body + f"*{crc16(body):04X}\n".encode('ascii')
+
+
+def decode_frame(line):
+    """
+    Parse a reply frame '!seq:KIND[:detail]*CRC' from the robot.
+    Returns (seq, fields), or None if the frame is malformed or fails its CRC.
+    """
+    body, star, crc = line[1:].rpartition('*')
+    if not star:
+        return None
+    try:
+        if int(crc, 16) != crc16(body.encode('ascii')):
+            return None
+        seq, *fields = body.split(':')
+        return int(seq), fields
+    except ValueError:
+        return None
+
+
+class RobotLink:
+    """Owns the serial connection to the robot on a background thread.
+
+    The thread connects (retrying with backoff), reads the robot's status
+    lines, and reconnects if the port drops. Tk is not thread safe, so nothing
+    here touches the GUI: events are put on ``messages`` as ``(kind, value)``
+    tuples and the GUI drains the queue with ``after``:
+
+    * ``('state', state)`` when the connection state changes
+    * ``('line', text)`` for every status line the robot prints
+    * ``('done', command)`` when the last command sent has finished
+    * ``('nack', (command, reason))`` when the robot refused it, or stopped
+      it part way ('aborted', or 'timeout' for a curve turn that never ended)
+    * ``('status', {...})`` answering ``status()``
+
+    On connect the link says HELLO. Firmware that answers uses framed
+    messages with sequence numbers, a CRC and ACK/NACK/DONE replies, so a
+    reply always matches its request, corrupted frames are sent again, and
+    commands can carry arguments. Firmware with protocol version 3 or later
+    also answers ``status()`` and ``abort()`` while the robot moves. Older
+    firmware gets the bare command bytes and its completion lines are matched
+    instead. If ``fast_baud`` is given
+    and the firmware supports it, the link then moves to that speed. With a
+    ``telemetry`` buffer (see Telemetry.py) the link asks the firmware for
+    sensor and motor samples and stores them there as they arrive. A
+    ``recorder`` (see SessionRecorder.py) gets every byte written, every line
+    read and every message.
+
+    With an ``executor`` the read loop runs as a long-lived job on that shared
+    pool instead of on its own thread, holding one worker until ``close``.
+    """
+
+    def __init__(self, port, baud_rate, max_backoff=30, executor=None, fast_baud=None, telemetry=None,
+                 recorder=None):
+        self.port = port
+        self.baud_rate = baud_rate
+        self.fast_baud = fast_baud
+        self.telemetry = telemetry
+        self.recorder = recorder
+        self.max_backoff = max_backoff
+        self.ser = None
+        self.state = 'disconnected'
+        self.framed = False  # Set by the HELLO handshake
+        self.protocol_version = None  # Reported in HELLO by framed firmware
+        self.max_baud = baud_rate  # Highest speed the firmware reported
+        self.current_baud = baud_rate  # Speed the firmware was last left at
+        self.unsent = None  # (command, args) that could not be written, replayed on reconnect
+        self.outstanding = None  # Framed command awaiting its reply, see _write
+        self.queries = {}  # seq -> status or abort request awaiting its reply, see _query
+        self.messages = queue.Queue()
+        self._seq = 0
+        self._received = b''  # Bytes read but not yet split into lines and samples
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = executor
+
+    def start(self):
+        if self._executor is not None:
+            self._executor.submit(self._run)
+        else:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def send(self, command, args=()):
+        """
+        Send a command to the robot; ``args`` (e.g. scan durations in ms) are
+        only used by framed firmware. Returns False if the link is down; the
+        command is then kept and replayed once the robot reconnects.
+        """
+        with self._lock:
+            if self.ser is not None:
+                try:
+                    with tracer.span("serial write", command=command.decode()):
+                        self._write(command, args)
+                    return True
+                except (serial.SerialException, OSError) as e:
+                    print(f"Error: Failed to send command: {e}")
+                    self.outstanding = None  # Never written, so replayed below rather than looked into
+                    self._drop()
+            self.unsent = (command, args)
+            return False
+
+    def status(self):
+        """
+        Ask the robot what it is doing. The answer arrives as a ``('status',
+        {'step', 'command', 'elapsed_ms', 'chip_count'})`` message, where step
+        is e.g. 'scan_forward' or 'idle' and command is None when idle.
+        Returns False if the link is down or the firmware cannot answer.
+        """
+        return self._query(b'S')
+
+    def abort(self):
+        """
+        Stop the robot at once and drop the rest of its command, any command
+        queued behind it and any command waiting for a reconnect. The stopped
+        command ends with ``('nack', (command, 'aborted'))``. Returns False if
+        the link is down or the firmware cannot abort.
+        """
+        with self._lock:
+            self.unsent = None
+        return self._query(b'A')
+
+    def _query(self, command):
+        with self._lock:
+            if self.ser is None or not self.framed or (self.protocol_version or 0) < QUERY_VERSION:
+                return False
+            self._seq = self._seq % 255 + 1
+            frame = encode_frame(self._seq, command)
+            self.queries[self._seq] = {'seq': self._seq, 'command': command, 'frame': frame,
+                                       'sent': time.monotonic(), 'tries': 1, 'acked': False}
+            try:
+                self._write_bytes(self.ser, frame)
+            except (serial.SerialException, OSError) as e:
+                print(f"Error: Failed to send command: {e}")
+                self._drop()
+                return False
+            return True
+
+    def _record(self, kind, **fields):
+        if self.recorder is not None:
+            self.recorder.record(kind, **fields)
+
+    def _emit(self, kind, value):
+        """Hand an event to the GUI."""
+        self._record('msg', message=kind, value=encode_message(kind, value))
+        self.messages.put((kind, value))
+
+    def _write_bytes(self, ser, data):
+        ser.write(data)
+        self._record('tx', data=data.decode('latin-1'))
+
+    def _read_line(self, ser):
+        text = ser.readline().decode('ascii', errors='replace').strip()
+        if text:
+            self._record('rx', line=text)
+        return text
+
+    def _write(self, command, args):
+        # Caller holds self._lock
+        if not self.framed:
+            self._write_bytes(self.ser, command)
+            return
+        self._seq = self._seq % 255 + 1
+        frame = encode_frame(self._seq, command, args)
+        self.outstanding = {'seq': self._seq, 'command': command, 'args': args, 'frame': frame,
+                            'sent': time.monotonic(), 'tries': 1, 'acked': False}
+        self._write_bytes(self.ser, frame)
+
+    def _resend(self, pending, reason):
+        # Caller holds self._lock
+        if pending['tries'] >= MAX_TRIES:
+            print(f"Robot did not take #{pending['seq']} after {MAX_TRIES} tries ({reason})")
+            self._forget(pending)
+            self._emit('nack', (pending['command'], reason))
+            return
+        print(f"Sending #{pending['seq']} again ({reason})")
+        pending['tries'] += 1
+        pending['sent'] = time.monotonic()
+        self._write_bytes(self.ser, pending['frame'])
+
+    def _forget(self, pending):
+        # Caller holds self._lock
+        if pending is self.outstanding:
+            self.outstanding = None
+        else:
+            self.queries.pop(pending['seq'], None)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._emit('state', state)
+
+    def _drop(self):
+        # Caller holds self._lock
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.ser = None
+            # The robot may have the framed command in flight even without an ACK, so it is
+            # kept and _resume() finds out what became of it instead of sending it again
+            if self.outstanding is not None:
+                self.outstanding['interrupted'] = True
+            self.queries = {}
+            self._set_state('disconnected')
+
+    def _handshake(self, ser):
+        """Say HELLO and wait for a framed reply. Returns True for framed firmware."""
+        self._write_bytes(ser, HELLO)
+        deadline = time.monotonic() + 1.5
+        while time.monotonic() < deadline:
+            text = self._read_line(ser)
+            if text.startswith('!'):
+                reply = decode_frame(text)
+                if reply and reply[1][:1] == ['HELLO']:
+                    fields = reply[1]
+                    try:
+                        self.protocol_version = int(fields[1])
+                        self.max_baud = int(fields[2]) if len(fields) > 2 else self.baud_rate
+                    except (IndexError, ValueError):
+                        print(f"Unreadable HELLO from robot: {text!r}; using bare commands")
+                        return False
+                    print(f"Robot speaks the framed protocol (version {fields[1]})")
+                    return True
+            elif text.isascii() and text.isprintable() and text not in ("", "Unknown command"):
+                # Skips old firmware's answer to each HELLO byte and leftover telemetry
+                self._emit('line', text)
+        return False
+
+    def _request(self, ser, command, args=(), timeout=1.0):
+        """Send one framed command during connect and wait for its DONE."""
+        self._seq = self._seq % 255 + 1
+        seq = self._seq
+        self._write_bytes(ser, encode_frame(seq, command, args))
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            text = self._read_line(ser)
+            reply = decode_frame(text) if text.startswith('!') else None
+            if reply and reply[0] == seq and reply[1][0] in ('DONE', 'NACK'):
+                return reply[1][0] == 'DONE'
+        return False
+
+    def _negotiate_baud(self, ser):
+        """Move to fast_baud if the firmware supports it; stay put otherwise."""
+        if not self.fast_baud or ser.baudrate == self.fast_baud:
+            return
+        if self.fast_baud > self.max_baud:
+            print(f"Robot supports at most {self.max_baud} baud; staying at {ser.baudrate}")
+            return
+        previous = ser.baudrate
+        if not self._request(ser, b'B', [self.fast_baud]):
+            print(f"Robot refused {self.fast_baud} baud; staying at {previous}")
+            return
+        ser.baudrate = self.fast_baud
+        if self._request(ser, b'P'):
+            print(f"Link running at {self.fast_baud} baud")
+            return
+        # The sketch goes back to its previous speed if nothing arrives at the new one
+        print(f"No reply at {self.fast_baud} baud; going back to {previous}")
+        ser.baudrate = previous
+        time.sleep(2.5)
+
+    def _connect(self):
+        self._set_state('connecting')
+        try:
+            ser = serial.Serial(self.port, self.current_baud, timeout=1, write_timeout=WRITE_TIMEOUT)
+        except (serial.SerialException, OSError):
+            self._set_state('disconnected')
+            return False
+        print(f"Connected to {self.port}")
+        try:
+            framed = self._handshake(ser)
+            if not framed and ser.baudrate != self.baud_rate:
+                # The robot may have restarted at its default speed
+                ser.baudrate = self.baud_rate
+                framed = self._handshake(ser)
+            if framed:
+                self._negotiate_baud(ser)
+            self.current_baud = ser.baudrate
+            if self.telemetry is not None:
+                if not framed:
+                    print("Telemetry needs firmware with the framed protocol")
+                elif not self._request(ser, b'T', [1]):
+                    print("Robot did not turn on telemetry")
+        except (serial.SerialException, OSError):
+            ser.close()
+            self._set_state('disconnected')
+            return False
+        with self._lock:
+            self.ser = ser
+            self.framed = framed
+            self._received = b''
+            self._set_state('connected')
+            unsent, self.unsent = self.unsent, None
+        if unsent is not None:
+            print(f"Replaying {unsent[0].decode()!r} command lost during disconnect")
+            self.send(*unsent)
+        self._resume()
+        return True
+
+    def _resume(self):
+        """
+        After a reconnect, find out what became of a framed command in flight
+        during the drop. A bare command that was written is not sent again (the
+        robot usually has it already); the GUI's fallback timer moves on instead.
+        """
+        with self._lock:
+            pending = self.outstanding
+            if pending is None or not pending.get('interrupted'):
+                return
+            if not self.framed or (self.protocol_version or 0) < QUERY_VERSION:
+                self.outstanding = None
+                if pending['acked']:
+                    # Older framed firmware only answers HELLO between motions, so it has finished
+                    print(f"#{pending['seq']} finished during the disconnect")
+                    self._emit('done', pending['command'])
+                else:
+                    print(f"Not sending #{pending['seq']} again: the robot may already have run it")
+                return
+        print(f"Asking the robot about #{pending['seq']} after the reconnect")
+        self.status()  # _settle_interrupted() acts on the answer; a new drop keeps it for the next reconnect
+
+    def _handle_reply(self, text):
+        reply = decode_frame(text)
+        with self._lock:
+            pending = self.outstanding
+            if reply is None:
+                print(f"Corrupt frame from robot: {text!r}")
+                return
+            seq, fields = reply
+            if seq in self.queries:
+                self._handle_query_reply(self.queries[seq], fields)
+                return
+            if pending is None or seq != pending['seq']:
+                print(f"Ignoring reply to #{seq}: {':'.join(fields)}")
+                return
+            kind = fields[0]
+            if kind == 'ACK':
+                pending['acked'] = True
+            elif kind == 'DONE':
+                self.outstanding = None
+                self._emit('done', pending['command'])
+            elif kind == 'NACK':
+                reason = fields[1] if len(fields) > 1 else ''
+                if reason == 'crc':
+                    self._resend(pending, reason)
+                else:
+                    self.outstanding = None
+                    self._emit('nack', (pending['command'], reason))
+
+    def _handle_query_reply(self, query, fields):
+        # Caller holds self._lock. An abort's effect is reported by the command it stopped.
+        kind = fields[0]
+        if kind == 'ACK':
+            query['acked'] = True
+        elif kind == 'STATUS':
+            try:
+                step, command, elapsed, chips = fields[1:5]
+                elapsed, chips = int(elapsed), int(chips)
+            except ValueError:
+                # Left pending, so it is asked again like any corrupt frame
+                print(f"Corrupt frame from robot: #{query['seq']}:{':'.join(fields)}")
+                return
+            del self.queries[query['seq']]
+            command = None if command == '-' else command.encode()
+            self._emit('status', {'step': step, 'command': command,
+                                  'elapsed_ms': elapsed, 'chip_count': chips})
+            if self.outstanding is not None and self.outstanding.pop('interrupted', False):
+                self._settle_interrupted(self.outstanding, command)
+        elif kind == 'DONE':
+            del self.queries[query['seq']]
+        elif kind == 'NACK':
+            reason = fields[1] if len(fields) > 1 else ''
+            if reason == 'crc':
+                self._resend(query, reason)
+            else:
+                del self.queries[query['seq']]
+                self._emit('nack', (query['command'], reason))
+
+    def _settle_interrupted(self, pending, running):
+        # Caller holds self._lock. `running` is the command the robot reports after a reconnect.
+        if running == pending['command']:
+            pending['acked'] = True  # Still on it; its DONE comes on the new connection
+            return
+        self.outstanding = None
+        if pending['acked']:
+            # Not running it any more, so its DONE was lost with the old connection
+            print(f"#{pending['seq']} finished during the disconnect")
+            self._emit('done', pending['command'])
+            return
+        print(f"Robot is not running #{pending['seq']}; sending it again")
+        try:
+            self._write(pending['command'], pending['args'])
+        except (serial.SerialException, OSError) as e:
+            print(f"Error: Failed to send command: {e}")
+            self.outstanding = None
+            self._drop()
+            self.unsent = (pending['command'], pending['args'])
+
+    def _handle_line(self, text):
+        if self.framed and text.startswith('!'):
+            self._handle_reply(text)
+            return
+        self._emit('line', text)
+        if not self.framed:
+            for command, message in COMPLETION_MESSAGES.items():
+                if text == message:
+                    self._emit('done', command)
+
+    def _check_ack(self):
+        with self._lock:
+            waiting = list(self.queries.values())
+            if self.outstanding is not None:
+                waiting.append(self.outstanding)
+            for pending in waiting:
+                if (not pending['acked'] and not pending.get('interrupted')
+                        and time.monotonic() - pending['sent'] > ACK_TIMEOUT):
+                    try:
+                        self._resend(pending, 'no ACK')
+                    except (serial.SerialException, OSError) as e:
+                        print(f"Lost connection to {self.port}: {e}")
+                        self._drop()
+                        return
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            ser = self.ser
+            if ser is None:
+                if self._connect():
+                    backoff = 1
+                else:
+                    print(f"Failed to connect to {self.port}. Retrying in {backoff}s...")
+                    self._stop.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            try:
+                data = ser.read(ser.in_waiting or 1)
+            except Exception as e:  # pyserial raises a mix of error types once a port vanishes
+                if self._stop.is_set():
+                    return
+                print(f"Lost connection to {self.port}: {e}")
+                with self._lock:
+                    if self.ser is ser:
+                        self._drop()
+                continue
+            if data:
+                lines, packets, self._received = split_stream(self._received + data)
+                if self.telemetry is not None:
+                    for packet in packets:
+                        self.telemetry.add(packet)
+                for line in lines:
+                    text = line.decode('ascii', errors='replace').strip()
+                    if text:
+                        self._record('rx', line=text)
+                        self._handle_line(text)
+            self._check_ack()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            self._drop()
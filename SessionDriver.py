@@ -0,0 +1,225 @@
+import argparse
+import csv
+import os
+import random
+import time
+import tkinter as tk
+
+from AnthroGUI import SurveyApp
+from Questionnaire import QuestionnaireView
+from ResultsJournal import FIELDNAMES
+from SessionStore import SessionStore
+from Tracing import tracer
+
+
+class ScriptedParticipant:
+    """Answers every screen of a session without a human in the loop."""
+
+    def __init__(self, seed=None, accuracy=0.85, zoom_rate=0.2, think_time=0.0):
+        self.random = random.Random(seed)
+        self.accuracy = accuracy
+        self.zoom_rate = zoom_rate
+        self.think_time = think_time  # Seconds before each action
+
+    def wants_zoom(self):
+        return self.random.random() < self.zoom_rate
+
+    def response(self, percent):
+        correct = "Accept" if percent < 40 else "Reject"
+        if self.random.random() < self.accuracy:
+            return correct
+        return "Reject" if correct == "Accept" else "Accept"
+
+    def answer(self, view):
+        """Fill in every item of a QuestionnaireView."""
+        for i in range(len(view.items)):
+            if view.spec['type'] == 'slider':
+                value = self.random.randint(view.spec['from'], view.spec['to'])
+            else:
+                value = self.random.randrange(len(view.spec['choices']))
+            view.variables[i].set(value)
+            view.select(i)
+
+
+def find_widgets(widget, kind):
+    for child in widget.winfo_children():
+        if isinstance(child, kind):
+            yield child
+        yield from find_widgets(child, kind)
+
+
+def is_shown(widget):
+    """True if the widget and all its parents are managed (it may not be drawn yet)."""
+    while widget.master is not None:
+        if not widget.winfo_manager():
+            return False
+        widget = widget.master
+    return True
+
+
+def click(app, text):
+    """Invoke the button labelled `text` on the current screen."""
+    for button in find_widgets(app, tk.Button):
+        if button.cget('text') == text and is_shown(button):
+            button.invoke()
+            return
+    raise RuntimeError(f"No '{text}' button on screen {app.current_screen!r}")
+
+
+class SessionDriver:
+    """Drives one SurveyApp session from consent to the end screen."""
+
+    POLL_MS = 10
+
+    def __init__(self, app, participant):
+        self.app = app
+        self.participant = participant
+        self.handled = 0  # app.screen_changes value of the last screen acted on
+        self.zoomed = set()  # (is_practice, index) of trials already zoomed
+        self.started = None
+        self.wall_time = None
+
+    def run(self):
+        self.started = time.perf_counter()
+        self.app.after(self.POLL_MS, self.poll)
+        self.app.mainloop()
+        return self.wall_time
+
+    def poll(self):
+        if self.app.screen_changes != self.handled and self.app.current_screen != 'waiting':
+            self.handled = self.app.screen_changes
+            self.app.after(int(self.participant.think_time * 1000), self.act)
+        self.app.after(self.POLL_MS, self.poll)
+
+    def act(self):
+        app = self.app
+        screen = app.current_screen
+        if screen == 'consent':
+            app.signature_entry.insert(0, "Scripted Participant")
+            click(app, "CONTINUE")
+        elif screen in app.questionnaires:
+            view = next(find_widgets(app, QuestionnaireView))
+            self.participant.answer(view)
+            view.submit()
+        elif screen in ('story', 'framing', 'instructions'):
+            click(app, "Continue")
+        elif screen == 'transition':
+            click(app, "Start Main Trials")
+        elif screen == 'postquestionnaire':
+            click(app, "Continue")
+        elif screen in ('trial', 'zoom'):
+            trial = (app.is_practice, app.current_index)
+            if screen == 'trial' and trial not in self.zoomed and self.participant.wants_zoom():
+                self.zoomed.add(trial)
+                app.initiate_zoom_scan()
+                return
+            percent, _ = app.current_trials[app.current_index]
+            if self.participant.response(percent) == "Accept":
+                app.accept_with_next()
+            else:
+                app.reject_with_next()
+        elif screen == 'feedback':
+            app.feedback_text.insert("1.0", "Scripted session.")
+            click(app, "Submit")
+        elif screen == 'end':
+            self.wall_time = time.perf_counter() - self.started
+            app.on_closing()
+
+
+def check_results(app):
+    """Compare the results file with what the app recorded. Returns a list of problems."""
+    problems = []
+    filename = f"pcb_survey_results_{app.session_id}.csv"
+    if os.path.exists(f"pcb_survey_results_{app.session_id}_backup.csv"):
+        problems.append("backup file was used")
+    try:
+        with open(filename, newline='') as f:
+            reader = csv.DictReader(f)
+            header = reader.fieldnames
+            rows = list(reader)
+    except OSError as e:
+        return [f"cannot read {filename}: {e}"]
+
+    if header != FIELDNAMES:
+        problems.append(f"unexpected header {header}")
+    expected = len(app.practice_trials) + len(app.main_trials)
+    if len(rows) != expected:
+        problems.append(f"{len(rows)} rows, expected {expected}")
+    for row, recorded in zip(rows, app.results):
+        if any(row[key] != str(recorded[key]) for key in FIELDNAMES):
+            problems.append(f"row {row['trial_type']} {row['trial_number']} differs from the recorded trial")
+        percent = int(row['percentage'])
+        correct = (row['response'] == "Accept") == (percent < 40)
+        if row['is_correct'] != str(correct):
+            problems.append(f"row {row['trial_type']} {row['trial_number']} has is_correct={row['is_correct']}")
+    timestamps = [row['timestamp'] for row in rows]
+    if timestamps != sorted(timestamps):
+        problems.append("timestamps are out of order")
+    return problems
+
+
+def summarize(values):
+    values = sorted(values)
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"n={len(values):4d}  mean={sum(values) / len(values):7.2f}  p95={p95:7.2f}  max={values[-1]:7.2f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run scripted sessions against the robot emulator.")
+    parser.add_argument('--sessions', type=int, default=1)
+    parser.add_argument('--time-scale', type=float, default=20.0,
+                        help="speed-up factor for the emulated robot")
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help="seconds the participant waits before each action")
+    parser.add_argument('--zoom-rate', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--budget-ms', type=float,
+                        help="fail if the mean trial-screen transition is slower than this")
+    parser.add_argument('--keep-results', action='store_true',
+                        help="keep the results files written by the sessions")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="write a Chrome trace-event timeline of all sessions to FILE")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable(args.trace)
+
+    latencies = {}
+    wall_times = []
+    failures = 0
+    for n in range(args.sessions):
+        session_id = f"driver_{int(time.time())}_{n}"
+        store = SessionStore(":memory:")  # Keep scripted sessions out of pcb_survey.db
+        app = SurveyApp(emulate_robot=True, time_scale=args.time_scale, session_id=session_id, store=store)
+        participant = ScriptedParticipant(args.seed + n, zoom_rate=args.zoom_rate,
+                                          think_time=args.think_time)
+        wall_time = SessionDriver(app, participant).run()
+        store.close()
+        if wall_time is None:
+            print(f"Session {session_id}: window closed before the end screen")
+            failures += 1
+            continue
+        wall_times.append(wall_time)
+        for name, ms in app.transition_times:
+            latencies.setdefault(name, []).append(ms)
+
+        problems = check_results(app)
+        failures += bool(problems)
+        print(f"Session {session_id}: {wall_time:.1f} s, results file "
+              f"{'OK' if not problems else 'FAILED: ' + '; '.join(problems)}")
+        if not args.keep_results:
+            for suffix in ('', '_backup'):
+                path = f"pcb_survey_results_{session_id}{suffix}.csv"
+                if os.path.exists(path):
+                    os.remove(path)
+
+    print("\nScreen transition latency (ms)")
+    for name, values in sorted(latencies.items()):
+        print(f"  {name:18s} {summarize(values)}")
+    if wall_times:
+        print(f"\nSession wall time (s)\n  {'session':18s} {summarize(wall_times)}")
+
+    trial = latencies.get('trial', [])
+    if args.budget_ms and trial and sum(trial) / len(trial) > args.budget_ms:
+        print(f"\nTrial screen mean latency is over the {args.budget_ms} ms budget")
+        failures += 1
+    raise SystemExit(1 if failures else 0)
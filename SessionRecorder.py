@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+
+
+def encode_message(kind, value):
+    """A RobotLink message value as JSON (command bytes become text)."""
+    if kind == 'done':
+        return value.decode()
+    if kind == 'nack':
+        command, reason = value
+        return [command.decode(), reason]
+    if kind == 'status' and value['command'] is not None:
+        return dict(value, command=value['command'].decode())
+    return value
+
+
+def decode_message(kind, value):
+    """Inverse of encode_message()."""
+    if kind == 'done':
+        return value.encode()
+    if kind == 'nack':
+        command, reason = value
+        return (command.encode(), reason)
+    if kind == 'status' and value['command'] is not None:
+        return dict(value, command=value['command'].encode())
+    return value
+
+
+def load_recording(path):
+    """Events of a recording, oldest first."""
+    with open(path, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda event: event['t'])
+
+
+class SessionRecorder:
+    """Writes everything that happens in a session to a JSON-lines file.
+
+    Each line is one event with ``t``, seconds on the monotonic clock since
+    the recording began, and a ``kind``:
+
+    * ``session``: session id, seed and stimulus bank, first in the file
+    * ``screen``: a screen was shown
+    * ``ui``: a participant action, e.g. ``accept_with_next`` or a questionnaire selection
+    * ``connect`` and ``send``: the GUI opened the robot link or sent a command
+    * ``tx`` and ``rx``: bytes written to the robot and lines it sent back
+    * ``msg``: an event the robot link handed to the GUI (see RobotLink)
+
+    The GUI and the robot link both record, so writes are serialized with a
+    lock. Each line is flushed at once and survives a crash. Telemetry
+    samples are not recorded. SessionReplay.py plays a recording back.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = time.monotonic()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, kind, **fields):
+        event = {'t': round(time.monotonic() - self.start, 6), 'kind': kind}
+        event.update(fields)
+        line = json.dumps(event)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,238 @@
+import argparse
+import os
+import queue
+import time
+
+from AnthroGUI import SurveyApp
+from Questionnaire import QuestionnaireView
+from SessionDriver import click, find_widgets, summarize
+from SessionRecorder import decode_message, load_recording
+from SessionStore import SessionStore
+from Tracing import tracer
+
+# Button commands wrapped by SurveyApp.recorded() or recorded by the method itself;
+# they are replayed by calling the method
+METHOD_ACTIONS = {'accept_with_next', 'reject_with_next', 'initiate_zoom_scan', 'show_framing',
+                  'show_instructions', 'normal_scan', 'start_main_trials', 'show_TOROS_questions'}
+
+
+def robot_script(events):
+    """
+    Group the recorded robot messages by what they followed.
+    Returns (messages after connect, [(command, messages after that send)]),
+    each message being (seconds after the connect or send, kind, value).
+    """
+    at_connect = []
+    replies = []
+    current, anchor = at_connect, 0.0
+    for event in events:
+        if event['kind'] == 'connect':
+            anchor = event['t']
+        elif event['kind'] == 'send':
+            current, anchor = [], event['t']
+            replies.append((event['command'].encode(), current))
+        elif event['kind'] == 'msg':
+            kind = event['message']
+            current.append((event['t'] - anchor, kind, decode_message(kind, event['value'])))
+    return at_connect, replies
+
+
+class ReplayLink:
+    """Stands in for RobotLink and plays back what the robot did.
+
+    Each command the app sends releases the messages that followed the same
+    send in the recording, at their recorded delays divided by ``speed``.
+    Messages are delivered on the Tk thread with ``after``.
+    """
+
+    def __init__(self, app, events, speed):
+        self.app = app
+        self.speed = speed
+        self.state = 'disconnected'
+        self.messages = queue.Queue()
+        self.at_connect, self.replies = robot_script(events)
+        self.sent = 0
+
+    def start(self):
+        self.play(self.at_connect)
+
+    def send(self, command, args=()):
+        if self.sent < len(self.replies):
+            recorded, messages = self.replies[self.sent]
+            if recorded != command:
+                print(f"Replay diverged: sent {command.decode()!r} where the recording has {recorded.decode()!r}")
+            self.play(messages)
+        else:
+            print(f"No robot reply recorded for {command.decode()!r}")
+        self.sent += 1
+        return self.state == 'connected'
+
+    def status(self):
+        return False  # Only what the robot did is replayed, not what it would answer
+
+    def abort(self):
+        return False
+
+    def play(self, messages):
+        for delay, kind, value in messages:
+            self.app.after(int(delay / self.speed * 1000), self.deliver, kind, value)
+
+    def deliver(self, kind, value):
+        if kind == 'state':
+            self.state = value
+        self.messages.put((kind, value))
+
+    def close(self):
+        pass
+
+
+class ReplayApp(SurveyApp):
+    """SurveyApp connected to a ReplayLink instead of the robot."""
+
+    def __init__(self, events, speed, **kwargs):
+        self.replay_events = events
+        self.replay_speed = speed
+        super().__init__(**kwargs)
+
+    def connect_bluetooth(self):
+        self.link = ReplayLink(self, self.replay_events, self.replay_speed)
+        self.link.start()
+        self.show_link_state(self.link.state)
+        self.poll_robot()
+
+
+class Replayer:
+    """Performs the recorded participant actions on a ReplayApp.
+
+    An action waits until the app shows the screen and trial it was recorded
+    on. It then waits the recorded think time divided by ``speed``, measured
+    from when that screen appeared or from the previous action.
+    """
+
+    POLL_MS = 5
+
+    def __init__(self, app, events, speed=1.0, stall_timeout=60):
+        self.app = app
+        self.speed = speed
+        self.stall_timeout = stall_timeout
+        self.actions = []  # (think time in seconds, ui event)
+        ready = 0.0
+        for event in events:
+            if event['kind'] == 'screen':
+                ready = max(ready, event['t'])
+            elif event['kind'] == 'ui':
+                self.actions.append((event['t'] - ready, event))
+                ready = event['t']
+        screens = [event['name'] for event in events if event['kind'] == 'screen']
+        self.final_screen = screens[-1] if screens else None
+        self.recorded_time = events[-1]['t'] if events else 0.0
+        self.next = 0
+        self.seen_changes = None
+        self.screen_time = None
+        self.action_time = 0.0
+        self.started = None
+        self.wall_time = None
+
+    def run(self):
+        self.started = time.perf_counter()
+        self.app.after(self.POLL_MS, self.poll)
+        self.app.mainloop()
+        return self.wall_time
+
+    def poll(self):
+        app = self.app
+        now = time.perf_counter()
+        if app.screen_changes != self.seen_changes:
+            self.seen_changes = app.screen_changes
+            self.screen_time = now
+        ready = max(self.screen_time, self.action_time)
+
+        if self.next == len(self.actions):
+            expected = self.final_screen
+            if app.current_screen == expected:
+                self.wall_time = now - self.started
+                app.on_closing()
+                return
+        else:
+            think, event = self.actions[self.next]
+            expected = event['screen']
+            if (app.current_screen == expected
+                    and [app.is_practice, app.current_index] == event['trial']):
+                if now >= ready + think / self.speed:
+                    self.perform(event)
+                    self.action_time = time.perf_counter()
+                    self.next += 1
+                expected = None  # Where it should be; only waiting out the think time
+        if expected is not None and now - ready > self.stall_timeout:
+            print(f"Replay stalled on screen {app.current_screen!r}, expected {expected!r}")
+            app.on_closing()
+            return
+        app.after(self.POLL_MS, self.poll)
+
+    def perform(self, event):
+        app = self.app
+        action = event['action']
+        if action == 'consent':
+            app.signature_entry.delete(0, 'end')
+            app.signature_entry.insert(0, event['signature'])
+            click(app, "CONTINUE")
+        elif action == 'select':
+            view = next(find_widgets(app, QuestionnaireView))
+            i = int(event['item'].rsplit('_', 1)[1]) - 1
+            view.variables[i].set(event['value'])
+            view.select(i)
+        elif action == 'submit':
+            next(find_widgets(app, QuestionnaireView)).submit()
+        elif action == 'submit_feedback':
+            app.feedback_text.insert("1.0", event['feedback'])
+            app.submit_feedback()
+        elif action in METHOD_ACTIONS:
+            getattr(app, action)()
+        else:
+            print(f"Skipping unknown action {action!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a session recorded with AnthroGUI.py --record.")
+    parser.add_argument('recording')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="time compression, e.g. 10 replays the session ten times faster")
+    parser.add_argument('--stall-timeout', type=float, default=60,
+                        help="give up after this many seconds without reaching the next recorded screen")
+    parser.add_argument('--keep-results', action='store_true',
+                        help="keep the results file written by the replay")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="write a Chrome trace-event timeline of the replay to FILE")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable(args.trace)
+
+    events = load_recording(args.recording)
+    header = next((event for event in events if event['kind'] == 'session'), None)
+    if header is None:
+        parser.error(f"{args.recording} has no session event")
+
+    session_id = f"replay_{header['session_id']}_{int(time.time())}"
+    store = SessionStore(":memory:")  # Keep replays out of pcb_survey.db
+    app = ReplayApp(events, args.speed, session_id=session_id, seed=None if header['bank'] else header['seed'],
+                    bank=header['bank'], store=store, defects=header.get('defects', 'uniform'))
+    replayer = Replayer(app, events, args.speed, args.stall_timeout)
+    wall_time = replayer.run()
+    store.close()
+
+    print(f"\nReplayed {replayer.next} of {len(replayer.actions)} actions from session {header['session_id']}")
+    if wall_time is not None:
+        print(f"Wall time {wall_time:.1f} s (recorded {replayer.recorded_time:.1f} s at {args.speed}x)")
+    latencies = {}
+    for name, ms in app.transition_times:
+        latencies.setdefault(name, []).append(ms)
+    print("Screen transition latency (ms)")
+    for name, values in sorted(latencies.items()):
+        print(f"  {name:18s} {summarize(values)}")
+
+    if not args.keep_results:
+        for suffix in ('', '_backup'):
+            path = f"pcb_survey_results_{session_id}{suffix}.csv"
+            if os.path.exists(path):
+                os.remove(path)
+    raise SystemExit(0 if wall_time is not None else 1)
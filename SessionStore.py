@@ -0,0 +1,194 @@
+import argparse
+import csv
+import glob
+import queue
+import sqlite3
+import threading
+import time
+
+from Tracing import tracer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    framing TEXT,
+    port TEXT,
+    signature TEXT,
+    consent_time TEXT,
+    feedback TEXT,
+    started TEXT,
+    finished TEXT,
+    seed TEXT,
+    stimulus_bank TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session_id TEXT NOT NULL,
+    trial_type TEXT NOT NULL,
+    trial_number INTEGER NOT NULL,
+    percentage INTEGER,
+    is_salient INTEGER,
+    response TEXT,
+    is_correct INTEGER,
+    zoom_used INTEGER,
+    timestamp TEXT,
+    PRIMARY KEY (session_id, trial_type, trial_number)
+);
+CREATE TABLE IF NOT EXISTS responses (
+    session_id TEXT NOT NULL,
+    instrument TEXT NOT NULL,
+    item TEXT NOT NULL,
+    value INTEGER,
+    PRIMARY KEY (session_id, item)
+);
+CREATE INDEX IF NOT EXISTS sessions_framing ON sessions (framing);
+CREATE INDEX IF NOT EXISTS trials_percentage ON trials (percentage, trial_type, is_correct);
+CREATE INDEX IF NOT EXISTS responses_item ON responses (instrument, item, value);
+"""
+
+SESSION_FIELDS = ('framing', 'port', 'signature', 'consent_time', 'feedback', 'started', 'finished', 'seed',
+                  'stimulus_bank')
+
+_STOP = object()
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=10)
+    db.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer, and the reverse
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    columns = [row[1] for row in db.execute("PRAGMA table_info(sessions)")]
+    for column in ('seed', 'stimulus_bank'):
+        if column not in columns:
+            db.execute(f"ALTER TABLE sessions ADD COLUMN {column} TEXT")  # Databases from before it was stored
+    return db
+
+
+def trial_row(trial):
+    """Column values for a trial dict as recorded by SurveyApp.record_response()."""
+    return (trial['session_id'], trial['trial_type'], int(trial['trial_number']), int(trial['percentage']),
+            str(trial['is_salient']) == 'True', trial['response'], str(trial['is_correct']) == 'True',
+            str(trial['zoom_used']) == 'True', trial['timestamp'])
+
+
+class SessionStore:
+    """SQLite database of sessions, trials and questionnaire responses.
+
+    The database is in WAL mode, so analysis can query it while sessions run.
+    One background thread owns the connection. Every call queues one batch,
+    for example a screen's worth of answers, which is written in a single
+    transaction. Nothing here blocks the GUI.
+    """
+
+    def __init__(self, path="pcb_survey.db"):
+        self.path = path
+        self.closed = False
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def start_session(self, session_id, **fields):
+        fields.setdefault('started', time.strftime('%Y-%m-%d %H:%M:%S'))
+        self._put([("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)", (session_id,))]
+                  + self._session_updates(session_id, fields))
+
+    def update_session(self, session_id, **fields):
+        """Set columns of the sessions table, e.g. signature or feedback."""
+        self._put(self._session_updates(session_id, fields))
+
+    def add_trial(self, trial):
+        self._put([("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", trial_row(trial))])
+
+    def add_responses(self, session_id, instrument, answers):
+        """Store one questionnaire screen's answers ({item key: value}) as one batch."""
+        self._put([("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (session_id, instrument, item, value)) for item, value in answers.items()])
+
+    def flush(self, timeout=5):
+        """Block until every queued batch is committed."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout=5):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.put(_STOP)
+        self._stopped.wait(timeout)
+
+    def _session_updates(self, session_id, fields):
+        unknown = set(fields) - set(SESSION_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown session fields: {sorted(unknown)}")
+        return [(f"UPDATE sessions SET {name} = ? WHERE session_id = ?", (value, session_id))
+                for name, value in fields.items()]
+
+    def _put(self, statements):
+        if not self.closed and statements:
+            self._queue.put(statements)
+
+    def _run(self):
+        db = connect(self.path)
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                db.close()
+                self._stopped.set()
+                return
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            try:
+                with tracer.span("store batch", statements=len(item)):
+                    with db:  # One transaction per batch
+                        for sql, params in item:
+                            db.execute(sql, params)
+            except sqlite3.Error as e:
+                print(f"Error saving to {self.path}: {e}")
+
+
+def import_csv(db, pattern):
+    """Load existing pcb_survey_results_*.csv files into the trials table."""
+    count = 0
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, newline='') as f:
+            rows = [trial_row(row) for row in csv.DictReader(f)]
+        with db:
+            db.executemany("INSERT OR IGNORE INTO sessions (session_id) VALUES (?)",
+                           {(row[0],) for row in rows})
+            db.executemany("INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        count += len(rows)
+    return count
+
+
+def report(db):
+    query = """
+        SELECT s.framing, t.percentage, COUNT(*), AVG(t.is_correct), AVG(t.zoom_used)
+        FROM trials t JOIN sessions s USING (session_id)
+        WHERE t.trial_type = 'Experimental'
+        GROUP BY s.framing, t.percentage
+        ORDER BY s.framing, t.percentage
+    """
+    start = time.perf_counter()
+    rows = db.execute(query).fetchall()
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"{'framing':10s} {'percent':>7s} {'trials':>7s} {'accuracy':>9s} {'zoom':>6s}")
+    for framing, percent, trials, accuracy, zoom in rows:
+        print(f"{str(framing):10s} {percent:7d} {trials:7d} {accuracy:9.3f} {zoom:6.3f}")
+    print(f"({elapsed:.1f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the SQLite session store.")
+    parser.add_argument('database', nargs='?', default="pcb_survey.db")
+    parser.add_argument('--import-csv', metavar='PATTERN',
+                        help="first load results CSVs, e.g. 'pcb_survey_results_*.csv'")
+    args = parser.parse_args()
+
+    db = connect(args.database)
+    if args.import_csv:
+        print(f"Imported {import_csv(db, args.import_csv)} trials")
+    report(db)
+    db.close()
@@ -0,0 +1,160 @@
+import argparse
+import tkinter as tk
+from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from AnthroGUI import SurveyApp
+from SessionStore import SessionStore
+from Tracing import tracer
+
+
+class Station:
+    """One booth: a robot port and the SurveyApp currently running on it."""
+
+    def __init__(self, name, port=None, emulate_robot=False):
+        self.name = name
+        self.port = port
+        self.emulate_robot = emulate_robot
+        self.app = None
+        self.sessions = 0
+
+    def is_open(self):
+        if self.app is None:
+            return False
+        try:
+            return bool(self.app.winfo_exists())
+        except tk.TclError:  # The window's interpreter is gone
+            return False
+
+
+class StationController(tk.Tk):
+    """Runs several stations in one process and shows their status.
+
+    Every SurveyApp is its own Tk window, and all of them are served by this
+    window's mainloop on the main thread. The stations share one worker pool:
+    each robot's serial reader holds a worker for as long as its session runs,
+    and the remaining workers prepare stimuli and write results for every
+    station.
+    """
+
+    REFRESH_MS = 500
+    COLUMNS = ('port', 'link', 'screen', 'trial', 'session')
+
+    def __init__(self, stations, time_scale=1.0, workers=None):
+        super().__init__()
+        self.title("PCB Robot Stations")
+        self.geometry("760x300")
+        self.stations = stations
+        self.time_scale = time_scale
+        self.executor = ThreadPoolExecutor(max_workers=workers or 2 * len(stations) + 2,
+                                           thread_name_prefix="station-pool")
+        self.store = SessionStore()  # One database for every station
+
+        self.table = ttk.Treeview(self, columns=self.COLUMNS, height=len(stations))
+        self.table.heading('#0', text="Station")
+        self.table.column('#0', width=100)
+        for column in self.COLUMNS:
+            self.table.heading(column, text=column.capitalize())
+            self.table.column(column, width=120)
+        for station in stations:
+            self.table.insert('', 'end', iid=station.name, text=station.name)
+        self.table.pack(fill='both', expand=True, padx=10, pady=10)
+        self.table.bind('<Double-1>', lambda event: self.show_station())
+
+        buttons = tk.Frame(self)
+        buttons.pack(pady=(0, 10))
+        tk.Button(buttons, text="New Session", command=self.new_session).pack(side='left', padx=5)
+        tk.Button(buttons, text="Show Window", command=self.show_station).pack(side='left', padx=5)
+        tk.Button(buttons, text="End Session", command=self.end_session).pack(side='left', padx=5)
+
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+        for station in stations:
+            self.start_session(station)
+        self.refresh()
+
+    def selected(self):
+        selection = self.table.selection()
+        return [station for station in self.stations if station.name in selection]
+
+    def start_session(self, station):
+        """Open a new SurveyApp on the station's robot."""
+        station.sessions += 1
+        session_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{station.name}"
+        station.app = SurveyApp(port=station.port, emulate_robot=station.emulate_robot,
+                                time_scale=self.time_scale, session_id=session_id,
+                                executor=self.executor, store=self.store)
+        station.app.title(f"PCB Robot Interface - {station.name}")
+        print(f"Station {station.name}: started session {session_id}")
+
+    def new_session(self):
+        """Close the selected stations' sessions and start fresh ones."""
+        for station in self.selected():
+            if station.is_open():
+                station.app.on_closing()
+            self.start_session(station)
+
+    def end_session(self):
+        for station in self.selected():
+            if station.is_open():
+                station.app.on_closing()
+
+    def show_station(self):
+        for station in self.selected():
+            if station.is_open():
+                station.app.deiconify()
+                station.app.lift()
+
+    def status(self, station):
+        """Column values for the station's row."""
+        if not station.is_open():
+            return (station.port or "emulator", "-", "closed", "-", "-")
+        app = station.app
+        block = "Practice" if app.is_practice else "Main"
+        trial = f"{block} {app.current_index + 1}/{len(app.current_trials)}"
+        link = app.link.state if app.link else "starting"  # Before finish_startup()
+        return (app.bluetooth_port, link, app.current_screen, trial, app.session_id)
+
+    def refresh(self):
+        for station in self.stations:
+            self.table.item(station.name, values=self.status(station))
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def on_closing(self):
+        for station in self.stations:
+            if station.is_open():
+                station.app.on_closing()
+        self.executor.shutdown(wait=False)
+        self.store.close()
+        self.destroy()
+
+
+def parse_station(text):
+    """'name=PORT' or just 'PORT' (the port is then used as the name)."""
+    name, _, port = text.rpartition('=')
+    return Station(name or port, port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several robot stations from one process.")
+    parser.add_argument('--station', action='append', default=[], metavar='NAME=PORT',
+                        help="a station and its robot's serial port; repeat for each booth")
+    parser.add_argument('--emulate', type=int, default=0, metavar='N',
+                        help="add N stations that run against RobotEmulator")
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help="speed-up factor for the emulated robots")
+    parser.add_argument('--workers', type=int,
+                        help="size of the shared worker pool (default: 2 per station + 2)")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="record a Chrome trace-event timeline of all stations to FILE")
+    args = parser.parse_args()
+    if args.trace:
+        tracer.enable(args.trace)
+
+    stations = [parse_station(text) for text in args.station]
+    stations += [Station(f"emu{n + 1}", emulate_robot=True) for n in range(args.emulate)]
+    if not stations:
+        parser.error("give at least one --station or --emulate")
+
+    controller = StationController(stations, args.time_scale, args.workers)
+    controller.mainloop()
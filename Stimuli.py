@@ -0,0 +1,245 @@
+import numpy
+
+# PCB palette used by the GUI
+BLUE = numpy.array([0, 112, 255], dtype=numpy.uint8)    # Undamaged board
+ORANGE = numpy.array([255, 140, 0], dtype=numpy.uint8)  # Damaged pixel
+GREEN = numpy.array([0, 255, 0], dtype=numpy.uint8)     # Border around the focus area
+
+# record_response() in AnthroGUI.py expects a Reject for boards damaged at least this much
+REJECT_PERCENT = 40
+
+# Shapes of focus area damage (see defect_costs); 'mixed' picks one per board
+DEFECT_STYLES = ('uniform', 'clustered', 'scratch', 'bridge')
+
+# (percent damaged, is_salient) for the practice block
+PRACTICE_TRIALS = [(25, False), (35, False), (45, False), (50, False), (55, False)]
+
+
+def experimental_trials(rng):
+    """
+    Plan the main block: 32 regular trials with distinct damage percentages
+    from 20 to 60, and a salient trial near each quarter of the block.
+    Returns a list of (percent, is_salient).
+    """
+    # Fixed erroneous trials with their target positions
+    error_trials = [
+        (25, True, int(rng.integers(6, 9))),    # Around 1/4 mark
+        (35, True, int(rng.integers(14, 17))),  # Around 2/4 mark
+        (45, True, int(rng.integers(22, 25))),  # Around 3/4 mark
+        (55, True, int(rng.integers(30, 33)))   # Around 4/4 mark
+    ]
+
+    possible_values = list(range(20, 61))
+    for error_val, _, _ in error_trials:
+        possible_values.remove(error_val)
+
+    trials = [(int(val), False) for val in rng.choice(possible_values, size=32, replace=False)]
+    for val, is_error, pos in error_trials:
+        trials.insert(pos, (val, is_error))
+    return trials
+
+
+def trial_rng(seed, position):
+    """
+    Generator for board `position` of a session seeded with `seed` (practice
+    boards first). It is the position-th child of SeedSequence(seed), so a
+    board does not depend on the order or batch in which boards are made.
+    """
+    return numpy.random.default_rng(numpy.random.SeedSequence(seed, spawn_key=(position,)))
+
+
+def choose_distinct(rng, population, k, n):
+    """
+    Pick `k` distinct integers from range(population) for each of `n` rows.
+    Returns an (n, k) array.
+    """
+    if k * 4 > population:
+        # Dense picks: rank random keys, cost grows with the population
+        keys = rng.random((n, population))
+        return numpy.argpartition(keys, k - 1, axis=1)[:, :k]
+
+    # Sparse picks: draw with replacement and only redraw the rare rows with a repeat
+    picks = rng.integers(0, population, size=(n, k))
+    picks.sort(axis=1)
+    repeated = (numpy.diff(picks, axis=1) == 0).any(axis=1)
+    for row in numpy.flatnonzero(repeated):
+        picks[row] = rng.choice(population, k, replace=False)
+    return picks
+
+
+def blank_boards(n, image_width, image_height):
+    """An (n, height, width, 3) array of undamaged boards."""
+    images = numpy.empty((n, image_height, image_width, 3), dtype=numpy.uint8)
+    # Copying whole painted rows is much faster than broadcasting a 3-byte colour
+    images.reshape(n, image_height * image_width * 3)[:] = numpy.tile(BLUE, image_width * image_height)
+    return images
+
+
+def damage_counts(damage, focus_pixels):
+    """
+    Damaged focus pixels for each damage fraction: the nearest count, moved
+    if needed so the exact fraction is on the same side of REJECT_PERCENT as
+    the requested one.
+    """
+    counts = numpy.rint(focus_pixels * damage).astype(int)
+    # Fewest pixels that reach the threshold, in integers so rounding cannot misplace it
+    reject_from = -(-focus_pixels * REJECT_PERCENT // 100)
+    reject = damage * 100 >= REJECT_PERCENT - 1e-9
+    counts = numpy.where(reject, numpy.maximum(counts, reject_from), numpy.minimum(counts, reject_from - 1))
+    return numpy.clip(counts, 0, focus_pixels)
+
+
+def defect_costs(style, n, focus_size, rng):
+    """
+    An (n, focus_size**2) array ranking each board's focus pixels: the
+    cheapest ones are damaged first. The style only shapes the ranking, so
+    any damage count can be met exactly:
+
+    * uniform: scattered pixels
+    * clustered: one to three round burn spots of different sizes
+    * scratch: one or two straight lines at any angle, widening with the damage
+    * bridge: one or two short bars along the rows or columns, like solder across traces
+    * mixed: one of the above per board
+    """
+    focus_pixels = focus_size * focus_size
+    if style == 'uniform':
+        return rng.random((n, focus_pixels))
+    if style == 'mixed':
+        styles = rng.integers(0, len(DEFECT_STYLES), size=n)
+        costs = numpy.empty((n, focus_pixels))
+        for i, name in enumerate(DEFECT_STYLES):
+            rows = numpy.flatnonzero(styles == i)
+            if len(rows):
+                costs[rows] = defect_costs(name, len(rows), focus_size, rng)
+        return costs
+
+    # Pixel centres in units of the focus size, broadcast against (n, defects, 1) shape parameters
+    y, x = numpy.divmod(numpy.arange(focus_pixels), focus_size)
+    y = (y + 0.5) / focus_size
+    x = (x + 0.5) / focus_size
+    if style == 'clustered':
+        defects, jitter = 3, 0.15
+        centres = rng.random((n, defects, 2))
+        radius = rng.uniform(0.5, 1.5, size=(n, defects, 1))
+        distance = numpy.hypot(y - centres[..., 0:1], x - centres[..., 1:2]) / radius
+    elif style == 'scratch':
+        defects, jitter = 2, 0.03
+        through = rng.random((n, defects, 2))
+        angle = rng.uniform(0, numpy.pi, size=(n, defects, 1))
+        distance = numpy.abs((x - through[..., 1:2]) * numpy.sin(angle)
+                             - (y - through[..., 0:1]) * numpy.cos(angle))
+    elif style == 'bridge':
+        defects, jitter = 2, 0.05
+        centres = rng.random((n, defects, 2))
+        across = numpy.abs(y - centres[..., 0:1])
+        along = numpy.abs(x - centres[..., 1:2]) / 4  # Four times as long as wide
+        vertical = rng.random((n, defects, 1)) < 0.5
+        across, along = numpy.where(vertical, along, across), numpy.where(vertical, across, along)
+        distance = numpy.maximum(across, along)
+    else:
+        raise ValueError(f"Unknown defect style {style!r}, expected one of {DEFECT_STYLES + ('mixed',)}")
+
+    # Each board has between one and `defects` of them
+    unused = numpy.arange(defects) >= rng.integers(1, defects + 1, size=(n, 1))
+    distance[unused] = numpy.inf
+    return distance.min(axis=1) + jitter * rng.random((n, focus_pixels))
+
+
+def damage_coordinates(damage_percents, image_width=200, image_height=400,
+                       focus_size=20, bg_damage_rate=0.001, rng=None, style='uniform'):
+    """
+    The damaged pixels of the boards generate_damage_patterns() would render,
+    without rendering them, so boards too large for memory can be painted
+    piecewise (see ImagePyramid.py).
+
+    Returns (boards, ys, xs, focus_positions, fractions): the board index, row
+    and column of every damaged pixel, an (N, 2) array of focus square
+    corners, and the exact fraction of each focus square that is damaged.
+    """
+    rng = numpy.random.default_rng() if rng is None else rng
+    damage = numpy.asarray(damage_percents, dtype=float).reshape(-1)
+    n = len(damage)
+    boards, ys, xs = [], [], []
+
+    # Background damage
+    total_pixels = image_width * image_height
+    bg_damage_count = int(total_pixels * bg_damage_rate)
+    if bg_damage_count > 0 and n > 0:
+        bg_positions = choose_distinct(rng, total_pixels, bg_damage_count, n).ravel()
+        boards.append(numpy.repeat(numpy.arange(n), bg_damage_count))
+        ys.append(bg_positions // image_width)
+        xs.append(bg_positions % image_width)
+
+    # Focus area damage
+    focus_y = rng.integers(0, image_height - focus_size + 1, size=n)
+    focus_x = rng.integers(0, image_width - focus_size + 1, size=n)
+
+    focus_pixels = focus_size * focus_size
+    damage_pixels = damage_counts(damage, focus_pixels)
+    if n > 0 and damage_pixels.max() > 0:
+        # Each board's focus pixels, cheapest first; the first `damage_pixels` are damaged
+        order = defect_costs(style, n, focus_size, rng).argsort(axis=1)
+        focus_boards, rank = numpy.nonzero(numpy.arange(focus_pixels) < damage_pixels[:, None])
+        positions = order[focus_boards, rank]
+        boards.append(focus_boards)
+        ys.append(focus_y[focus_boards] + positions // focus_size)
+        xs.append(focus_x[focus_boards] + positions % focus_size)
+
+    if not boards:
+        empty = numpy.zeros(0, dtype=int)
+        boards, ys, xs = [empty], [empty], [empty]
+    return (numpy.concatenate(boards), numpy.concatenate(ys), numpy.concatenate(xs),
+            numpy.stack([focus_y, focus_x], axis=1), damage_pixels / focus_pixels)
+
+
+def generate_defect_batch(damage_percents, image_width=200, image_height=400,
+                          focus_size=20, bg_damage_rate=0.001, rng=None, style='mixed'):
+    """
+    Render one board per entry of `damage_percents` (fractions from 0 to 1)
+    with `style` defects in the focus square (see defect_costs).
+
+    Returns (images, focus_positions, fractions): an (N, height, width, 3)
+    uint8 array, an (N, 2) array of the (y, x) top-left corner of each focus
+    square, and the exact fraction of each focus square that is damaged.
+    """
+    boards, ys, xs, focus_positions, fractions = damage_coordinates(
+        damage_percents, image_width, image_height, focus_size, bg_damage_rate, rng, style)
+    images = blank_boards(len(focus_positions), image_width, image_height)
+    images[boards, ys, xs] = ORANGE
+    return images, focus_positions, fractions
+
+
+def generate_damage_patterns(damage_percents, image_width=200, image_height=400,
+                             focus_size=20, bg_damage_rate=0.001, rng=None, style='uniform'):
+    """
+    Render one damaged board per entry of `damage_percents` (fractions from 0
+    to 1, e.g. `[p / 100 for p, _ in trials]` for a whole trial list).
+
+    Each board gets `bg_damage_rate` of its pixels damaged at random, plus a
+    `focus_size` square at a random position in which the damage_counts()
+    number of pixels are damaged, in the shape given by `style`.
+
+    Returns (images, focus_positions): an (N, height, width, 3) uint8 array and
+    an (N, 2) array of the (y, x) top-left corner of each focus square.
+    """
+    images, focus_positions, _ = generate_defect_batch(
+        damage_percents, image_width, image_height, focus_size, bg_damage_rate, rng, style)
+    return images, focus_positions
+
+
+def add_border(image, focus_pos, focus_size):
+    """Return a copy of `image` with a green border around the focus area."""
+    y, x = focus_pos
+    image_height, image_width = image.shape[:2]
+    bordered = image.copy()
+
+    if y > 0:
+        bordered[y-1:y+1, x:x+focus_size] = GREEN
+    if y + focus_size < image_height:
+        bordered[y+focus_size-1:y+focus_size+1, x:x+focus_size] = GREEN
+    if x > 0:
+        bordered[y:y+focus_size, x-1:x+1] = GREEN
+    if x + focus_size < image_width:
+        bordered[y:y+focus_size, x+focus_size-1:x+focus_size+1] = GREEN
+
+    return bordered
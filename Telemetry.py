@@ -0,0 +1,101 @@
+import os
+import time
+
+import numpy
+
+# One binary sample from sendTelemetry() in AnthroFraming_09-04-24.ino
+SAMPLE_START = 0xA5
+SAMPLE_SIZE = 7
+
+SAMPLE_DTYPE = numpy.dtype([
+    ('host_time', '<f8'),  # time.perf_counter() when the sample arrived
+    ('robot_ms', '<i8'),   # Robot millis(), unwrapped from the 16 bits sent
+    ('left', 'u1'),        # Line sensors, 1 = on the line
+    ('right', 'u1'),
+    ('left_motor', 'i1'),  # Last wheel commands, clamped to +-127
+    ('right_motor', 'i1'),
+])
+
+
+class TelemetryBuffer:
+    """Fixed-size ring of telemetry samples, preallocated once.
+
+    The robot link thread is the only writer. Readers take a copy with
+    ``since(mark)`` using a ``mark`` from ``count``; there is no lock, so the
+    GUI never waits on the link. A reader that falls more than ``capacity``
+    samples behind only gets the newest ``capacity`` samples.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.capacity = capacity
+        self.samples = numpy.zeros(capacity, dtype=SAMPLE_DTYPE)
+        self.count = 0  # Samples written so far; the next one goes to count % capacity
+        self.rejected = 0  # Samples with a bad checksum
+        self._last_ms = None
+
+    def add(self, packet):
+        """Store one 7-byte sample. Returns False if its checksum is wrong."""
+        if sum(packet[1:6]) & 0xFF != packet[6]:
+            self.rejected += 1
+            return False
+        ms16 = packet[1] | packet[2] << 8
+        if self._last_ms is None:
+            robot_ms = ms16
+        else:
+            robot_ms = self._last_ms + ((ms16 - self._last_ms) & 0xFFFF)
+        self._last_ms = robot_ms
+        sample = self.samples[self.count % self.capacity]
+        sample['host_time'] = time.perf_counter()
+        sample['robot_ms'] = robot_ms
+        sample['left'] = packet[3] & 1
+        sample['right'] = packet[3] >> 1 & 1
+        sample['left_motor'] = packet[4] - 256 if packet[4] > 127 else packet[4]
+        sample['right_motor'] = packet[5] - 256 if packet[5] > 127 else packet[5]
+        self.count += 1  # Only now is the sample visible to readers
+        return True
+
+    def since(self, mark):
+        """Copy of the samples written after ``count`` was ``mark``, oldest first."""
+        end = self.count
+        start = max(mark, end - self.capacity)
+        if start >= end:
+            return self.samples[:0].copy()
+        first, last = start % self.capacity, end % self.capacity
+        if first < last:
+            return self.samples[first:last].copy()
+        return numpy.concatenate([self.samples[first:], self.samples[:last]])
+
+
+def split_stream(buffer):
+    """
+    Split bytes from the robot into text lines and telemetry samples.
+    Returns (lines, packets, rest), where `rest` is an incomplete tail to
+    keep for the next read.
+    """
+    lines, packets = [], []
+    start = 0
+    while start < len(buffer):
+        if buffer[start] == SAMPLE_START:
+            if len(buffer) - start < SAMPLE_SIZE:
+                break
+            packets.append(buffer[start:start + SAMPLE_SIZE])
+            start += SAMPLE_SIZE
+            continue
+        end = buffer.find(b'\n', start)
+        sample = buffer.find(bytes([SAMPLE_START]), start)
+        if sample != -1 and (end == -1 or sample < end):
+            # A sample cut into a line means the line was corrupted; keep what came before
+            lines.append(buffer[start:sample])
+            start = sample
+            continue
+        if end == -1:
+            break
+        lines.append(buffer[start:end + 1])
+        start = end + 1
+    return lines, packets, buffer[start:]
+
+
+def save_samples(path, samples):
+    """Write one trial's samples as a .npy file (run off the Tk thread)."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    numpy.save(path, samples)
@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, time.perf_counter(), **self.args)
+        return False
+
+
+class Tracer:
+    """Collects timing spans and exports them as Chrome trace events.
+
+    Open the exported file in chrome://tracing or https://ui.perfetto.dev to
+    see a whole session as a timeline. Timestamps come from the monotonic
+    time.perf_counter() clock. While disabled, span() returns a shared no-op
+    context manager and the other methods return immediately.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.events = []
+        self._origin = time.perf_counter()
+        self._named_threads = set()
+
+    def enable(self, path=None):
+        self.enabled = True
+        self.path = path
+
+    def _us(self, t):
+        return (t - self._origin) * 1e6
+
+    def _add(self, event):
+        # list.append is atomic, so worker threads can record without a lock
+        tid = threading.get_ident()
+        if tid not in self._named_threads:
+            self._named_threads.add(tid)
+            self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                                'args': {'name': threading.current_thread().name}})
+        event['pid'] = os.getpid()
+        event['tid'] = tid
+        self.events.append(event)
+
+    def span(self, name, **args):
+        """Context manager that records how long its body takes."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def complete(self, name, start, end, **args):
+        """Record a span measured elsewhere, from perf_counter() values."""
+        if self.enabled:
+            self._add({'name': name, 'ph': 'X', 'ts': self._us(start),
+                       'dur': (end - start) * 1e6, 'args': args})
+
+    def begin(self, name, span_id, **args):
+        """Start a span that ends in another callback (e.g. a robot round-trip)."""
+        if self.enabled:
+            self._add({'name': name, 'cat': 'async', 'ph': 'b', 'id': span_id,
+                       'ts': self._us(time.perf_counter()), 'args': args})
+
+    def end(self, name, span_id, **args):
+        if self.enabled:
+            self._add({'name': name, 'cat': 'async', 'ph': 'e', 'id': span_id,
+                       'ts': self._us(time.perf_counter()), 'args': args})
+
+    def instant(self, name, **args):
+        if self.enabled:
+            self._add({'name': name, 'ph': 'i', 's': 't',
+                       'ts': self._us(time.perf_counter()), 'args': args})
+
+    def export(self, path=None):
+        path = path or self.path
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': list(self.events), 'displayTimeUnit': 'ms'}, f)
+        print(f"Trace written to {path}")
+
+
+# Shared by the GUI, the robot link, the prefetch worker and the results journal
+tracer = Tracer()